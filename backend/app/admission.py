@@ -0,0 +1,135 @@
+import asyncio
+import json
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+class Overloaded(Exception):
+    """Raised when a bounded resource is saturated and the caller should get a fast 503."""
+
+    def __init__(self, name: str, retry_after_s: float = 1.0):
+        super().__init__(f"{name} is overloaded, retry shortly")
+        self.name = name
+        self.retry_after_s = retry_after_s
+
+
+class ConcurrencyLimiter:
+    """
+    Caps concurrent calls into a slow dependency from sync (threadpool) code.
+    Callers wait at most `max_wait_s` for a slot and are rejected with Overloaded
+    after that, instead of queueing behind a stalled upstream.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_wait_s: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_wait_s = max_wait_s
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        if not self._semaphore.acquire(timeout=self.max_wait_s):
+            with self._lock:
+                self.rejected += 1
+            raise Overloaded(self.name)
+        with self._lock:
+            self.in_flight += 1
+            self.admitted += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self.in_flight,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+class _RouteBudget:
+    def __init__(self, prefix: str, max_concurrent: int):
+        self.prefix = prefix
+        self.max_concurrent = max_concurrent
+        self.semaphore: asyncio.Semaphore | None = None
+        self.in_flight = 0
+        self.rejected = 0
+
+
+class RouteBudgetMiddleware:
+    """
+    ASGI middleware giving each path prefix its own concurrency budget.
+
+    Admission happens on the event loop before a request reaches the threadpool, so
+    requests beyond a route's budget never occupy a worker thread: they wait up to
+    `max_wait_s` and then get a 503 with Retry-After. Slow upstream-bound routes can
+    therefore only ever hold their own share of the 40 threadpool threads.
+    """
+
+    def __init__(self, app, budgets: dict[str, int], max_wait_s: float):
+        self.app = app
+        self.max_wait_s = max_wait_s
+        # Longest prefix first so specific budgets win over general ones
+        self.budgets = [_RouteBudget(prefix, limit) for prefix, limit in sorted(budgets.items(), key=lambda x: -len(x[0]))]
+        route_budgets[:] = self.budgets
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        budget = next((b for b in self.budgets if scope["path"].startswith(b.prefix)), None)
+        if budget is None:
+            await self.app(scope, receive, send)
+            return
+
+        if budget.semaphore is None:
+            budget.semaphore = asyncio.Semaphore(budget.max_concurrent)
+        try:
+            await asyncio.wait_for(budget.semaphore.acquire(), timeout=self.max_wait_s)
+        except asyncio.TimeoutError:
+            budget.rejected += 1
+            await _send_overloaded(send, f"Route budget for {budget.prefix} exhausted", 1)
+            return
+
+        budget.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            budget.in_flight -= 1
+            budget.semaphore.release()
+
+
+async def _send_overloaded(send, detail: str, retry_after_s: int) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(retry_after_s).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+route_budgets: list[_RouteBudget] = []
+
+
+def admission_stats(limiters: list[ConcurrencyLimiter]) -> dict:
+    return {
+        "limiters": [limiter.stats() for limiter in limiters],
+        "routes": [
+            {"prefix": b.prefix, "max_concurrent": b.max_concurrent, "in_flight": b.in_flight, "rejected": b.rejected}
+            for b in route_budgets
+        ],
+    }
@@ -0,0 +1,66 @@
+"""
+The crud functions for AsyncSession, used by the async routes. Statements, caches and
+sharding behave as in app.crud, whose public builders both modules execute.
+"""
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .crud import (
+    UNCHANGED,
+    apply_profile_update,
+    cached_history,
+    history_queries,
+    merge_history,
+    profile_query,
+    sort_sync_states,
+    today_start,
+    today_total_query,
+)
+from .hotcache import hot_cache
+from .tracing import traced
+
+
+@traced
+async def get_profile(db: AsyncSession) -> models.UserProfile | None:
+    return (await db.execute(profile_query())).scalars().first()
+
+
+@traced
+async def upsert_profile(
+    db: AsyncSession, weight_kg: int, age: int | None, activity_level: str | None, device_id=UNCHANGED
+) -> models.UserProfile:
+    profile = apply_profile_update(await get_profile(db), weight_kg, age, activity_level, device_id)
+    db.add(profile)
+    await db.commit()
+    await db.refresh(profile)
+    return profile
+
+
+@traced
+async def get_today_total_ml(db: AsyncSession, user_id: int | None = None) -> int:
+    start = today_start()
+    cached = hot_cache.total_since(user_id, start)
+    if cached is not None:
+        return cached
+    # One row per shard queried
+    return int(sum(total or 0 for total in (await db.execute(today_total_query(start, user_id))).scalars()))
+
+
+@traced
+async def get_history(
+    db: AsyncSession, limit: int = 500, user_id: int | None = None
+) -> list[models.IntakeLog | models.IntakeDailySummary]:
+    cached = cached_history(limit, user_id)
+    if cached is not None:
+        return cached
+    query, summary_query = history_queries(limit, user_id)
+    rows = (await db.execute(query)).scalars().all()
+    if len(rows) < limit:
+        rows = [*rows, *(await db.execute(summary_query)).scalars().all()]
+    return merge_history(rows, limit)
+
+
+@traced
+async def get_sync_states(db: AsyncSession) -> list[models.DeviceSyncState]:
+    return sort_sync_states((await db.execute(select(models.DeviceSyncState))).scalars().all())
@@ -0,0 +1,96 @@
+import threading
+import time
+
+from .admission import Overloaded
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Overloaded):
+    """Raised when a call is short-circuited and there is nothing to fall back to."""
+
+    def __init__(self, name: str, retry_after_s: float):
+        super().__init__(name, retry_after_s)
+        self.args = (f"{name} is unavailable (circuit open)",)
+
+
+class CircuitBreaker:
+    """
+    Classic three-state breaker.
+
+    closed     calls pass; `failure_threshold` consecutive failures open the circuit
+    open       calls are refused for `recovery_timeout_s`
+    half_open  up to `half_open_max_calls` trial calls pass; a success closes the
+               circuit, a failure re-opens it for another recovery period
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout_s: float = 30.0, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout_s = recovery_timeout_s
+        self.half_open_max_calls = half_open_max_calls
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_calls = 0
+        self.short_circuited = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def retry_after_s(self) -> float:
+        with self._lock:
+            return max(0.0, self._opened_at + self.recovery_timeout_s - time.monotonic())
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now. Must be followed by record_success, record_failure or release."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._trial_calls < self.half_open_max_calls:
+                self._trial_calls += 1
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_calls = 0
+
+    def release(self) -> None:
+        """End an admitted call that has no upstream result (e.g. it never got a connection slot)."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._trial_calls > 0:
+                self._trial_calls -= 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            state = self._current_state()
+            self._failures += 1
+            if state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._trial_calls = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "state": self._current_state(),
+                "consecutive_failures": self._failures,
+                "short_circuited": self.short_circuited,
+            }
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout_s:
+            self._state = HALF_OPEN
+            self._trial_calls = 0
+        return self._state
@@ -0,0 +1,124 @@
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="HYDRATION_", env_file=".env", extra="ignore")
+
+    # Firebase upstream and admission control
+    firebase_url: str = "https://hydro-b2c6c-default-rtdb.firebaseio.com"
+    firebase_timeout_s: float = 10.0
+    firebase_max_concurrency: int = 8
+    firebase_queue_wait_s: float = 0.25
+    firebase_breaker_failure_threshold: int = 5
+    firebase_breaker_recovery_s: float = 30.0
+    firebase_breaker_half_open_calls: int = 1
+    # Max concurrent in-flight requests per path prefix; excess requests get a fast 503
+    route_budgets: dict[str, int] = {"/api/firebase/": 16, "/api/ingest/": 16, "/api/hydration/export": 4}
+    route_budget_wait_s: float = 0.5
+
+    # Server processes sharing this database (set by serve.py). With more than one,
+    # per-process caches fed by commit events can't see other processes' writes, so
+    # they are refreshed from SQLite instead, and one elected process runs the jobs.
+    worker_processes: int = 1
+    leader_poll_s: float = 5.0
+    fleet_refresh_s: float = 5.0
+
+    # Request tracing: span trees of requests slower than slow_request_ms go to a rotating JSON-lines file
+    tracing_enabled: bool = True
+    slow_request_ms: float = 1000.0
+    slow_request_log: str = "slow_requests.log"
+    slow_request_log_max_bytes: int = 5_000_000
+    slow_request_log_backups: int = 3
+
+    # SQL statistics per statement fingerprint: statements slower than sql_explain_ms get their
+    # EXPLAIN QUERY PLAN captured, and fingerprints run sql_repeat_threshold times in one request
+    # are flagged as N+1 candidates
+    sql_stats_enabled: bool = True
+    sql_explain_ms: float = 50.0
+    sql_explain_ttl_s: float = 300.0
+    sql_repeat_threshold: int = 20
+    sql_max_fingerprints: int = 1000
+
+    # aiosqlite pool behind the async routes, per engine (hydration.db and each intake shard).
+    # SQLite still takes one writer at a time; the pool bounds concurrent readers per worker
+    async_db_pool_size: int = 8
+    async_db_max_overflow: int = 8
+    async_db_pool_timeout_s: float = 10.0
+
+    # Response compression (br when the brotli package is installed, else gzip)
+    compression_enabled: bool = True
+    compression_minimum_size: int = 1024
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 4
+
+    # Intake storage: with more than one shard, intake and device state are spread over
+    # hydration.shard<k>.db files by user so device writes don't queue on one lock.
+    # Changing it on an existing database needs `python reshard.py --shards N` first.
+    intake_shards: int = 1
+
+    # Retention / compaction of intake_logs
+    retention_enabled: bool = True
+    retention_days: int = 90
+    retention_chunk_size: int = 2000
+    retention_chunk_pause_s: float = 0.05
+    retention_interval_s: float = 3600.0
+    retention_vacuum_pages: int = 256
+
+    # Firebase -> SQLite mirror of registered devices
+    sync_enabled: bool = True
+    sync_interval_s: float = 5.0
+
+    # Backend -> Firebase forwarding of readings posted to /api/ingest/{device_id}/readings
+    firebase_write_enabled: bool = True
+    firebase_write_interval_s: float = 2.0
+    firebase_write_max_paths: int = 500
+
+    # Device snapshots shared by all worker processes through a memory-mapped file next to
+    # hydration.db: the elected process refreshes every registered device from Firebase and
+    # the device routes read it, calling Firebase themselves only for older or unknown devices
+    device_snapshots_enabled: bool = True
+    device_snapshot_refresh_s: float = 2.0
+    device_snapshot_refresh_concurrency: int = 4
+    device_snapshot_max_age_s: float = 10.0
+    device_snapshot_capacity: int = 4096
+
+    # Device heartbeats: last-seen per device, kept in memory and flushed to device_status
+    device_online_timeout_s: float = 60.0
+    device_offline_timeout_s: float = 600.0
+    heartbeat_flush_interval_s: float = 15.0
+
+    # End-of-day intake forecasting
+    forecast_enabled: bool = True
+    forecast_window_days: int = 28
+    forecast_min_history_days: int = 3
+    # Every process rebuilds its profiles daily at this UTC hour, checked every poll interval
+    forecast_rebuild_hour_utc: int = 3
+    forecast_rebuild_poll_s: float = 300.0
+
+    # "You're behind" reminders, checked in the elected process against each user's
+    # expected-by-now curve. Sink: "log", "file" (JSON lines in reminder_file) or "webhook"
+    reminders_enabled: bool = True
+    reminder_sink: str = "log"
+    reminder_file: str = "reminders.jsonl"
+    reminder_webhook_url: str = ""
+    reminder_webhook_timeout_s: float = 5.0
+    reminder_deficit_ml: int = 250
+    reminder_cooldown_s: float = 7200.0
+    reminder_max_check_interval_s: float = 3600.0
+    reminder_tick_s: float = 30.0
+    reminder_batch_size: int = 500
+    reminder_users_refresh_s: float = 300.0
+
+    # Weekly/monthly reports computed in a process pool
+    reports_enabled: bool = True
+    report_workers: int = 2
+    report_schedule_interval_s: float = 3600.0
+
+    # In-memory ring buffers of recent intake (20 bytes per slot)
+    hot_cache_window_hours: int = 24
+    # At least the history limit (500): smaller user rings never hold enough rows to serve a user's history
+    hot_cache_user_capacity: int = 512
+    hot_cache_global_capacity: int = 65536
+
+
+settings = Settings()
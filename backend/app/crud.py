@@ -1,59 +1,172 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import select, desc, func
-from datetime import datetime, timezone, date
+from sqlalchemy import Select, select, desc, func
+from datetime import datetime, timezone
 from . import models
+from .database import shard_token
+from .hotcache import hot_cache
+from .tracing import traced
 
+# The statement builders and helpers without a `db` argument are shared with app.async_crud
+UNCHANGED = object()
 
+
+def profile_query() -> Select:
+    return select(models.UserProfile).limit(1)
+
+
+@traced
 def get_profile(db: Session) -> models.UserProfile | None:
-    result = db.execute(select(models.UserProfile).limit(1)).scalars().first()
+    result = db.execute(profile_query()).scalars().first()
     return result
 
 
-def upsert_profile(db: Session, weight_kg: int, age: int | None, activity_level: str | None) -> models.UserProfile:
-    profile = get_profile(db)
+def apply_profile_update(
+    profile: models.UserProfile | None, weight_kg: int, age: int | None, activity_level: str | None, device_id=UNCHANGED
+) -> models.UserProfile:
+    """Update `profile`, or build the first one when there is none yet; the caller adds and commits it."""
     if profile is None:
         profile = models.UserProfile(weight_kg=weight_kg, age=age, activity_level=activity_level)
-        db.add(profile)
     else:
         profile.weight_kg = weight_kg
         profile.age = age
         profile.activity_level = activity_level
+    if device_id is not UNCHANGED:
+        profile.device_id = device_id
+    return profile
+
+
+@traced
+def upsert_profile(
+    db: Session, weight_kg: int, age: int | None, activity_level: str | None, device_id=UNCHANGED
+) -> models.UserProfile:
+    profile = apply_profile_update(get_profile(db), weight_kg, age, activity_level, device_id)
+    db.add(profile)
     db.commit()
     db.refresh(profile)
     return profile
 
 
-def add_intake(db: Session, intake_ml: int) -> models.IntakeLog:
-    entry = models.IntakeLog(intake_ml=intake_ml)
+@traced
+def get_registered_devices(db: Session) -> list[models.UserProfile]:
+    return list(db.execute(select(models.UserProfile).where(models.UserProfile.device_id.is_not(None))).scalars().all())
+
+
+@traced
+def add_intake(
+    db: Session, intake_ml: int, user_id: int | None = None, timestamp: datetime | None = None
+) -> models.IntakeLog:
+    entry = models.IntakeLog(intake_ml=intake_ml, user_id=user_id)
+    if timestamp is not None:
+        entry.timestamp = timestamp
     db.add(entry)
     db.commit()
     db.refresh(entry)
     return entry
 
 
-def get_today_total_ml(db: Session) -> int:
+@traced
+def get_today_total_ml(db: Session, user_id: int | None = None) -> int:
     # Total is max cumulative intake observed today if using cumulative values,
     # or sum of deltas if logging per sip. Here we mock with sum of per-entry values.
-    today = date.today()
-    start = datetime(today.year, today.month, today.day, tzinfo=timezone.utc)
-    total = db.execute(
-        select(func.coalesce(func.sum(models.IntakeLog.intake_ml), 0)).where(models.IntakeLog.timestamp >= start)
-    ).scalar_one()
-    return int(total or 0)
+    start = today_start()
+    cached = hot_cache.total_since(user_id, start)
+    if cached is not None:
+        return cached
+    # One row per shard queried
+    return int(sum(total or 0 for total in db.execute(today_total_query(start, user_id)).scalars()))
+
+
+def today_start() -> datetime:
+    """Start of the current UTC day, the day boundary compaction, reports and reminders use too."""
+    today = datetime.now(timezone.utc).date()
+    return datetime(today.year, today.month, today.day, tzinfo=timezone.utc)
+
+
+def today_total_query(start: datetime, user_id: int | None) -> Select:
+    query = select(func.coalesce(func.sum(models.IntakeLog.intake_ml), 0)).where(models.IntakeLog.timestamp >= start)
+    if user_id is not None:
+        query = query.where(models.IntakeLog.user_id == user_id)
+    return query
+
+
+@traced
+def get_today_totals(db: Session, user_ids: list[int]) -> dict[int, int]:
+    """Today's (UTC) intake of many users in one grouped query; users with none are left out."""
+    rows = db.execute(_today_totals_query(user_ids)).all()
+    # Each user's rows live in one shard, so per-shard groups never overlap
+    return {user_id: int(total) for user_id, total in rows}
 
 
-def get_history(db: Session) -> list[models.IntakeLog]:
-    rows = db.execute(select(models.IntakeLog).order_by(desc(models.IntakeLog.timestamp)).limit(500)).scalars().all()
+def _today_totals_query(user_ids: list[int]) -> Select:
+    return (
+        select(models.IntakeLog.user_id, func.sum(models.IntakeLog.intake_ml))
+        .where(models.IntakeLog.timestamp >= today_start(), models.IntakeLog.user_id.in_(user_ids))
+        .group_by(models.IntakeLog.user_id)
+    )
+
+
+@traced
+def get_history(
+    db: Session, limit: int = 500, user_id: int | None = None
+) -> list[models.IntakeLog | models.IntakeDailySummary]:
+    # Raw rows older than the retention window are rolled up into daily summaries,
+    # so the newest `limit` points may come from either table.
+    cached = cached_history(limit, user_id)
+    if cached is not None:
+        return cached
+    query, summary_query = history_queries(limit, user_id)
+    rows = db.execute(query).scalars().all()
+    if len(rows) < limit:
+        rows = [*rows, *db.execute(summary_query).scalars().all()]
+    return merge_history(rows, limit)
+
+
+def cached_history(limit: int, user_id: int | None) -> list[models.IntakeLog] | None:
+    cached = hot_cache.newest(user_id, limit)
+    if cached is None:
+        return None
+    return [
+        models.IntakeLog(id=entry_id, timestamp=timestamp, intake_ml=intake_ml) for entry_id, timestamp, intake_ml in cached
+    ]
+
+
+def history_queries(limit: int, user_id: int | None) -> tuple[Select, Select]:
+    """Newest raw rows, and the newest daily summaries to fill up with when there are fewer than `limit`."""
+    query = select(models.IntakeLog).order_by(desc(models.IntakeLog.timestamp)).limit(limit)
+    summary_query = select(models.IntakeDailySummary).order_by(desc(models.IntakeDailySummary.day)).limit(limit)
+    if user_id is not None:
+        query = query.where(models.IntakeLog.user_id == user_id)
+        summary_query = summary_query.where(models.IntakeDailySummary.user_id == user_id)
+    return query, summary_query
+
+
+def merge_history(rows, limit: int) -> list[models.IntakeLog | models.IntakeDailySummary]:
+    # Across intake shards each shard returns its own newest `limit` rows
+    rows = sorted(rows, key=_history_sort_key, reverse=True)[:limit]
     return list(reversed(rows))
 
 
-def get_device_status(db: Session) -> models.DeviceStatus:
-    status = db.execute(select(models.DeviceStatus).limit(1)).scalars().first()
-    if status is None:
-        status = models.DeviceStatus(connected=False)
-        db.add(status)
-        db.commit()
-        db.refresh(status)
-    return status
+def _history_sort_key(entry: models.IntakeLog | models.IntakeDailySummary) -> datetime:
+    ts = entry.timestamp
+    return ts if ts.tzinfo is not None else ts.replace(tzinfo=timezone.utc)
+
+
+@traced
+def get_sync_state(db: Session, device_id: str, user_id: int | None = None) -> models.DeviceSyncState | None:
+    # The checkpoint lives in the intake shard of the device's user
+    return db.get(models.DeviceSyncState, device_id, identity_token=shard_token(user_id))
+
+
+@traced
+def get_sync_states(db: Session) -> list[models.DeviceSyncState]:
+    return sort_sync_states(db.execute(select(models.DeviceSyncState)).scalars().all())
+
+
+def sort_sync_states(states) -> list[models.DeviceSyncState]:
+    # Sorted here rather than in SQL: with several intake shards the rows come back per shard
+    return sorted(states, key=lambda state: state.device_id)
 
 
+@traced
+def get_profile_by_device(db: Session, device_id: str) -> models.UserProfile | None:
+    return db.execute(select(models.UserProfile).where(models.UserProfile.device_id == device_id)).scalars().first()
@@ -1,14 +1,192 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import create_engine, event, inspect, MetaData
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from .config import settings
+from .sharding import ID_RANGE_SPAN, MAIN, SHARDED_TABLES, MainDefaultShardedSession, ShardRouter, shard_path
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./hydration.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # auto_vacuum only takes effect on a fresh database file (before the first table
+    # is created); existing files need a one-off VACUUM to switch modes.
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    # WAL lets readers keep going while background jobs hold the write lock.
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+def create_sqlite_engine(url: str) -> Engine:
+    sqlite_engine = create_engine(url, connect_args={"check_same_thread": False})
+    event.listen(sqlite_engine, "connect", _set_sqlite_pragmas)
+    return sqlite_engine
+
+
+def create_async_sqlite_engine(url: str) -> AsyncEngine:
+    """aiosqlite engine on the same file as `url`, with its own pool (aiosqlite defaults to none)."""
+    async_engine = create_async_engine(
+        url.replace("sqlite://", "sqlite+aiosqlite://", 1),
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.async_db_pool_size,
+        max_overflow=settings.async_db_max_overflow,
+        pool_timeout=settings.async_db_pool_timeout_s,
+    )
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return async_engine
+
+
+engine = create_sqlite_engine(SQLALCHEMY_DATABASE_URL)
 Base = declarative_base()
 
+# With HYDRATION_INTAKE_SHARDS > 1, intake lives in hydration.shard<k>.db files next to
+# hydration.db, each with its own write lock; see sharding.ShardRouter for the rules.
+router = ShardRouter(settings.intake_shards) if settings.intake_shards > 1 else None
+if router is None:
+    intake_engines = [engine]
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+else:
+    intake_engines = [
+        create_sqlite_engine(f"sqlite:///{shard_path(engine.url.database, index)}") for index in range(router.shard_count)
+    ]
+    SessionLocal = sessionmaker(
+        class_=MainDefaultShardedSession,
+        autocommit=False,
+        autoflush=False,
+        shards={MAIN: engine, **dict(zip(router.shard_ids, intake_engines))},
+        shard_chooser=router.shard_chooser,
+        identity_chooser=router.identity_chooser,
+        execute_chooser=router.execute_chooser,
+    )
+
+# The async routes' engines: the same files, each connection running in its own aiosqlite
+# thread, so a request waiting on SQLite doesn't hold one of the threadpool's threads
+async_engine = create_async_sqlite_engine(SQLALCHEMY_DATABASE_URL)
+if router is None:
+    async_intake_engines = [async_engine]
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+else:
+    async_intake_engines = [
+        create_async_sqlite_engine(f"sqlite:///{shard_path(engine.url.database, index)}")
+        for index in range(router.shard_count)
+    ]
+    AsyncSessionLocal = async_sessionmaker(
+        sync_session_class=MainDefaultShardedSession,
+        autoflush=False,
+        expire_on_commit=False,
+        # ShardedSession binds sync engines; AsyncSession runs it over their async counterparts
+        shards={
+            MAIN: async_engine.sync_engine,
+            **{shard_id: bind.sync_engine for shard_id, bind in zip(router.shard_ids, async_intake_engines)},
+        },
+        shard_chooser=router.shard_chooser,
+        identity_chooser=router.identity_chooser,
+        execute_chooser=router.execute_chooser,
+    )
+async_engines = [async_engine] if router is None else [async_engine, *async_intake_engines]
+# Every engine by its sync face, for event listeners and pool resets after fork
+all_engines = [
+    *([engine] if router is None else [engine, *intake_engines]),
+    *(async_bind.sync_engine for async_bind in async_engines),
+]
+
+
+def shard_token(user_id: int | None) -> str | None:
+    """identity_token for Session.get() on a sharded table, so the lookup goes to one shard."""
+    return router.shard_for(user_id) if router is not None else None
+
+
+def shard_connection(db: Session, user_id: int | None) -> Connection:
+    """The session's connection to the intake shard of `user_id`, for Core bulk statements on sharded tables."""
+    return db.connection(bind_arguments={"shard_id": router.shard_for(user_id)} if router is not None else None)
+
+
+def intake_binds() -> list[dict]:
+    """bind_arguments that run a statement on each intake shard in turn (one empty dict when unsharded)."""
+    return [{}] if router is None else [{"shard_id": shard_id} for shard_id in router.shard_ids]
+
+
+def ensure_schema():
+    """
+    Create missing tables, then add columns and indexes that were introduced after
+    an existing hydration.db was first created (create_all never alters tables).
+    New columns must therefore be nullable or carry a server default.
+    """
+    if router is None:
+        create_tables(engine, Base.metadata.sorted_tables)
+    else:
+        create_tables(engine, [table for table in Base.metadata.sorted_tables if table.name not in SHARDED_TABLES])
+        for index, shard_engine in enumerate(intake_engines):
+            create_shard_schema(shard_engine, index)
+    _check_layout()
+
+
+def create_tables(bind: Engine, tables) -> None:
+    Base.metadata.create_all(bind=bind, tables=tables)
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=bind.dialect)
+                    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+
+def create_shard_schema(bind: Engine, index: int) -> None:
+    """Create the sharded tables in one shard file, with AUTOINCREMENT ids starting in the shard's own range."""
+    # Copy the whole schema so foreign keys to main-database tables still resolve in the DDL
+    metadata = MetaData()
+    for table in Base.metadata.sorted_tables:
+        shard_table = table.to_metadata(metadata)
+        if table.name in SHARDED_TABLES and _has_integer_id(table):
+            shard_table.dialect_kwargs["sqlite_autoincrement"] = True
+    metadata.create_all(bind=bind, tables=[metadata.tables[name] for name in SHARDED_TABLES])
+    create_tables(bind, [Base.metadata.tables[name] for name in SHARDED_TABLES])
+    with bind.begin() as conn:
+        reserve_id_ranges(conn, index, floor=0, replace=False)
+
+
+def reserve_id_ranges(conn: Connection, index: int, floor: int, replace: bool) -> None:
+    """Make the next AUTOINCREMENT id of every sharded table in this shard floor + index * ID_RANGE_SPAN + 1."""
+    seed = floor + index * ID_RANGE_SPAN
+    for table in Base.metadata.sorted_tables:
+        if table.name not in SHARDED_TABLES or not _has_integer_id(table):
+            continue
+        if replace:
+            conn.exec_driver_sql("DELETE FROM sqlite_sequence WHERE name = ?", (table.name,))
+        conn.exec_driver_sql(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)",
+            (table.name, seed, table.name),
+        )
+
+
+def _has_integer_id(table) -> bool:
+    return [column.name for column in table.primary_key.columns] == ["id"]
+
+
+def _check_layout() -> None:
+    """Refuse to run with a shard count other than the one the data was written with (see reshard.py)."""
+    with engine.begin() as conn:
+        recorded = conn.exec_driver_sql("SELECT intake_shards FROM storage_layout WHERE id = 1").scalar()
+        if recorded is None:
+            # Databases from before sharding hold their intake in hydration.db itself
+            tables = set(inspect(conn).get_table_names()) & SHARDED_TABLES
+            legacy = any(conn.exec_driver_sql(f"SELECT 1 FROM {name} LIMIT 1").first() for name in tables)
+            recorded = 1 if legacy else settings.intake_shards
+            conn.exec_driver_sql("INSERT OR IGNORE INTO storage_layout (id, intake_shards) VALUES (1, ?)", (recorded,))
+    if recorded != settings.intake_shards:
+        raise RuntimeError(
+            f"{engine.url.database} holds intake in {recorded} shard(s) but HYDRATION_INTAKE_SHARDS={settings.intake_shards}; "
+            f"stop the server and run: python reshard.py --shards {settings.intake_shards}"
+        )
+
 
 def get_db():
     db = SessionLocal()
@@ -18,3 +196,12 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def dispose_async_engines() -> None:
+    """Close the aiosqlite connections; their threads would otherwise keep the interpreter from exiting."""
+    for async_bind in async_engines:
+        await async_bind.dispose()
@@ -0,0 +1,83 @@
+import logging
+from datetime import datetime, timezone
+from typing import Callable
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from . import models
+from .timeutil import as_utc
+
+logger = logging.getLogger(__name__)
+
+IntakeListener = Callable[[int | None, datetime, int, int | None], None]
+ProfileListener = Callable[[int, int], None]
+
+_intake_listeners: list[IntakeListener] = []
+_profile_listeners: list[ProfileListener] = []
+
+
+def on_intake(listener: IntakeListener) -> IntakeListener:
+    """
+    Register `listener(user_id, timestamp, intake_ml, entry_id)` to be called for every
+    intake row once it has been committed. Timestamps are aware UTC. Usable as a decorator.
+    """
+    _intake_listeners.append(listener)
+    return listener
+
+
+def publish_intake(user_id: int | None, timestamp: datetime, intake_ml: int, entry_id: int | None = None) -> None:
+    """Notify listeners of committed intake; for writers that bypass the ORM (bulk Core inserts)."""
+    for listener in _intake_listeners:
+        try:
+            listener(user_id, timestamp, intake_ml, entry_id)
+        except Exception as e:
+            logger.error(f"Intake listener {listener!r} failed: {e}")
+
+
+def on_profile(listener: ProfileListener) -> ProfileListener:
+    """
+    Register `listener(user_id, weight_kg)` to be called whenever a profile is created
+    or updated, once committed. Usable as a decorator.
+    """
+    _profile_listeners.append(listener)
+    return listener
+
+
+def publish_profile(user_id: int, weight_kg: int) -> None:
+    for listener in _profile_listeners:
+        try:
+            listener(user_id, weight_kg)
+        except Exception as e:
+            logger.error(f"Profile listener {listener!r} failed: {e}")
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_new_intake(session: Session, flush_context) -> None:
+    pending = session.info.setdefault("new_intake", [])
+    for obj in session.new:
+        if isinstance(obj, models.IntakeLog):
+            # A server-defaulted timestamp is not loaded yet and must not be lazy-loaded
+            # mid-flush; CURRENT_TIMESTAMP is UTC "now" anyway.
+            timestamp = inspect(obj).dict.get("timestamp") or datetime.now(timezone.utc)
+            pending.append((obj.user_id, as_utc(timestamp), obj.intake_ml, obj.id))
+    profiles = session.info.setdefault("changed_profiles", {})
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, models.UserProfile):
+            profiles[obj.id] = obj.weight_kg
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_new_intake(session: Session) -> None:
+    pending = session.info.pop("new_intake", None)
+    for user_id, timestamp, intake_ml, entry_id in pending or ():
+        publish_intake(user_id, timestamp, intake_ml, entry_id)
+    profiles = session.info.pop("changed_profiles", None)
+    for user_id, weight_kg in (profiles or {}).items():
+        publish_profile(user_id, weight_kg)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_new_intake(session: Session, previous_transaction) -> None:
+    session.info.pop("new_intake", None)
+    session.info.pop("changed_profiles", None)
@@ -0,0 +1,112 @@
+import csv
+import heapq
+import io
+import json
+from datetime import datetime, timezone
+from typing import Iterator
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal, intake_binds
+from .timeutil import as_utc
+
+EXPORT_COLUMNS = ("kind", "id", "user_id", "timestamp", "intake_ml", "entry_count")
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def iter_intake_rows(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    user_id: int | None = None,
+    batch_size: int = 1000,
+) -> Iterator[tuple]:
+    """
+    Yield every intake point in [start, end) as plain tuples (see EXPORT_COLUMNS):
+    compacted daily summaries first (they are always the older data), then raw rows.
+    Rows are pulled `batch_size` at a time from a live cursor, so memory stays flat
+    no matter how many rows match. The generator owns its session because it outlives
+    the request handler.
+    """
+    # Stored timestamps carry no offset and are UTC: compare against UTC bounds, naive ones taken as UTC
+    start = as_utc(start) if start is not None else None
+    end = as_utc(end) if end is not None else None
+    summary, log = models.IntakeDailySummary, models.IntakeLog
+    summary_query = select(summary.id, summary.user_id, summary.day, summary.total_ml, summary.entry_count).order_by(summary.day, summary.id)
+    raw_query = select(log.id, log.user_id, log.timestamp, log.intake_ml).order_by(log.timestamp, log.id)
+    if start is not None:
+        summary_query = summary_query.where(summary.day >= start.date())
+        raw_query = raw_query.where(log.timestamp >= start)
+    if end is not None:
+        summary_query = summary_query.where(summary.day < end.date())
+        raw_query = raw_query.where(log.timestamp < end)
+    if user_id is not None:
+        summary_query = summary_query.where(summary.user_id == user_id)
+        raw_query = raw_query.where(log.user_id == user_id)
+
+    db = SessionLocal()
+    try:
+        summaries = _merged(db, summary_query.execution_options(yield_per=batch_size), key=lambda row: (row.day, row.id))
+        for row_id, row_user, day, total_ml, entry_count in summaries:
+            yield ("daily", row_id, row_user, datetime(day.year, day.month, day.day, tzinfo=timezone.utc), total_ml, entry_count)
+        raw = _merged(db, raw_query.execution_options(yield_per=batch_size), key=lambda row: (row.timestamp, row.id))
+        for row_id, row_user, timestamp, intake_ml in raw:
+            yield ("raw", row_id, row_user, timestamp, intake_ml, 1)
+    finally:
+        db.close()
+
+
+def _merged(db: Session, query, key) -> Iterator:
+    """Run an ordered query on every intake shard and stream the union in the same order."""
+    streams = [db.execute(query, bind_arguments=bind) for bind in intake_binds()]
+    return streams[0] if len(streams) == 1 else heapq.merge(*streams, key=key)
+
+
+def _isoformat(timestamp: datetime) -> str:
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.isoformat().replace("+00:00", "Z")
+
+
+def csv_chunks(rows: Iterator[tuple], rows_per_chunk: int = 1000) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    pending = 0
+    for kind, row_id, row_user, timestamp, intake_ml, entry_count in rows:
+        writer.writerow((kind, row_id, "" if row_user is None else row_user, _isoformat(timestamp), intake_ml, entry_count))
+        pending += 1
+        if pending >= rows_per_chunk:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    # Always flush, so the header goes out immediately even for empty exports
+    yield buffer.getvalue().encode()
+
+
+def ndjson_chunks(rows: Iterator[tuple], rows_per_chunk: int = 1000) -> Iterator[bytes]:
+    lines = []
+    for kind, row_id, row_user, timestamp, intake_ml, entry_count in rows:
+        lines.append(json.dumps({
+            "kind": kind,
+            "id": row_id,
+            "user_id": row_user,
+            "timestamp": _isoformat(timestamp),
+            "intake_ml": intake_ml,
+            "entry_count": entry_count,
+        }))
+        if len(lines) >= rows_per_chunk:
+            yield ("\n".join(lines) + "\n").encode()
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
+
+def export_chunks(fmt: str, rows: Iterator[tuple]) -> Iterator[bytes]:
+    if fmt == "csv":
+        return csv_chunks(rows)
+    if fmt == "ndjson":
+        return ndjson_chunks(rows)
+    raise ValueError(f"Unsupported export format: {fmt}")
@@ -1,47 +1,206 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
-from typing import Dict, Any, Optional
+import threading
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Tuple
 from datetime import datetime, timezone
 import logging
 
+from .admission import ConcurrencyLimiter, Overloaded
+from .circuit_breaker import CircuitBreaker, CircuitOpen
+from .config import settings
+from .tracing import span, traced
+
 logger = logging.getLogger(__name__)
 
+# Top-level fields the hydration routes and the sync worker read from a device node
+HYDRATION_FIELDS = ("currentWeight", "totalWaterDrank", "timestamp")
+# 4xx answers worth retrying; any other 4xx means the request itself is bad
+RETRYABLE_CLIENT_ERRORS = (408, 429)
+
+
+class FirebaseRejected(Exception):
+    """Firebase refused a request as invalid (e.g. a key containing '.', '$', '#', '[' or ']'); resending it won't help."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f"Firebase rejected the request with {status_code}: {detail}")
+        self.status_code = status_code
+
+
+def _rejected_status(error: requests.RequestException) -> Optional[int]:
+    """Status code of a non-retryable 4xx response, or None for failures that say something about upstream health."""
+    status = error.response.status_code if isinstance(error, requests.HTTPError) and error.response is not None else None
+    if status is not None and 400 <= status < 500 and status not in RETRYABLE_CLIENT_ERRORS:
+        return status
+    return None
+
+
+@dataclass
+class DeviceSnapshot:
+    data: Dict[str, Any]
+    fetched_at: datetime
+    stale: bool = False
+
+    @property
+    def age_seconds(self) -> float:
+        return (datetime.now(timezone.utc) - self.fetched_at).total_seconds()
+
+
 class FirebaseService:
-    def __init__(self, database_url: str):
+    def __init__(
+        self,
+        database_url: str,
+        timeout: float = 10,
+        limiter: Optional[ConcurrencyLimiter] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
         """
         Initialize Firebase service with database URL
         Args:
             database_url: Firebase Realtime Database URL (e.g., https://hydro-b2c6c-default-rtdb.firebaseio.com/)
+            timeout: Per-request timeout in seconds
+            limiter: Bounds concurrent upstream calls; saturated calls raise Overloaded
+            breaker: Stops calling upstream after repeated failures; last known good data is served meanwhile
         """
         self.database_url = database_url.rstrip('/')
-        
-    def get_device_data(self, device_id: str) -> Optional[Dict[str, Any]]:
+        self.timeout = timeout
+        self.limiter = limiter or ConcurrencyLimiter("firebase", max_concurrent=8, max_wait_s=0.25)
+        self.breaker = breaker or CircuitBreaker("firebase")
+        # Keep-alive pool sized to the limiter so admitted calls never wait for a connection
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=self.limiter.max_concurrent))
+        self._last_good: Dict[Tuple[str, Optional[Tuple[str, ...]]], DeviceSnapshot] = {}
+        self._last_good_lock = threading.Lock()
+        # Set at startup to the cross-worker table (snapshots.SharedSnapshotTable) kept fresh by the elected process
+        self.shared_snapshots = None
+        self.shared_max_age_s = 10.0
+
+    @traced
+    def get_device_snapshot(
+        self, device_id: str, fields: Optional[Tuple[str, ...]] = HYDRATION_FIELDS
+    ) -> Optional[DeviceSnapshot]:
         """
-        Get current device data from Firebase
+        Get current device data, from the shared snapshot table when it holds a recent
+        enough copy of the device, otherwise from Firebase (see fetch_device_snapshot)
+        """
+        if fields == HYDRATION_FIELDS and self.shared_snapshots is not None:
+            snapshot = self.shared_snapshots.get(device_id, self.shared_max_age_s)
+            if snapshot is not None:
+                return snapshot
+        return self.fetch_device_snapshot(device_id, fields)
+
+    def fetch_device_snapshot(
+        self, device_id: str, fields: Optional[Tuple[str, ...]] = HYDRATION_FIELDS
+    ) -> Optional[DeviceSnapshot]:
+        """
+        Get current device data from Firebase, falling back to the last known good
+        snapshot (marked stale) when the upstream call fails or the circuit is open
         Args:
             device_id: Device identifier (e.g., -OcQBJZE__Q1uTdi4USo)
+            fields: Top-level fields to keep, fetched with a shallow query so nested
+                children (reading logs etc.) are never transferred; None fetches the whole node
         Returns:
-            Dictionary with device data or None if not found
+            DeviceSnapshot, or None if the device has no data
+        Raises:
+            CircuitOpen: if the circuit is open and there is no snapshot to fall back to
         """
+        key = (device_id, fields)
+        if not self.breaker.allow():
+            return self._fallback(key, CircuitOpen(self.breaker.name, self.breaker.retry_after_s()))
+
         try:
             # Look under the sensorData node
             url = f"{self.database_url}/{device_id}.json"
-            response = requests.get(url, timeout=10)
+            # shallow=true returns primitive children as-is and nested children as `true`
+            params = {"shallow": "true"} if fields is not None else None
+            with self.limiter.slot(), span("http GET", device_id=device_id, shallow=params is not None) as http:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+                http.set(status=response.status_code)
             response.raise_for_status()
-            
             data = response.json()
-            if data is None:
-                logger.warning(f"No data found for device {device_id} under sensorData node")
-                return None
-                
-            return data
-        except requests.RequestException as e:
+        except (requests.RequestException, json.JSONDecodeError) as e:
             logger.error(f"Error fetching data from Firebase: {e}")
+            # A refused request still means upstream answered, so it doesn't count against the breaker
+            if isinstance(e, requests.RequestException) and _rejected_status(e) is not None:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            return self._fallback(key)
+        except BaseException:
+            # No upstream result (Overloaded waiting for a slot, or a bug): give back a half-open trial
+            self.breaker.release()
+            raise
+
+        self.breaker.record_success()
+        if data is None:
+            logger.warning(f"No data found for device {device_id} under sensorData node")
             return None
-        except json.JSONDecodeError as e:
-            logger.error(f"Error parsing Firebase response: {e}")
-            return None
+        if fields is not None and isinstance(data, dict):
+            data = {field: data[field] for field in fields if field in data}
+
+        snapshot = DeviceSnapshot(data=data, fetched_at=datetime.now(timezone.utc))
+        with self._last_good_lock:
+            self._last_good[key] = snapshot
+        return snapshot
+
+    def _fallback(self, key: Tuple[str, Optional[Tuple[str, ...]]], error: Optional[Exception] = None) -> Optional[DeviceSnapshot]:
+        with self._last_good_lock:
+            last_good = self._last_good.get(key)
+        if last_good is not None:
+            return DeviceSnapshot(data=last_good.data, fetched_at=last_good.fetched_at, stale=True)
+        if error is not None:
+            raise error
+        return None
+
+    def get_device_data(self, device_id: str, fields: Optional[Tuple[str, ...]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Get current device data from Firebase
+        Args:
+            device_id: Device identifier (e.g., -OcQBJZE__Q1uTdi4USo)
+            fields: Top-level fields to fetch; None fetches the whole node
+        Returns:
+            Dictionary with device data or None if not found
+        """
+        snapshot = self.get_device_snapshot(device_id, fields)
+        return snapshot.data if snapshot is not None else None
     
+    @traced
+    def update_paths(self, updates: Dict[str, Any]) -> bool:
+        """
+        Write several values in one request with a multi-path PATCH at the database root
+        Args:
+            updates: Mapping of slash-separated paths (e.g. "<device_id>/currentWeight") to values
+        Returns:
+            True if Firebase accepted the update; False if it failed, the circuit is open or
+            no upstream slot freed up in time, so the caller can retry later
+        Raises:
+            FirebaseRejected: if Firebase refused the update with a non-retryable 4xx
+        """
+        if not self.breaker.allow():
+            return False
+        try:
+            with self.limiter.slot(), span("http PATCH", paths=len(updates)) as http:
+                response = self.session.patch(f"{self.database_url}/.json", json=updates, timeout=self.timeout)
+                http.set(status=response.status_code)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            status = _rejected_status(e)
+            if status is not None:
+                self.breaker.record_success()
+                raise FirebaseRejected(status, e.response.text[:200]) from e
+            logger.error(f"Error writing to Firebase: {e}")
+            self.breaker.record_failure()
+            return False
+        except Overloaded:
+            self.breaker.release()
+            return False
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+        return True
+
     def get_current_weight(self, device_id: str) -> Optional[int]:
         """
         Get current weight from Firebase device data
@@ -50,7 +209,7 @@ class FirebaseService:
         Returns:
             Current weight in grams or None if not available
         """
-        data = self.get_device_data(device_id)
+        data = self.get_device_data(device_id, ('currentWeight',))
         if data and 'currentWeight' in data:
             try:
                 return int(data['currentWeight'])
@@ -58,15 +217,18 @@ class FirebaseService:
                 logger.error(f"Invalid currentWeight value: {data['currentWeight']}")
         return None
     
-    def get_total_water_drank(self, device_id: str) -> Optional[int]:
+    def get_total_water_drank(self, device_id: str, snapshot: Optional[DeviceSnapshot] = None) -> Optional[int]:
         """
         Get total water consumed from Firebase device data
         Args:
             device_id: Device identifier
+            snapshot: Already fetched snapshot to read from instead of calling Firebase again
         Returns:
             Total water consumed in ml or None if not available
         """
-        data = self.get_device_data(device_id)
+        if snapshot is None:
+            snapshot = self.get_device_snapshot(device_id)
+        data = snapshot.data if snapshot is not None else None
         if data and 'totalWaterDrank' in data:
             try:
                 return int(data['totalWaterDrank'])
@@ -74,17 +236,18 @@ class FirebaseService:
                 logger.error(f"Invalid totalWaterDrank value: {data['totalWaterDrank']}")
         return None
     
-    def get_hydration_status(self, device_id: str) -> Dict[str, Any]:
+    def get_hydration_status(self, device_id: str, include_raw: bool = False) -> Dict[str, Any]:
         """
         Get comprehensive hydration status from Firebase
         Args:
             device_id: Device identifier
+            include_raw: Fetch the whole device node and return it as rawData
         Returns:
             Dictionary with hydration status including weight, intake, and metadata
         """
-        data = self.get_device_data(device_id)
+        snapshot = self.get_device_snapshot(device_id, None if include_raw else HYDRATION_FIELDS)
         
-        if data is None:
+        if snapshot is None:
             return {
                 'connected': False,
                 'currentWeight': None,
@@ -93,13 +256,18 @@ class FirebaseService:
                 'error': 'No data available'
             }
         
-        return {
+        data = snapshot.data
+        status = {
             'connected': True,
             'currentWeight': data.get('currentWeight'),
             'totalWaterDrank': data.get('totalWaterDrank'),
-            'lastUpdated': datetime.now(timezone.utc).isoformat(),
-            'rawData': data
+            'lastUpdated': snapshot.fetched_at.isoformat(),
+            'stale': snapshot.stale,
+            'ageSeconds': round(snapshot.age_seconds, 3),
         }
+        if include_raw:
+            status['rawData'] = data
+        return status
     
     def is_device_connected(self, device_id: str) -> bool:
         """
@@ -109,8 +277,20 @@ class FirebaseService:
         Returns:
             True if device is connected and has recent data
         """
-        data = self.get_device_data(device_id)
+        data = self.get_device_data(device_id, ('currentWeight', 'totalWaterDrank'))
         return data is not None and ('currentWeight' in data or 'totalWaterDrank' in data)
 
 # Global Firebase service instance
-firebase_service = FirebaseService("https://hydro-b2c6c-default-rtdb.firebaseio.com")
+firebase_service = FirebaseService(
+    settings.firebase_url,
+    timeout=settings.firebase_timeout_s,
+    limiter=ConcurrencyLimiter(
+        "firebase", max_concurrent=settings.firebase_max_concurrency, max_wait_s=settings.firebase_queue_wait_s
+    ),
+    breaker=CircuitBreaker(
+        "firebase",
+        failure_threshold=settings.firebase_breaker_failure_threshold,
+        recovery_timeout_s=settings.firebase_breaker_recovery_s,
+        half_open_max_calls=settings.firebase_breaker_half_open_calls,
+    ),
+)
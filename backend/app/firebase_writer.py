@@ -0,0 +1,109 @@
+import logging
+import threading
+from typing import Any
+
+from .config import settings
+from .firebase_service import FirebaseRejected, FirebaseService, firebase_service
+from .workers import PeriodicWorker
+
+logger = logging.getLogger(__name__)
+
+
+class FirebaseWriteBehind(PeriodicWorker):
+    """
+    Forwards device readings accepted by the backend to Firebase asynchronously.
+
+    Updates are coalesced per device (only the newest value of each field is kept) and
+    flushed every `interval_s` as multi-path PATCH requests of at most `max_paths`
+    field paths, so a burst of readings from many devices costs a handful of upstream
+    writes. Field-level paths leave any other children of a device node untouched.
+    Failed batches are put back behind anything newer that arrived meanwhile; batches
+    Firebase refuses as invalid are dropped with a log line, since resending them would
+    fail the same way on every flush.
+    """
+
+    name = "firebase-write-behind"
+
+    def __init__(self, service: FirebaseService, interval_s: float, max_paths: int):
+        super().__init__(interval_s)
+        self.service = service
+        self.max_paths = max_paths
+        self._pending: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.patches = 0
+        self.paths_written = 0
+        self.failed_patches = 0
+        self.rejected_patches = 0
+
+    def enqueue(self, device_id: str, fields: dict[str, Any]) -> None:
+        with self._lock:
+            self._pending.setdefault(device_id, {}).update(fields)
+            self.enqueued += 1
+
+    def run_once(self) -> None:
+        self.flush()
+
+    def stop(self) -> None:
+        super().stop()
+        # Don't drop readings that were accepted but not yet forwarded
+        self.flush()
+
+    def flush(self) -> int:
+        """Send everything pending. Returns number of field paths written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        written = 0
+        batch: dict[str, dict[str, Any]] = {}
+        batch_paths = 0
+        for device_id, fields in pending.items():
+            if batch and batch_paths + len(fields) > self.max_paths:
+                written += self._send(batch)
+                batch, batch_paths = {}, 0
+            batch[device_id] = fields
+            batch_paths += len(fields)
+        if batch:
+            written += self._send(batch)
+        return written
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending_devices": len(self._pending),
+                "enqueued": self.enqueued,
+                "patches": self.patches,
+                "paths_written": self.paths_written,
+                "failed_patches": self.failed_patches,
+                "rejected_patches": self.rejected_patches,
+            }
+
+    def _send(self, batch: dict[str, dict[str, Any]]) -> int:
+        updates = {f"{device_id}/{field}": value for device_id, fields in batch.items() for field, value in fields.items()}
+        try:
+            accepted = self.service.update_paths(updates)
+        except FirebaseRejected as e:
+            logger.error(f"Dropping {len(updates)} field paths of devices {sorted(batch)}: {e}")
+            with self._lock:
+                self.rejected_patches += 1
+            return 0
+        if not accepted:
+            self._requeue(batch)
+            with self._lock:
+                self.failed_patches += 1
+            return 0
+        with self._lock:
+            self.patches += 1
+            self.paths_written += len(updates)
+        return len(updates)
+
+    def _requeue(self, batch: dict[str, dict[str, Any]]) -> None:
+        with self._lock:
+            for device_id, fields in batch.items():
+                newer = self._pending.get(device_id, {})
+                self._pending[device_id] = {**fields, **newer}
+
+
+firebase_writer = FirebaseWriteBehind(firebase_service, settings.firebase_write_interval_s, settings.firebase_write_max_paths)
@@ -0,0 +1,257 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from itertools import chain
+
+import numpy as np
+from sqlalchemy import Integer, cast, func, select
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+from .database import SessionLocal
+from .events import on_intake
+from .workers import PeriodicWorker
+
+logger = logging.getLogger(__name__)
+
+HOURS_PER_DAY = 24
+SECONDS_PER_DAY = 86400
+
+
+def _default_share_curve() -> np.ndarray:
+    # Fallback for users without enough history: intake spread evenly over 07:00-22:00 UTC
+    hourly = np.zeros(HOURS_PER_DAY)
+    hourly[7:22] = 1.0
+    return np.cumsum(hourly) / hourly.sum()
+
+
+DEFAULT_SHARE_CURVE = _default_share_curve()
+
+
+@dataclass
+class Forecast:
+    projected_ml: int
+    expected_by_now_ml: int
+    history_days: int
+
+
+def load_intake_columns(db: Session, since: datetime) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Bulk-read (user_id, epoch seconds, intake_ml) for attributed intake since `since`.
+    Epoch conversion happens in SQLite so no per-row datetime objects are built.
+    """
+    epoch = cast(func.strftime("%s", models.IntakeLog.timestamp), Integer)
+    rows = db.execute(
+        select(models.IntakeLog.user_id, epoch, models.IntakeLog.intake_ml).where(
+            models.IntakeLog.timestamp >= since, models.IntakeLog.user_id.is_not(None)
+        )
+    ).all()
+    # fromiter over the flattened rows is an order of magnitude faster than np.array(rows)
+    data = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=3 * len(rows)).reshape(-1, 3)
+    return data[:, 0], data[:, 1], data[:, 2]
+
+
+def compute_profiles(user_ids: np.ndarray, epochs: np.ndarray, intake_ml: np.ndarray, today: int):
+    """
+    Vectorised per-user hour-of-day profiles.
+    Args:
+        today: Current UTC day number (epoch // 86400); rows from this day go into the open-day bins
+    Returns:
+        (unique user ids, completed-day ml per hour [n, 24], completed day counts [n], open-day ml per hour [n, 24])
+    """
+    days = epochs // SECONDS_PER_DAY
+    hours = (epochs % SECONDS_PER_DAY) // 3600
+    uids, inverse = np.unique(user_ids, return_inverse=True)
+    n = len(uids)
+    cells = inverse * HOURS_PER_DAY + hours
+    past = days < today
+
+    hourly = np.bincount(cells[past], weights=intake_ml[past], minlength=n * HOURS_PER_DAY).reshape(n, HOURS_PER_DAY)
+    open_day = np.bincount(cells[~past], weights=intake_ml[~past], minlength=n * HOURS_PER_DAY).reshape(n, HOURS_PER_DAY)
+    user_days = np.unique(inverse[past] * (1 << 32) + days[past])
+    day_counts = np.bincount(user_days >> 32, minlength=n)
+    return uids, hourly, day_counts, open_day
+
+
+class ForecastEngine:
+    """
+    In-memory per-user intake curves used to project end-of-day totals.
+
+    Each user owns one row of parallel arrays: ml per hour-of-day summed over completed
+    days, the number of completed days, the open (current) day's bins and the cached
+    mean cumulative curve. `rebuild` recomputes everything in bulk; `observe` folds in
+    new intake as it is committed, so forecasts are a row lookup plus interpolation.
+    """
+
+    def __init__(self, min_history_days: int):
+        self.min_history_days = min_history_days
+        self._lock = threading.Lock()
+        self._rows: dict[int, int] = {}
+        self._hourly = np.zeros((0, HOURS_PER_DAY))
+        self._days = np.zeros(0, dtype=np.int64)
+        self._open = np.zeros((0, HOURS_PER_DAY))
+        self._open_day = np.zeros(0, dtype=np.int64)
+        self._curve = np.zeros((0, HOURS_PER_DAY))
+        # Wall-clock time of the last rebuild, None until the first one
+        self.built_at: float | None = None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def rebuild(self, db: Session, window_days: int) -> int:
+        """Recompute every profile from the last `window_days` of history. Returns number of users."""
+        now = datetime.now(timezone.utc)
+        today = int(now.timestamp()) // SECONDS_PER_DAY
+        start = (now - timedelta(days=window_days)).date()
+        since = datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
+
+        uids, hourly, days, open_day = compute_profiles(*load_intake_columns(db, since), today)
+        curve = np.cumsum(hourly, axis=1) / np.maximum(days, 1)[:, None]
+        with self._lock:
+            self._rows = {int(uid): row for row, uid in enumerate(uids)}
+            self._hourly = hourly
+            self._days = days.astype(np.int64)
+            self._open = open_day
+            self._open_day = np.full(len(uids), today, dtype=np.int64)
+            self._curve = curve
+            self.built_at = time.time()
+        return len(uids)
+
+    def observe(self, user_id: int | None, timestamp: datetime, intake_ml: int, entry_id: int | None = None) -> None:
+        if user_id is None:
+            return
+        epoch = int(timestamp.timestamp())
+        day, hour = epoch // SECONDS_PER_DAY, (epoch % SECONDS_PER_DAY) // 3600
+        with self._lock:
+            row = self._row(user_id, day)
+            if day > self._open_day[row]:
+                # First intake of a new day closes the previous one into the profile
+                if self._open[row].any():
+                    self._hourly[row] += self._open[row]
+                    self._days[row] += 1
+                    self._curve[row] = np.cumsum(self._hourly[row]) / self._days[row]
+                self._open[row] = 0.0
+                self._open_day[row] = day
+            if day == self._open_day[row]:
+                self._open[row, hour] += intake_ml
+            else:
+                # Late arrival for an already closed day
+                self._hourly[row, hour] += intake_ml
+                self._curve[row] = np.cumsum(self._hourly[row]) / max(self._days[row], 1)
+
+    def forecast(self, user_id: int | None, intake_ml: int, goal_ml: int, now: datetime | None = None) -> Forecast:
+        """Project the end-of-day total for a user who has drunk `intake_ml` so far today."""
+        now = now or datetime.now(timezone.utc)
+        position = (now.timestamp() % SECONDS_PER_DAY) / 3600
+
+        with self._lock:
+            row = self._rows.get(user_id) if user_id is not None else None
+            history_days = int(self._days[row]) if row is not None else 0
+            if history_days >= self.min_history_days:
+                curve = self._curve[row].copy()
+            else:
+                curve = DEFAULT_SHARE_CURVE * goal_ml
+
+        expected_by_now = _curve_at(curve, position)
+        remaining = max(curve[-1] - expected_by_now, 0.0)
+        return Forecast(
+            projected_ml=int(round(intake_ml + remaining)),
+            expected_by_now_ml=int(round(expected_by_now)),
+            history_days=history_days,
+        )
+
+    def share_curves(self, user_ids: list[int]) -> np.ndarray:
+        """
+        Each user's cumulative share of a day's intake by the end of every hour, shape
+        [len(user_ids), 24]. Users with too little history get DEFAULT_SHARE_CURVE.
+        """
+        curves = np.tile(DEFAULT_SHARE_CURVE, (len(user_ids), 1))
+        with self._lock:
+            rows = np.fromiter((self._rows.get(uid, -1) for uid in user_ids), dtype=np.int64, count=len(user_ids))
+            picked = np.flatnonzero(rows >= 0)
+            picked = picked[self._days[rows[picked]] >= self.min_history_days]
+            own = self._curve[rows[picked]]
+        ends = own[:, -1]
+        usable = ends > 0
+        curves[picked[usable]] = own[usable] / ends[usable, None]
+        return curves
+
+    def _row(self, user_id: int, day: int) -> int:
+        row = self._rows.get(user_id)
+        if row is not None:
+            return row
+        row = len(self._rows)
+        if row >= len(self._days):
+            capacity = max(16, 2 * len(self._days))
+            self._hourly = _grow(self._hourly, capacity)
+            self._days = _grow(self._days, capacity)
+            self._open = _grow(self._open, capacity)
+            self._open_day = _grow(self._open_day, capacity)
+            self._curve = _grow(self._curve, capacity)
+        self._hourly[row] = 0.0
+        self._days[row] = 0
+        self._open[row] = 0.0
+        self._open_day[row] = day
+        self._curve[row] = 0.0
+        self._rows[user_id] = row
+        return row
+
+
+def _grow(array: np.ndarray, capacity: int) -> np.ndarray:
+    grown = np.zeros((capacity, *array.shape[1:]), dtype=array.dtype)
+    grown[: len(array)] = array
+    return grown
+
+
+def _curve_at(curve: np.ndarray, position: float) -> float:
+    """Cumulative value at fractional hour `position`; curve[h] is the total by the end of hour h."""
+    hour = min(int(position), HOURS_PER_DAY - 1)
+    previous = curve[hour - 1] if hour > 0 else 0.0
+    return float(previous + (curve[hour] - previous) * (position - hour))
+
+
+class ForecastWorker(PeriodicWorker):
+    """
+    Daily bulk recompute of every profile at `rebuild_hour_utc` (also runs once at
+    startup to warm the cache). A fixed hour keeps the profiles of every worker process
+    built from the same history, whenever each process happened to start.
+    """
+
+    name = "forecast-rebuild"
+
+    def __init__(self, engine: ForecastEngine, rebuild_hour_utc: int, window_days: int, poll_s: float):
+        super().__init__(poll_s)
+        self.engine = engine
+        self.rebuild_hour_utc = rebuild_hour_utc
+        self.window_days = window_days
+
+    def last_due(self, now: datetime | None = None) -> datetime:
+        """The latest scheduled rebuild time at or before `now`."""
+        now = now or datetime.now(timezone.utc)
+        due = now.replace(hour=self.rebuild_hour_utc, minute=0, second=0, microsecond=0)
+        return due if due <= now else due - timedelta(days=1)
+
+    def run_once(self) -> None:
+        built_at = self.engine.built_at
+        if built_at is not None and built_at >= self.last_due().timestamp():
+            # Already built since the last scheduled time (e.g. inherited from a preloading server master)
+            return
+        db = SessionLocal()
+        try:
+            users = self.engine.rebuild(db, self.window_days)
+            logger.info(f"Rebuilt intake forecast profiles for {users} users")
+        finally:
+            db.close()
+
+
+forecast_engine = ForecastEngine(settings.forecast_min_history_days)
+if settings.worker_processes == 1:
+    # With several workers each process would only see its own commits; profiles then
+    # change only at the daily rebuild, identically in every process
+    on_intake(forecast_engine.observe)
+forecast_worker = ForecastWorker(
+    forecast_engine, settings.forecast_rebuild_hour_utc, settings.forecast_window_days, settings.forecast_rebuild_poll_s
+)
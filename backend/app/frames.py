@@ -0,0 +1,65 @@
+"""
+Packed binary frames for batched device readings.
+
+Frame layout (little-endian, no padding):
+    header  8 bytes   magic b"HH", version u8, reserved u8, record count u32
+    record 19 bytes   timestamp_ms u64, weight_g i32, total_ml u32, battery_pct u8, temperature_cc i16
+
+The record carries the same fields `ProductionHardwareSimulator.send_sensor_data` sends
+as JSON; total_ml is the same cumulative uint32 the BLE characteristic notifies.
+Temperature is in hundredths of a degree Celsius.
+"""
+import struct
+import time
+
+import numpy as np
+
+FRAME_MAGIC = b"HH"
+FRAME_VERSION = 1
+HEADER = struct.Struct("<2sBBI")
+# Accepted record timestamps: from 2000-01-01 to a day past the server clock (devices drift)
+MIN_TIMESTAMP_MS = 946_684_800_000
+MAX_CLOCK_AHEAD_MS = 86_400_000
+
+RECORD_DTYPE = np.dtype([
+    ("timestamp_ms", "<u8"),
+    ("weight_g", "<i4"),
+    ("total_ml", "<u4"),
+    ("battery_pct", "u1"),
+    ("temperature_cc", "<i2"),
+])
+
+
+class FrameError(ValueError):
+    pass
+
+
+def decode_frame(payload: bytes) -> np.ndarray:
+    """
+    Parse a frame into a structured array that views `payload` directly (no copy).
+    Raises:
+        FrameError: if the header or length doesn't match, or a timestamp is out of range
+    """
+    if len(payload) < HEADER.size:
+        raise FrameError("Frame shorter than header")
+    magic, version, _, count = HEADER.unpack_from(payload)
+    if magic != FRAME_MAGIC:
+        raise FrameError("Bad frame magic")
+    if version != FRAME_VERSION:
+        raise FrameError(f"Unsupported frame version {version}")
+    expected = HEADER.size + count * RECORD_DTYPE.itemsize
+    if len(payload) != expected:
+        raise FrameError(f"Frame length {len(payload)} does not match {count} records ({expected} bytes)")
+    records = np.frombuffer(payload, dtype=RECORD_DTYPE, count=count, offset=HEADER.size)
+    timestamps = records["timestamp_ms"]
+    bad = (timestamps < MIN_TIMESTAMP_MS) | (timestamps > int(time.time() * 1000) + MAX_CLOCK_AHEAD_MS)
+    if bad.any():
+        index = int(bad.argmax())
+        raise FrameError(f"Record {index} has an out-of-range timestamp_ms {int(timestamps[index])}")
+    return records
+
+
+def encode_frame(records: np.ndarray) -> bytes:
+    """Pack a RECORD_DTYPE array (or anything convertible to one) into a frame."""
+    records = np.asarray(records, dtype=RECORD_DTYPE)
+    return HEADER.pack(FRAME_MAGIC, FRAME_VERSION, 0, len(records)) + records.tobytes()
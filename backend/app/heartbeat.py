@@ -0,0 +1,165 @@
+import threading
+from datetime import datetime, timezone
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+from .database import SessionLocal
+from .timeutil import as_utc
+from .workers import PeriodicWorker
+
+ONLINE, IDLE, OFFLINE = "online", "idle", "offline"
+
+
+class DeviceHeartbeats(PeriodicWorker):
+    """
+    Last time each device was heard from. Every reading updates a dict entry in memory;
+    every `interval_s` the devices seen since the previous flush are upserted into
+    device_status in one statement, so the table survives restarts without costing a
+    write per reading.
+
+    A device is online when heard from within `online_timeout_s`, idle up to
+    `offline_timeout_s`, and offline after that.
+    """
+
+    name = "device-heartbeats"
+
+    def __init__(self, interval_s: float, online_timeout_s: float, offline_timeout_s: float):
+        super().__init__(interval_s)
+        self.online_timeout_s = online_timeout_s
+        self.offline_timeout_s = offline_timeout_s
+        self._lock = threading.Lock()
+        self._last_seen: dict[str, datetime] = {}
+        self._dirty: set[str] = set()
+        self.observed = 0
+        self.flushes = 0
+        self.rows_written = 0
+
+    def observe(self, device_id: str, seen_at: datetime | None = None) -> None:
+        now = datetime.now(timezone.utc)
+        # Device clocks run ahead sometimes; never report a device as seen in the future
+        seen_at = min(as_utc(seen_at), now) if seen_at is not None else now
+        with self._lock:
+            self.observed += 1
+            previous = self._last_seen.get(device_id)
+            if previous is None or seen_at > previous:
+                self._last_seen[device_id] = seen_at
+                self._dirty.add(device_id)
+
+    def load(self, db: Session) -> int:
+        """Merge last-seen times stored in device_status (by any process) into memory. Returns rows read."""
+        status = models.DeviceStatus
+        rows = db.execute(
+            select(status.device_id, status.last_seen_at).where(status.device_id.is_not(None), status.last_seen_at.is_not(None))
+        ).all()
+        with self._lock:
+            for device_id, seen_at in rows:
+                seen_at = as_utc(seen_at)
+                previous = self._last_seen.get(device_id)
+                if previous is None or seen_at > previous:
+                    self._last_seen[device_id] = seen_at
+        return len(rows)
+
+    def run_once(self) -> None:
+        self.flush()
+        if settings.worker_processes > 1:
+            # Pick up devices whose readings went to other worker processes
+            db = SessionLocal()
+            try:
+                self.load(db)
+            finally:
+                db.close()
+
+    def stop(self) -> None:
+        super().stop()
+        self.flush()
+
+    def flush(self) -> int:
+        """Upsert every device seen since the last flush. Returns number of devices written."""
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            rows = [
+                {"device_id": device_id, "last_seen_at": self._last_seen[device_id], "last_synced": now,
+                 "connected": self._state(self._last_seen[device_id], now) == ONLINE}
+                for device_id in dirty
+            ]
+        if not rows:
+            return 0
+
+        status = models.DeviceStatus
+        statement = insert(status)
+        statement = statement.on_conflict_do_update(
+            index_elements=[status.device_id],
+            set_={
+                # Another worker process may have written a newer time meanwhile
+                "last_seen_at": func.max(
+                    func.coalesce(status.last_seen_at, statement.excluded.last_seen_at), statement.excluded.last_seen_at
+                ),
+                "connected": statement.excluded.connected,
+                "last_synced": statement.excluded.last_synced,
+            },
+        )
+        db = SessionLocal()
+        try:
+            # Core executemany: the ORM bulk insert path is unavailable on a sharded session
+            db.connection().execute(statement, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                self._dirty |= dirty
+            raise
+        finally:
+            db.close()
+        with self._lock:
+            self.flushes += 1
+            self.rows_written += len(rows)
+        return len(rows)
+
+    def status(self, device_id: str | None, now: datetime | None = None) -> dict:
+        """Presence of one device; None picks the most recently seen device."""
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            if device_id is None and self._last_seen:
+                device_id = max(self._last_seen, key=self._last_seen.__getitem__)
+            seen_at = self._last_seen.get(device_id) if device_id is not None else None
+        state = self._state(seen_at, now)
+        return {
+            "device_id": device_id,
+            "connected": state == ONLINE,
+            "state": state,
+            "last_synced": seen_at,
+            "age_seconds": (now - seen_at).total_seconds() if seen_at is not None else None,
+        }
+
+    def stats(self) -> dict:
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            states = [self._state(seen_at, now) for seen_at in self._last_seen.values()]
+            return {
+                "devices": len(self._last_seen),
+                **{state: states.count(state) for state in (ONLINE, IDLE, OFFLINE)},
+                "pending": len(self._dirty),
+                "observed": self.observed,
+                "flushes": self.flushes,
+                "rows_written": self.rows_written,
+            }
+
+    def _state(self, seen_at: datetime | None, now: datetime) -> str:
+        if seen_at is None:
+            return OFFLINE
+        age = (now - seen_at).total_seconds()
+        if age <= self.online_timeout_s:
+            return ONLINE
+        if age <= self.offline_timeout_s:
+            return IDLE
+        return OFFLINE
+
+
+heartbeats = DeviceHeartbeats(
+    settings.heartbeat_flush_interval_s, settings.device_online_timeout_s, settings.device_offline_timeout_s
+)
@@ -0,0 +1,187 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+from .events import on_intake
+
+
+def _epoch_ms(value: datetime) -> int:
+    value = value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+    return int(value.timestamp() * 1000)
+
+
+class IntakeRing:
+    """
+    Fixed-capacity ring of recent intake: parallel arrays of epoch ms, ml and row id.
+    The ring holds every row with timestamp >= `complete_since_ms`; once it is full,
+    appending evicts the oldest slot and moves that bound past the evicted row.
+    Footprint is 20 bytes per slot regardless of how much is stored.
+    """
+
+    __slots__ = ("timestamps_ms", "intake_ml", "entry_ids", "head", "size", "complete_since_ms")
+
+    def __init__(self, capacity: int, complete_since_ms: int):
+        self.timestamps_ms = np.zeros(capacity, dtype=np.int64)
+        self.intake_ml = np.zeros(capacity, dtype=np.int32)
+        self.entry_ids = np.zeros(capacity, dtype=np.int64)
+        self.head = 0
+        self.size = 0
+        self.complete_since_ms = complete_since_ms
+
+    @property
+    def capacity(self) -> int:
+        return len(self.timestamps_ms)
+
+    def append(self, timestamp_ms: int, intake_ml: int, entry_id: int) -> None:
+        slot = (self.head + self.size) % self.capacity
+        if self.size == self.capacity:
+            self.complete_since_ms = max(self.complete_since_ms, int(self.timestamps_ms[self.head]) + 1)
+            self.head = (self.head + 1) % self.capacity
+        else:
+            self.size += 1
+        self.timestamps_ms[slot] = timestamp_ms
+        self.intake_ml[slot] = intake_ml
+        self.entry_ids[slot] = entry_id
+
+    def _live(self) -> slice | np.ndarray:
+        if self.head + self.size <= self.capacity:
+            return slice(self.head, self.head + self.size)
+        return (self.head + np.arange(self.size)) % self.capacity
+
+    def total_since(self, since_ms: int) -> int | None:
+        if since_ms < self.complete_since_ms:
+            return None
+        live = self._live()
+        timestamps = self.timestamps_ms[live]
+        return int(self.intake_ml[live][timestamps >= since_ms].sum())
+
+    def newest(self, limit: int) -> list[tuple[int, int, int]] | None:
+        """The newest `limit` rows as (entry_id, timestamp_ms, intake_ml), oldest first, or None if not all cached."""
+        live = self._live()
+        timestamps = self.timestamps_ms[live]
+        held = np.flatnonzero(timestamps >= self.complete_since_ms)
+        if len(held) < limit:
+            return None
+        order = held[np.lexsort((self.entry_ids[live][held], timestamps[held]))][-limit:]
+        return list(zip(self.entry_ids[live][order].tolist(), timestamps[order].tolist(), self.intake_ml[live][order].tolist()))
+
+
+class HotIntakeCache:
+    """
+    In-memory tier for the last `window` of intake, one IntakeRing per user plus a
+    global ring (key None) holding every row, attributed or not, for the all-users
+    reads. Filled from committed intake events and warmed from the database at startup.
+
+    Reads return None whenever the rings can't prove they hold every matching row
+    (before warm-up, after eviction, or for windows older than the warm-up), and the
+    caller falls back to SQLite.
+    """
+
+    def __init__(self, window: timedelta, user_capacity: int, global_capacity: int):
+        self.window = window
+        self.user_capacity = user_capacity
+        self.global_capacity = global_capacity
+        self._lock = threading.Lock()
+        self._rings: dict[int | None, IntakeRing] = {}
+        # None until warmed: nothing can be served before then
+        self._complete_since_ms: int | None = None
+        self.hits = 0
+        self.misses = 0
+
+    def warm(self, db: Session, now: datetime | None = None) -> int:
+        """Load the last `window` of intake from the database. Returns rows loaded."""
+        since = (now or datetime.now(timezone.utc)) - self.window
+        since_ms = _epoch_ms(since)
+        log = models.IntakeLog
+        rows = db.execute(
+            select(log.id, log.user_id, log.timestamp, log.intake_ml).where(log.timestamp >= since).order_by(log.timestamp, log.id)
+        ).all()
+        # Intake shards come back one after another; rings must be filled in time order
+        rows.sort(key=lambda row: (row.timestamp, row.id))
+        with self._lock:
+            self._rings = {}
+            self._complete_since_ms = since_ms
+            for entry_id, user_id, timestamp, intake_ml in rows:
+                self._append(user_id, _epoch_ms(timestamp), intake_ml, entry_id)
+        return len(rows)
+
+    def clear(self) -> None:
+        """Drop every ring; reads fall back to SQLite until the next warm()."""
+        with self._lock:
+            self._rings = {}
+            self._complete_since_ms = None
+
+    def observe(self, user_id: int | None, timestamp: datetime, intake_ml: int, entry_id: int | None = None) -> None:
+        with self._lock:
+            if self._complete_since_ms is None:
+                return
+            if entry_id is None:
+                # A row the rings can't identify: stop serving until the next warm-up
+                self._complete_since_ms = None
+                return
+            self._append(user_id, _epoch_ms(timestamp), intake_ml, entry_id)
+
+    def total_since(self, user_id: int | None, since: datetime) -> int | None:
+        since_ms = _epoch_ms(since)
+        with self._lock:
+            ring = self._ring(user_id)
+            total = ring.total_since(since_ms) if ring is not None and since_ms >= self._complete_since_ms else None
+            self._count(total is not None)
+            return total
+
+    def newest(self, user_id: int | None, limit: int) -> list[tuple[int, datetime, int]] | None:
+        """The newest `limit` rows as (entry_id, timestamp, intake_ml), oldest first."""
+        with self._lock:
+            ring = self._ring(user_id)
+            rows = ring.newest(limit) if ring is not None else None
+            self._count(rows is not None)
+        if rows is None:
+            return None
+        return [(entry_id, datetime.fromtimestamp(ms / 1000, tz=timezone.utc), ml) for entry_id, ms, ml in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "warm": self._complete_since_ms is not None,
+                "users": sum(1 for key in self._rings if key is not None),
+                # A user's rows sit in both its own ring and the global one
+                "rows": len(np.unique(np.concatenate([ring.entry_ids[ring._live()] for ring in self._rings.values()] or [[]]))),
+                "bytes": sum(ring.timestamps_ms.nbytes + ring.intake_ml.nbytes + ring.entry_ids.nbytes for ring in self._rings.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _ring(self, user_id: int | None) -> IntakeRing | None:
+        if self._complete_since_ms is None:
+            return None
+        ring = self._rings.get(user_id)
+        # Users with no recent intake have nothing to hold: an empty, complete ring
+        return ring if ring is not None else IntakeRing(0, self._complete_since_ms)
+
+    def _append(self, user_id: int | None, timestamp_ms: int, intake_ml: int, entry_id: int) -> None:
+        keys = (None,) if user_id is None else (user_id, None)
+        for key in keys:
+            ring = self._rings.get(key)
+            if ring is None:
+                capacity = self.global_capacity if key is None else self.user_capacity
+                ring = self._rings[key] = IntakeRing(capacity, self._complete_since_ms)
+            ring.append(timestamp_ms, intake_ml, entry_id)
+
+    def _count(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+
+hot_cache = HotIntakeCache(
+    timedelta(hours=settings.hot_cache_window_hours),
+    user_capacity=settings.hot_cache_user_capacity,
+    global_capacity=settings.hot_cache_global_capacity,
+)
+on_intake(hot_cache.observe)
@@ -0,0 +1,131 @@
+import threading
+from datetime import datetime, timezone
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import shard_connection
+from .events import publish_intake
+from .frames import decode_frame
+from .loadcell import LoadCellConfig, SipDetector, SipEvent
+from .sync import apply_cumulative_batch, apply_cumulative_reading, parse_reading_timestamp
+from .timeutil import as_utc
+
+# Each detector has its own lock, so uploads from different devices are detected in parallel;
+# the module lock only guards the dict
+_detectors: dict[str, tuple[SipDetector, threading.Lock]] = {}
+_detectors_lock = threading.Lock()
+
+
+def detector_for(device_id: str) -> SipDetector:
+    """Per-device streaming detector; state carries over between uploads from the same device."""
+    return _detector_entry(device_id)[0]
+
+
+def _detector_entry(device_id: str) -> tuple[SipDetector, threading.Lock]:
+    with _detectors_lock:
+        entry = _detectors.get(device_id)
+        if entry is None:
+            entry = _detectors[device_id] = (SipDetector(LoadCellConfig()), threading.Lock())
+        return entry
+
+
+def ingest_weight_samples(
+    db: Session, device_id: str, user_id: int | None, samples: list[tuple[float, datetime | None]]
+) -> list[SipEvent]:
+    """
+    Run raw load-cell samples through the device's sip detector and record every
+    detected sip as intake. For devices that stream weights instead of cumulative totals.
+    Returns:
+        All detected events (sips and refills)
+    """
+    detector, lock = _detector_entry(device_id)
+    now = datetime.now(timezone.utc)
+    with lock:
+        # SQLite keeps the wall-clock digits and drops the offset, so sips are stored as UTC
+        events = [
+            event for weight, timestamp in samples
+            if (event := detector.process(weight, as_utc(timestamp) if timestamp else now))
+        ]
+
+    for event in events:
+        if event.kind == "sip":
+            db.add(models.IntakeLog(intake_ml=event.amount_ml, user_id=user_id, timestamp=event.timestamp))
+    db.commit()
+    return events
+
+
+def ingest_frame(db: Session, device_id: str, user_id: int | None, payload: bytes) -> tuple[int, int]:
+    """
+    Store every record of a packed reading frame and derive intake from its cumulative
+    totals, in one transaction. The frame is decoded as a zero-copy view and timestamps
+    are converted for all records at once, but the insert still builds one dict per
+    record for the executemany.
+    Raises:
+        FrameError: if the payload is not a valid frame
+    Returns:
+        (number of readings stored, intake ml recorded)
+    """
+    records = decode_frame(payload)
+    if len(records) == 0:
+        return 0, 0
+
+    # Naive UTC, which is how SQLite stores the aware datetimes of the other insert paths
+    timestamps = records["timestamp_ms"].astype("datetime64[ms]").tolist()
+    # Re-sent frames (retries after a lost response) must not duplicate readings
+    shard_connection(db, user_id).execute(
+        insert(models.DeviceReading).prefix_with("OR IGNORE"),
+        [
+            {
+                "device_id": device_id,
+                "user_id": user_id,
+                "timestamp": timestamp,
+                "weight_g": weight,
+                "total_ml": total,
+                "battery_pct": battery,
+                "temperature_c": temperature_cc / 100,
+            }
+            for timestamp, weight, total, battery, temperature_cc in zip(
+                timestamps,
+                records["weight_g"].tolist(),
+                records["total_ml"].tolist(),
+                records["battery_pct"].tolist(),
+                records["temperature_cc"].tolist(),
+            )
+        ],
+    )
+    intake = apply_cumulative_batch(db, device_id, user_id, records["timestamp_ms"], records["total_ml"])
+    db.commit()
+
+    for timestamp, delta, entry_id in intake:
+        publish_intake(user_id, timestamp, delta, entry_id)
+    return len(records), sum(delta for _, delta, _ in intake)
+
+
+def ingest_reading(
+    db: Session, device_id: str, user_id: int | None, weight_g: int, total_ml: int,
+    timestamp: str | None = None, battery_pct: int | None = None, temperature_c: float | None = None,
+) -> int:
+    """
+    Store one device reading and record the intake implied by its cumulative total.
+    Returns:
+        The intake delta in ml that was recorded
+    """
+    reading_at = parse_reading_timestamp(timestamp) or datetime.now(timezone.utc)
+    shard_connection(db, user_id).execute(
+        insert(models.DeviceReading).prefix_with("OR IGNORE"),
+        [{
+            "device_id": device_id,
+            "user_id": user_id,
+            "timestamp": reading_at,
+            "weight_g": weight_g,
+            "total_ml": total_ml,
+            "battery_pct": battery_pct,
+            "temperature_c": temperature_c,
+        }],
+    )
+    delta = apply_cumulative_reading(db, device_id, total_ml, reading_at, user_id)
+    db.commit()
+    return delta
+
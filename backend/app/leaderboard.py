@@ -0,0 +1,152 @@
+import bisect
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import models
+from .events import on_intake, on_profile
+
+ML_PER_KG = 35
+# Lower edges (as a fraction of goal) of every bucket after the first
+BUCKET_EDGES = (0.25, 0.5, 0.75, 1.0)
+BUCKET_LABELS = ("0-25%", "25-50%", "50-75%", "75-100%", "100%+")
+
+
+@dataclass
+class FleetEntry:
+    user_id: int
+    total_ml: int
+    goal_ml: int
+
+    @property
+    def ratio(self) -> float:
+        return self.total_ml / self.goal_ml if self.goal_ml > 0 else 0.0
+
+
+def _bucket(ratio: float) -> int:
+    return bisect.bisect_right(BUCKET_EDGES, ratio)
+
+
+class FleetIndex:
+    """
+    Today's goal completion for every user, kept ordered as intake and profile changes
+    are committed. Writes cost one bisect plus a list insert/delete; reads never scan or
+    sort: top-N is a slice, the behind count is one bisect, buckets are counters.
+
+    The index covers the current UTC day and resets itself on the first access after
+    midnight.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day: date = datetime.now(timezone.utc).date()
+        self._entries: dict[int, FleetEntry] = {}
+        # (-ratio, user_id), so the best users come first
+        self._order: list[tuple[float, int]] = []
+        self._buckets = [0] * len(BUCKET_LABELS)
+        self._built_at: float | None = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def rebuild(self, db: Session) -> int:
+        """Load every profile and today's totals. Returns number of users."""
+        day = datetime.now(timezone.utc).date()
+        start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+        totals = dict(
+            db.execute(
+                select(models.IntakeLog.user_id, func.sum(models.IntakeLog.intake_ml))
+                .where(models.IntakeLog.timestamp >= start, models.IntakeLog.user_id.is_not(None))
+                .group_by(models.IntakeLog.user_id)
+            ).all()
+        )
+        entries = {
+            user_id: FleetEntry(user_id, int(totals.get(user_id) or 0), int(round(weight_kg * ML_PER_KG)))
+            for user_id, weight_kg in db.execute(select(models.UserProfile.id, models.UserProfile.weight_kg)).all()
+        }
+        with self._lock:
+            self._day = day
+            self._entries = entries
+            self._order = sorted((-entry.ratio, entry.user_id) for entry in entries.values())
+            self._buckets = [0] * len(BUCKET_LABELS)
+            for entry in entries.values():
+                self._buckets[_bucket(entry.ratio)] += 1
+            self._built_at = time.monotonic()
+        return len(entries)
+
+    def refresh(self, db: Session, max_age_s: float) -> None:
+        """Rebuild if the last rebuild is older than `max_age_s`, for processes that don't see every commit."""
+        built_at = self._built_at
+        if built_at is None or time.monotonic() - built_at > max_age_s:
+            self.rebuild(db)
+
+    def observe_intake(self, user_id: int | None, timestamp: datetime, intake_ml: int, entry_id: int | None = None) -> None:
+        if user_id is None:
+            return
+        with self._lock:
+            self._roll_day()
+            if timestamp.astimezone(timezone.utc).date() != self._day:
+                return
+            entry = self._entries.get(user_id)
+            if entry is None:
+                # Intake for a user whose profile the index hasn't seen yet; goal follows
+                entry = self._insert(FleetEntry(user_id, 0, 0))
+            self._update(entry, entry.total_ml + intake_ml, entry.goal_ml)
+
+    def observe_profile(self, user_id: int, weight_kg: int) -> None:
+        goal_ml = int(round(weight_kg * ML_PER_KG))
+        with self._lock:
+            self._roll_day()
+            entry = self._entries.get(user_id) or self._insert(FleetEntry(user_id, 0, 0))
+            self._update(entry, entry.total_ml, goal_ml)
+
+    def summary(self, top: int = 10) -> dict:
+        with self._lock:
+            self._roll_day()
+            leaders = [self._entries[user_id] for _, user_id in self._order[:top]]
+            # Everything ranked after the last user at or above 100% is behind
+            ahead = bisect.bisect_right(self._order, (-1.0, float("inf")))
+            return {
+                "day": self._day,
+                "users": len(self._entries),
+                "behind": len(self._order) - ahead,
+                "top": [
+                    {"user_id": e.user_id, "total_ml": e.total_ml, "goal_ml": e.goal_ml, "percent": round(e.ratio * 100, 1)}
+                    for e in leaders
+                ],
+                "buckets": [{"label": label, "count": count} for label, count in zip(BUCKET_LABELS, self._buckets)],
+            }
+
+    def _insert(self, entry: FleetEntry) -> FleetEntry:
+        self._entries[entry.user_id] = entry
+        bisect.insort(self._order, (-entry.ratio, entry.user_id))
+        self._buckets[_bucket(entry.ratio)] += 1
+        return entry
+
+    def _update(self, entry: FleetEntry, total_ml: int, goal_ml: int) -> None:
+        old_key = (-entry.ratio, entry.user_id)
+        self._buckets[_bucket(entry.ratio)] -= 1
+        del self._order[bisect.bisect_left(self._order, old_key)]
+        entry.total_ml, entry.goal_ml = total_ml, goal_ml
+        bisect.insort(self._order, (-entry.ratio, entry.user_id))
+        self._buckets[_bucket(entry.ratio)] += 1
+
+    def _roll_day(self) -> None:
+        today = datetime.now(timezone.utc).date()
+        if today == self._day:
+            return
+        self._day = today
+        for entry in self._entries.values():
+            entry.total_ml = 0
+        self._order = sorted((0.0, user_id) for user_id in self._entries)
+        self._buckets = [0] * len(BUCKET_LABELS)
+        self._buckets[0] = len(self._entries)
+
+
+fleet_index = FleetIndex()
+on_intake(fleet_index.observe_intake)
+on_profile(fleet_index.observe_profile)
@@ -1,14 +1,43 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Path, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from .database import Base, engine, get_db
-from . import models, schemas, crud
+from starlette.concurrency import run_in_threadpool
+from .database import SessionLocal, all_engines, dispose_async_engines, engine, ensure_schema, get_async_db, get_db
+from . import models, schemas, crud, async_crud, ingest, export
 from .firebase_service import firebase_service
-from datetime import datetime
+from .frames import FrameError
+from .admission import Overloaded, RouteBudgetMiddleware, admission_stats
+from .compression import CompressionMiddleware
+from .config import settings
+from .retention import retention_worker
+from .sync import sync_worker
+from .firebase_writer import firebase_writer
+from .reports import get_job, get_reports, period_bounds, report_runner, report_scheduler
+from .reminders import reminder_scheduler
+from .forecast import forecast_engine, forecast_worker
+from .leaderboard import fleet_index
+from .hotcache import hot_cache
+from .heartbeat import heartbeats
+from .snapshots import snapshot_refresher, snapshot_table
+from .querystats import QueryStatsMiddleware, query_stats
+from .tracing import TracedRoute, TracingMiddleware, instrument_engine
+from .workers import LeaderElection
+from datetime import date, datetime
+from typing import Annotated
 
-Base.metadata.create_all(bind=engine)
+ensure_schema()
 
 app = FastAPI(title="Hydration Hero API")
+if settings.tracing_enabled:
+    # Must be set before any route is declared
+    app.router.route_class = TracedRoute
+    for bind in all_engines:
+        instrument_engine(bind)
+if settings.sql_stats_enabled:
+    for bind in all_engines:
+        query_stats.instrument(bind)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,58 +46,377 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RouteBudgetMiddleware, budgets=settings.route_budgets, max_wait_s=settings.route_budget_wait_s)
+if settings.compression_enabled:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.compression_minimum_size,
+        gzip_level=settings.compression_gzip_level,
+        brotli_quality=settings.compression_brotli_quality,
+    )
+if settings.sql_stats_enabled:
+    app.add_middleware(QueryStatsMiddleware, stats=query_stats)
+if settings.tracing_enabled:
+    # Added last so it is outermost and times the other middleware too
+    app.add_middleware(
+        TracingMiddleware,
+        slow_ms=settings.slow_request_ms,
+        log_path=settings.slow_request_log,
+        max_bytes=settings.slow_request_log_max_bytes,
+        backups=settings.slow_request_log_backups,
+    )
 
 
+@app.exception_handler(Overloaded)
+def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, round(exc.retry_after_s)))},
+    )
+
+
+_caches_warm = False
+
+
+def warm_caches() -> None:
+    """
+    Load the in-process read caches from the database. A preloading server master calls
+    this before forking so every worker inherits the warmed state; startup then skips it.
+    """
+    global _caches_warm
+    if _caches_warm:
+        return
+    db = SessionLocal()
+    try:
+        fleet_index.rebuild(db)
+        if settings.worker_processes == 1:
+            # Fed by this process's commits only: with several workers it would miss rows
+            hot_cache.warm(db)
+        if settings.forecast_enabled:
+            forecast_engine.rebuild(db, settings.forecast_window_days)
+        heartbeats.load(db)
+    finally:
+        db.close()
+    _caches_warm = True
+
+
+def recover_report_jobs() -> None:
+    """Fail report jobs a previous server left unfinished. Run once per server, before any worker submits."""
+    db = SessionLocal()
+    try:
+        report_runner.recover(db)
+    finally:
+        db.close()
+
+
+def start_leader_jobs() -> None:
+    """Background jobs that must run in exactly one process."""
+    if settings.retention_enabled:
+        retention_worker.start()
+    if settings.sync_enabled:
+        sync_worker.start()
+    if settings.reports_enabled:
+        report_scheduler.start()
+    if settings.device_snapshots_enabled:
+        snapshot_refresher.start()
+    if settings.reminders_enabled:
+        reminder_scheduler.start()
+
+
+leader_election = LeaderElection(f"{engine.url.database}.jobs.lock", settings.leader_poll_s, start_leader_jobs)
+
+
+@app.on_event("startup")
+def start_background_jobs():
+    warm_caches()
+    if settings.worker_processes == 1:
+        recover_report_jobs()
+    # Per-process state: every worker refreshes its own forecasts and forwards its own readings
+    if settings.forecast_enabled:
+        forecast_worker.start()
+    if settings.firebase_write_enabled:
+        firebase_writer.start()
+    if settings.device_snapshots_enabled:
+        snapshot_table.open()
+        firebase_service.shared_max_age_s = settings.device_snapshot_max_age_s
+        firebase_service.shared_snapshots = snapshot_table
+    heartbeats.start()
+    leader_election.start()
+
+
+@app.on_event("shutdown")
+def stop_background_jobs():
+    report_scheduler.stop()
+    report_runner.shutdown()
+    reminder_scheduler.stop()
+    firebase_writer.stop()
+    heartbeats.stop()
+    forecast_worker.stop()
+    sync_worker.stop()
+    retention_worker.stop()
+    snapshot_refresher.stop()
+    firebase_service.shared_snapshots = None
+    snapshot_table.close()
+    leader_election.stop()
+
+
+@app.on_event("shutdown")
+async def close_async_engines():
+    await dispose_async_engines()
+
+
+# Routes on the local database are async where their queries go through async_crud, so a
+# request waiting on SQLite doesn't hold a threadpool thread; the threads stay free for
+# the sync routes (Firebase calls, ingest, reports and the export stream)
 @app.get("/api/user/profile", response_model=schemas.UserProfile)
-def get_profile(db: Session = Depends(get_db)):
-    profile = crud.get_profile(db)
+async def get_profile(db: AsyncSession = Depends(get_async_db)):
+    profile = await async_crud.get_profile(db)
     if profile is None:
-        profile = crud.upsert_profile(db, weight_kg=70, age=None, activity_level="moderate")
+        profile = await async_crud.upsert_profile(db, weight_kg=70, age=None, activity_level="moderate")
     return schemas.UserProfile.from_orm(profile)
 
 
 @app.put("/api/user/profile", response_model=schemas.UserProfile)
-def update_profile(payload: schemas.UserProfileUpdate, db: Session = Depends(get_db)):
-    profile = crud.upsert_profile(db, weight_kg=payload.weight_kg, age=payload.age, activity_level=payload.activity_level)
+async def update_profile(payload: schemas.UserProfileUpdate, db: AsyncSession = Depends(get_async_db)):
+    # Only touch the device registration when the client actually sent the field
+    changes = {"device_id": payload.device_id} if "device_id" in payload.model_fields_set else {}
+    profile = await async_crud.upsert_profile(
+        db, weight_kg=payload.weight_kg, age=payload.age, activity_level=payload.activity_level, **changes
+    )
     return schemas.UserProfile.from_orm(profile)
 
 
 @app.get("/api/hydration/daily", response_model=schemas.DailyIntake)
-def get_daily(db: Session = Depends(get_db)):
-    total = crud.get_today_total_ml(db)
+async def get_daily(user_id: int | None = None, db: AsyncSession = Depends(get_async_db)):
+    total = await async_crud.get_today_total_ml(db, user_id=user_id)
     return schemas.DailyIntake(date=datetime.utcnow().date().isoformat(), total_ml=total)
 
 
 @app.get("/api/hydration/history", response_model=list[schemas.IntakeEntry])
-def history(db: Session = Depends(get_db)):
-    return [schemas.IntakeEntry.from_orm(x) for x in crud.get_history(db)]
+async def history(user_id: int | None = None, db: AsyncSession = Depends(get_async_db)):
+    return [schemas.IntakeEntry.from_orm(x) for x in await async_crud.get_history(db, user_id=user_id)]
+
+
+@app.get("/api/hydration/export")
+def export_history(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    start: datetime | None = None,
+    end: datetime | None = None,
+    user_id: int | None = None,
+):
+    """Stream the full intake history (daily summaries, then raw rows) as CSV or NDJSON"""
+    rows = export.iter_intake_rows(start=start, end=end, user_id=user_id)
+    return StreamingResponse(
+        export.export_chunks(format, rows),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="intake_history.{format}"'},
+    )
 
 
 @app.get("/api/prediction", response_model=schemas.Prediction)
-def prediction(db: Session = Depends(get_db)):
-    profile = crud.get_profile(db)
+async def prediction(db: AsyncSession = Depends(get_async_db)):
+    profile = await async_crud.get_profile(db)
     if profile is None:
-        profile = crud.upsert_profile(db, weight_kg=70, age=None, activity_level="moderate")
+        profile = await async_crud.upsert_profile(db, weight_kg=70, age=None, activity_level="moderate")
     goal = int(round(profile.weight_kg * 35))
-    total = crud.get_today_total_ml(db)
+    total = await async_crud.get_today_total_ml(db, user_id=profile.id)
     delta = total - goal
     status = "ahead" if delta >= 0 else "behind"
-    return schemas.Prediction(goal_ml=goal, intake_ml=total, delta_ml=delta, status=status)
+    return _prediction_with_forecast(profile.id, goal, total, delta, status)
+
+
+def _prediction_with_forecast(user_id: int, goal: int, total: int, delta: int, status: str) -> schemas.Prediction:
+    forecast = forecast_engine.forecast(user_id, total, goal)
+    return schemas.Prediction(
+        goal_ml=goal,
+        intake_ml=total,
+        delta_ml=delta,
+        status=status,
+        projected_ml=forecast.projected_ml,
+        projected_delta_ml=forecast.projected_ml - goal,
+        expected_by_now_ml=forecast.expected_by_now_ml,
+        history_days=forecast.history_days,
+    )
+
+
+@app.post("/api/reports/jobs", response_model=schemas.ReportJob, status_code=202)
+def create_report_job(payload: schemas.ReportJobCreate, db: Session = Depends(get_db)):
+    """Queue a report computation (default: the current, in-progress period)"""
+    today = datetime.utcnow().date()
+    period_start = payload.period_start or today
+    if period_bounds(payload.kind, period_start)[0] > today:
+        raise HTTPException(status_code=422, detail="period_start is in the future")
+    return schemas.ReportJob.from_orm(report_runner.submit(db, payload.kind, period_start))
+
+
+@app.get("/api/reports/jobs/{job_id}", response_model=schemas.ReportJob)
+def get_report_job(job_id: int, db: Session = Depends(get_db)):
+    job = get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    return schemas.ReportJob.from_orm(job)
+
+
+@app.get("/api/reports/{kind}", response_model=schemas.ReportPeriod)
+def get_report(
+    kind: str = Path(pattern="^(weekly|monthly)$"),
+    period_start: date | None = None,
+    user_id: int | None = None,
+    db: Session = Depends(get_db),
+):
+    """Materialized report for a period (the latest computed one by default)"""
+    job, rows = get_reports(db, kind, period_start, user_id)
+    if not rows:
+        raise HTTPException(status_code=404, detail="No report computed for this period")
+    return schemas.ReportPeriod(
+        kind=kind,
+        period_start=rows[0].period_start,
+        period_end=rows[0].period_end,
+        job=schemas.ReportJob.from_orm(job) if job is not None else None,
+        reports=[schemas.UserReport.from_orm(x) for x in rows],
+    )
+
+
+@app.get("/api/fleet/summary", response_model=schemas.FleetSummary)
+def get_fleet_summary(top: int = Query(10, ge=1, le=100), db: Session = Depends(get_db)):
+    """Today's top users by goal completion, users behind goal and completion buckets"""
+    if settings.worker_processes > 1:
+        fleet_index.refresh(db, settings.fleet_refresh_s)
+    return fleet_index.summary(top)
 
 
 @app.get("/api/device/status", response_model=schemas.DeviceStatus)
-def device_status(db: Session = Depends(get_db)):
-    status = crud.get_device_status(db)
-    return schemas.DeviceStatus(connected=status.connected, last_synced=status.last_synced)
+async def device_status(device_id: str | None = None, db: AsyncSession = Depends(get_async_db)):
+    """Whether a device (default: the profile's registered bottle) has been heard from recently"""
+    if device_id is None:
+        profile = await async_crud.get_profile(db)
+        device_id = profile.device_id if profile is not None else None
+    return heartbeats.status(device_id)
+
+
+@app.get("/api/sync/status", response_model=list[schemas.SyncState])
+async def sync_status(db: AsyncSession = Depends(get_async_db)):
+    """Checkpoints of the Firebase -> SQLite mirror, one per registered device"""
+    return [schemas.SyncState.from_orm(x) for x in await async_crud.get_sync_states(db)]
+
+
+# Device ids are forwarded to Firebase as keys, so ids it would refuse are turned away here
+DeviceIdPath = Annotated[str, Path(pattern=schemas.DEVICE_ID_PATTERN)]
+
+
+@app.post("/api/ingest/{device_id}/weights", response_model=schemas.WeightIngestResult)
+def ingest_weights(device_id: DeviceIdPath, payload: schemas.WeightSamplesUpload, db: Session = Depends(get_db)):
+    """Turn raw load-cell weight samples into sip events and record them as intake"""
+    profile = crud.get_profile_by_device(db, device_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Device not registered")
+    heartbeats.observe(device_id)
+    samples = [(sample.weight_g, sample.timestamp) for sample in payload.samples]
+    events = ingest.ingest_weight_samples(db, device_id, profile.id, samples)
+    return schemas.WeightIngestResult(
+        events=[schemas.SipEvent.from_orm(x) for x in events],
+        intake_ml=sum(x.amount_ml for x in events if x.kind == "sip"),
+        baseline_g=ingest.detector_for(device_id).baseline_g,
+    )
+
+
+@app.post("/api/ingest/{device_id}/readings", response_model=schemas.ReadingIngestResult)
+def ingest_reading(device_id: DeviceIdPath, payload: schemas.DeviceReadingUpload, db: Session = Depends(get_db)):
+    """Record a device reading locally, then forward it to Firebase in the next batched write"""
+    profile = crud.get_profile_by_device(db, device_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Device not registered")
+    heartbeats.observe(device_id)
+    intake_ml = ingest.ingest_reading(
+        db, device_id, profile.id, payload.currentWeight, payload.totalWaterDrank,
+        timestamp=payload.timestamp, battery_pct=payload.batteryLevel, temperature_c=payload.temperature,
+    )
+    forwarded = settings.firebase_write_enabled
+    if forwarded:
+        firebase_writer.enqueue(device_id, payload.model_dump(exclude_none=True))
+    return schemas.ReadingIngestResult(intake_ml=intake_ml, forwarded=forwarded)
+
+
+async def raw_body(request: Request) -> bytes:
+    return await request.body()
+
+
+@app.post("/api/ingest/{device_id}/batch", response_model=schemas.BatchIngestResult)
+def ingest_batch(device_id: DeviceIdPath, body: bytes = Depends(raw_body), db: Session = Depends(get_db)):
+    """Bulk-ingest a packed binary frame of device readings (see app/frames.py for the layout)"""
+    profile = crud.get_profile_by_device(db, device_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Device not registered")
+    heartbeats.observe(device_id)
+    try:
+        readings, intake_ml = ingest.ingest_frame(db, device_id, profile.id, body)
+    except FrameError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return schemas.BatchIngestResult(readings=readings, intake_ml=intake_ml)
+
+
+@app.get("/api/admin/admission")
+def admission_status():
+    """Concurrency limiter and per-route budget usage"""
+    return {**admission_stats([firebase_service.limiter]), "write_behind": firebase_writer.stats()}
+
+
+@app.get("/api/admin/hot-cache")
+def hot_cache_status():
+    """Recent-intake ring buffer occupancy and hit rate"""
+    return hot_cache.stats()
+
+
+@app.get("/api/admin/heartbeats")
+def heartbeat_status():
+    """Devices by presence state and pending last-seen writes"""
+    return heartbeats.stats()
+
+
+@app.get("/api/admin/device-snapshots")
+def device_snapshot_status():
+    """Shared device snapshot table occupancy, and this worker's hit rate on it"""
+    return {**snapshot_table.stats(), "refresh_failures": snapshot_refresher.failures}
+
+
+@app.get("/api/admin/reminders")
+def reminder_status():
+    """Reminder scheduler state; only the elected process runs it"""
+    return reminder_scheduler.stats()
+
+
+@app.get("/api/admin/sql")
+def sql_status(
+    sort: str = Query("total_ms", pattern="^(total_ms|calls|mean_ms|max_ms|slow_calls|max_per_request)$"),
+    limit: int = Query(50, ge=1, le=1000),
+):
+    """Per-fingerprint SQL statistics of this worker, with query plans of slow statements"""
+    return query_stats.snapshot(sort, limit)
+
+
+@app.post("/api/admin/sql/reset")
+def sql_reset():
+    """Start this worker's SQL statistics over"""
+    query_stats.reset()
+    return {"reset": True}
+
+
+@app.get("/api/admin/circuit")
+def circuit_status():
+    """Firebase circuit breaker state"""
+    return firebase_service.breaker.stats()
 
 
 # Firebase endpoints for real hardware data
 @app.get("/api/firebase/device/{device_id}", response_model=schemas.FirebaseDeviceData)
-def get_firebase_device_data(device_id: str):
-    """Get current device data from Firebase Realtime Database"""
+def get_firebase_device_data(device_id: str, include_raw: bool = False):
+    """Get current device data from Firebase Realtime Database (include_raw=true adds the whole device node)"""
     try:
-        status = firebase_service.get_hydration_status(device_id)
+        status = firebase_service.get_hydration_status(device_id, include_raw=include_raw)
         return schemas.FirebaseDeviceData(**status)
+    except Overloaded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching Firebase data: {str(e)}")
 
@@ -77,20 +425,23 @@ def get_firebase_device_data(device_id: str):
 def get_firebase_hydration_data(device_id: str):
     """Get hydration data from Firebase for the dashboard"""
     try:
-        current_weight = firebase_service.get_current_weight(device_id)
-        total_water = firebase_service.get_total_water_drank(device_id)
-        is_connected = firebase_service.is_device_connected(device_id)
-        
-        if current_weight is None or total_water is None:
+        # One snapshot for all fields, so weight and total always come from the same reading
+        status = firebase_service.get_hydration_status(device_id)
+        try:
+            current_weight = int(status['currentWeight'])
+            total_water = int(status['totalWaterDrank'])
+        except (KeyError, ValueError, TypeError):
             raise HTTPException(status_code=404, detail="Device data not found or incomplete")
         
         return schemas.HydrationData(
             currentWeight=current_weight,
             totalWaterDrank=total_water,
-            connected=is_connected,
-            lastUpdated=datetime.utcnow().isoformat()
+            connected=status['connected'],
+            lastUpdated=status['lastUpdated'],
+            stale=status['stale'],
+            ageSeconds=status['ageSeconds'],
         )
-    except HTTPException:
+    except (HTTPException, Overloaded):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching hydration data: {str(e)}")
@@ -100,28 +451,29 @@ def get_firebase_hydration_data(device_id: str):
 def get_firebase_intake_ml(device_id: str):
     """Get current water intake in ml from Firebase"""
     try:
-        total_water = firebase_service.get_total_water_drank(device_id)
+        snapshot = firebase_service.get_device_snapshot(device_id)
+        total_water = firebase_service.get_total_water_drank(device_id, snapshot)
         if total_water is None:
             raise HTTPException(status_code=404, detail="Water intake data not found")
         
-        return {"intake_ml": total_water, "timestamp": datetime.utcnow().isoformat()}
-    except HTTPException:
+        return {"intake_ml": total_water, "timestamp": snapshot.fetched_at.isoformat(), "stale": snapshot.stale}
+    except (HTTPException, Overloaded):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching intake data: {str(e)}")
 
 
 @app.get("/api/firebase/prediction/{device_id}", response_model=schemas.Prediction)
-def get_firebase_prediction(device_id: str, db: Session = Depends(get_db)):
+async def get_firebase_prediction(device_id: str, db: AsyncSession = Depends(get_async_db)):
     """Get hydration prediction based on Firebase data and user profile"""
     try:
         # Get user profile for goal calculation
-        profile = crud.get_profile(db)
+        profile = await async_crud.get_profile(db)
         if profile is None:
-            profile = crud.upsert_profile(db, weight_kg=70, age=None, activity_level="moderate")
+            profile = await async_crud.upsert_profile(db, weight_kg=70, age=None, activity_level="moderate")
         
-        # Get current intake from Firebase
-        total_water = firebase_service.get_total_water_drank(device_id)
+        # Get current intake from Firebase (a blocking call: only it takes a threadpool thread)
+        total_water = await run_in_threadpool(firebase_service.get_total_water_drank, device_id)
         if total_water is None:
             raise HTTPException(status_code=404, detail="Water intake data not found")
         
@@ -130,8 +482,8 @@ def get_firebase_prediction(device_id: str, db: Session = Depends(get_db)):
         delta = total_water - goal
         status = "ahead" if delta >= 0 else "behind"
         
-        return schemas.Prediction(goal_ml=goal, intake_ml=total_water, delta_ml=delta, status=status)
-    except HTTPException:
+        return _prediction_with_forecast(profile.id, goal, total_water, delta, status)
+    except (HTTPException, Overloaded):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error calculating prediction: {str(e)}")
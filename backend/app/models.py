@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from datetime import datetime, timezone
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Date, ForeignKey, Index, Float
 from sqlalchemy.sql import func
 from .database import Base
 
@@ -9,6 +10,7 @@ class UserProfile(Base):
     weight_kg = Column(Integer, nullable=False)
     age = Column(Integer, nullable=True)
     activity_level = Column(String(32), nullable=True)
+    device_id = Column(String(64), nullable=True, unique=True, index=True)
 
 
 class IntakeLog(Base):
@@ -16,12 +18,111 @@ class IntakeLog(Base):
     id = Column(Integer, primary_key=True, index=True)
     timestamp = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     intake_ml = Column(Integer, nullable=False)
+    user_id = Column(Integer, ForeignKey("user_profiles.id"), nullable=True)
+
+    __table_args__ = (Index("ix_intake_logs_user_id_timestamp", "user_id", "timestamp"),)
+
+    compacted = False
+
+
+class IntakeDailySummary(Base):
+    """Per-day rollup of intake_logs rows that have aged past the retention window."""
+    __tablename__ = "intake_daily_summaries"
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("user_profiles.id"), nullable=True)
+    total_ml = Column(Integer, nullable=False, default=0)
+    entry_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (Index("ix_intake_daily_summaries_user_id_day", "user_id", "day"),)
+
+    compacted = True
+
+    @property
+    def timestamp(self) -> datetime:
+        return datetime(self.day.year, self.day.month, self.day.day, tzinfo=timezone.utc)
+
+    @property
+    def intake_ml(self) -> int:
+        return self.total_ml
 
 
 class DeviceStatus(Base):
+    """Last time each device was heard from, flushed periodically from the in-memory heartbeat tracker."""
     __tablename__ = "device_status"
     id = Column(Integer, primary_key=True, index=True)
+    # NULL on the legacy single row written before devices were tracked individually
+    device_id = Column(String(64), nullable=True, unique=True, index=True)
     connected = Column(Boolean, default=False)
+    last_seen_at = Column(DateTime(timezone=True), nullable=True)
     last_synced = Column(DateTime(timezone=True), server_default=func.now())
 
 
+class DeviceSyncState(Base):
+    """Checkpoint of the last cumulative reading mirrored from Firebase for a device."""
+    __tablename__ = "device_sync_state"
+    device_id = Column(String(64), primary_key=True)
+    # The device's user at the time; places the checkpoint in the same shard as its intake
+    user_id = Column(Integer, ForeignKey("user_profiles.id"), nullable=True)
+    last_total_ml = Column(Integer, nullable=False, default=0)
+    last_reading_at = Column(DateTime(timezone=True), nullable=True)
+    last_synced_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class DeviceReading(Base):
+    """Raw device telemetry as uploaded in batch frames."""
+    __tablename__ = "device_readings"
+    id = Column(Integer, primary_key=True)
+    device_id = Column(String(64), nullable=False)
+    user_id = Column(Integer, ForeignKey("user_profiles.id"), nullable=True)
+    timestamp = Column(DateTime(timezone=True), nullable=False)
+    weight_g = Column(Integer, nullable=True)
+    total_ml = Column(Integer, nullable=True)
+    battery_pct = Column(Integer, nullable=True)
+    temperature_c = Column(Float, nullable=True)
+
+    __table_args__ = (Index("ix_device_readings_device_id_timestamp", "device_id", "timestamp", unique=True),)
+
+
+class StorageLayout(Base):
+    """Single row: how many intake shards the data is currently split across (changed by reshard.py)."""
+    __tablename__ = "storage_layout"
+    id = Column(Integer, primary_key=True)
+    intake_shards = Column(Integer, nullable=False, default=1)
+
+
+class ReportJob(Base):
+    """A hydration report computation; runs in the report process pool."""
+    __tablename__ = "report_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(16), nullable=False)
+    period_start = Column(Date, nullable=False)
+    status = Column(String(16), nullable=False, default="queued")
+    error = Column(String(500), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (Index("ix_report_jobs_kind_period_start", "kind", "period_start"),)
+
+
+class HydrationReport(Base):
+    """Materialized per-user result of a report job for one week or month."""
+    __tablename__ = "hydration_reports"
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey("report_jobs.id"), nullable=False)
+    kind = Column(String(16), nullable=False)
+    period_start = Column(Date, nullable=False)
+    period_end = Column(Date, nullable=False)
+    user_id = Column(Integer, ForeignKey("user_profiles.id"), nullable=False)
+    days = Column(Integer, nullable=False)
+    total_ml = Column(Integer, nullable=False)
+    avg_daily_ml = Column(Float, nullable=False)
+    goal_ml = Column(Integer, nullable=False)
+    goal_days = Column(Integer, nullable=False)
+    attainment_pct = Column(Float, nullable=False)
+    active_days = Column(Integer, nullable=False)
+    longest_streak = Column(Integer, nullable=False)
+    current_streak = Column(Integer, nullable=False)
+
+    __table_args__ = (Index("ix_hydration_reports_kind_period_start_user_id", "kind", "period_start", "user_id", unique=True),)
@@ -0,0 +1,244 @@
+import re
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .config import settings
+
+_MAX_STATEMENT = 1000
+_OTHER = "<other>"
+# Statements EXPLAIN QUERY PLAN accepts; DDL, PRAGMA and transaction control are skipped
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_ROW_LIST = re.compile(r"\(\?\.\.\.\)(?:\s*,\s*\(\?\.\.\.\))+")
+_SPACE = re.compile(r"\s+")
+_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+# fingerprint -> executions within the current HTTP request (see QueryStatsMiddleware)
+_request_counts: ContextVar[dict[str, int] | None] = ContextVar("request_query_counts", default=None)
+
+
+def fingerprint(statement: str) -> str:
+    """
+    Statement text with literals replaced by ? and placeholder lists collapsed, so the
+    same query with different values or IN-list lengths maps to one fingerprint.
+    """
+    text = _STRING.sub("?", statement)
+    text = _NUMBER.sub("?", text)
+    text = _PLACEHOLDER_LIST.sub("(?...)", text)
+    text = _ROW_LIST.sub("(?...), ...", text)
+    return _SPACE.sub(" ", text).strip()
+
+
+@dataclass
+class QueryStat:
+    fingerprint: str
+    calls: int = 0
+    rows: int = 0  # parameter sets of executemany calls
+    errors: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    slow_calls: int = 0
+    # Largest number of executions within one request, and the request it was seen in
+    max_per_request: int = 0
+    max_per_request_path: str | None = None
+    plan: list[str] | None = None
+    plan_ms: float | None = None
+    plan_at: float | None = None
+
+    @property
+    def full_scans(self) -> list[str]:
+        """Tables the captured plan reads end to end without an index."""
+        return [match.group(1) for line in self.plan or () if (match := _FULL_SCAN.match(line.strip()))]
+
+    @property
+    def temp_sort(self) -> bool:
+        return any("USE TEMP B-TREE" in line for line in self.plan or ())
+
+    def to_dict(self) -> dict:
+        return {
+            "fingerprint": self.fingerprint,
+            "calls": self.calls,
+            "rows": self.rows,
+            "errors": self.errors,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "slow_calls": self.slow_calls,
+            "max_per_request": self.max_per_request,
+            "max_per_request_path": self.max_per_request_path,
+            "plan": self.plan,
+            "plan_ms": round(self.plan_ms, 3) if self.plan_ms is not None else None,
+            "full_scans": self.full_scans,
+            "temp_sort": self.temp_sort,
+        }
+
+
+class QueryStats:
+    """
+    Counts and durations of every SQL statement run on the instrumented engines,
+    aggregated per fingerprint. A statement slower than `explain_ms` has its
+    EXPLAIN QUERY PLAN captured (with the parameters of that slow call) on the same
+    connection, at most once per fingerprint every `explain_ttl_s`. Fingerprints run
+    `repeat_threshold` or more times in one HTTP request are flagged as likely N+1
+    patterns. Beyond `max_fingerprints` distinct fingerprints, new ones are counted
+    under "<other>".
+
+    Stats are per process.
+    """
+
+    def __init__(self, explain_ms: float, explain_ttl_s: float, repeat_threshold: int, max_fingerprints: int):
+        self.explain_ms = explain_ms
+        self.explain_ttl_s = explain_ttl_s
+        self.repeat_threshold = repeat_threshold
+        self.max_fingerprints = max_fingerprints
+        self._lock = threading.Lock()
+        self._stats: dict[str, QueryStat] = {}
+        # Statement strings repeat (compiled SQL is cached), so fingerprints are memoised
+        self._fingerprints: dict[str, str] = {}
+        self.since = time.time()
+
+    def instrument(self, engine: Engine) -> None:
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            if context is not None:
+                context._query_stats = (time.perf_counter(), self._fingerprint(statement), len(parameters) if executemany else 0)
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            pending = getattr(context, "_query_stats", None)
+            if pending is None:
+                return
+            started, fp, rows = pending
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            stat = self._record(fp, rows, elapsed_ms, error=False)
+            if elapsed_ms >= self.explain_ms and self._plan_due(stat):
+                self._explain(conn, stat, statement, parameters[0] if executemany else parameters)
+
+        @event.listens_for(engine, "handle_error")
+        def _error(exception_context):
+            pending = getattr(exception_context.execution_context, "_query_stats", None)
+            if pending is not None:
+                started, fp, rows = pending
+                self._record(fp, rows, (time.perf_counter() - started) * 1000, error=True)
+
+    def snapshot(self, sort: str = "total_ms", limit: int = 50) -> dict:
+        with self._lock:
+            stats = [stat.to_dict() for stat in self._stats.values()]
+        stats.sort(key=lambda stat: stat.get(sort) or 0, reverse=True)
+        return {
+            "since": self.since,
+            "fingerprints": len(stats),
+            "calls": sum(stat["calls"] for stat in stats),
+            "explain_ms": self.explain_ms,
+            "repeat_threshold": self.repeat_threshold,
+            "full_scans": sorted({table for stat in stats for table in stat["full_scans"]}),
+            "repeated": [stat["fingerprint"] for stat in stats if stat["max_per_request"] >= self.repeat_threshold],
+            "statements": stats[:limit],
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats = {}
+            self.since = time.time()
+
+    def _fingerprint(self, statement: str) -> str:
+        fp = self._fingerprints.get(statement)
+        if fp is None:
+            fp = fingerprint(statement)[:_MAX_STATEMENT]
+            if len(self._fingerprints) >= 4 * self.max_fingerprints:
+                self._fingerprints.clear()
+            self._fingerprints[statement] = fp
+        return fp
+
+    def _record(self, fp: str, rows: int, elapsed_ms: float, error: bool) -> QueryStat:
+        with self._lock:
+            stat = self._stats.get(fp)
+            if stat is None:
+                key = fp if len(self._stats) < self.max_fingerprints else _OTHER
+                stat = self._stats.setdefault(key, QueryStat(key))
+            stat.calls += 1
+            stat.rows += rows
+            stat.errors += error
+            stat.total_ms += elapsed_ms
+            stat.max_ms = max(stat.max_ms, elapsed_ms)
+            stat.slow_calls += elapsed_ms >= self.explain_ms
+        counts = _request_counts.get()
+        if counts is not None:
+            counts[stat.fingerprint] = counts.get(stat.fingerprint, 0) + 1
+        return stat
+
+    def _plan_due(self, stat: QueryStat) -> bool:
+        if stat.fingerprint == _OTHER or not stat.fingerprint.upper().startswith(_EXPLAINABLE):
+            return False
+        with self._lock:
+            if stat.plan_at is not None and time.time() - stat.plan_at < self.explain_ttl_s:
+                return False
+            # Claimed before running, so concurrent slow calls don't all explain
+            stat.plan_at = time.time()
+        return True
+
+    def _explain(self, conn, stat: QueryStat, statement: str, parameters) -> None:
+        # Straight on the DBAPI connection: no events fire, and the explain sees the same
+        # transaction and attached state as the statement did. A DBAPI cursor rather than
+        # sqlite3's Connection.execute, so the aiosqlite adapter works too
+        started = time.perf_counter()
+        try:
+            cursor = conn.connection.dbapi_connection.cursor()
+            try:
+                cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+        except Exception as e:
+            plan = [f"EXPLAIN failed: {type(e).__name__}: {e}"]
+        else:
+            depth: dict[int, int] = {0: -1}
+            plan = []
+            for node_id, parent, _, detail in rows:
+                depth[node_id] = depth.get(parent, -1) + 1
+                plan.append("  " * depth[node_id] + detail)
+        with self._lock:
+            stat.plan = plan
+            stat.plan_ms = (time.perf_counter() - started) * 1000
+
+    def observe_request(self, counts: dict[str, int], path: str) -> None:
+        with self._lock:
+            for fp, count in counts.items():
+                stat = self._stats.get(fp)
+                if stat is not None and count > stat.max_per_request:
+                    stat.max_per_request = count
+                    stat.max_per_request_path = path
+
+
+class QueryStatsMiddleware:
+    """Pure ASGI middleware counting statements per fingerprint within each HTTP request (for N+1 detection)."""
+
+    def __init__(self, app, stats: QueryStats):
+        self.app = app
+        self.stats = stats
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        counts: dict[str, int] = {}
+        token = _request_counts.set(counts)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_counts.reset(token)
+            if counts:
+                self.stats.observe_request(counts, f"{scope['method']} {scope['path']}")
+
+
+query_stats = QueryStats(
+    settings.sql_explain_ms, settings.sql_explain_ttl_s, settings.sql_repeat_threshold, settings.sql_max_fingerprints
+)
@@ -0,0 +1,292 @@
+import heapq
+import json
+import logging
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Protocol
+
+import numpy as np
+import requests
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import crud, models
+from .config import settings
+from .database import SessionLocal
+from .forecast import SECONDS_PER_DAY, ForecastEngine, forecast_engine
+from .leaderboard import ML_PER_KG
+from .workers import PeriodicWorker
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Reminder:
+    user_id: int
+    total_ml: int
+    expected_ml: int
+    goal_ml: int
+    created_at: datetime
+
+    @property
+    def deficit_ml(self) -> int:
+        return self.expected_ml - self.total_ml
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "deficit_ml": self.deficit_ml, "created_at": self.created_at.isoformat()}
+
+
+class ReminderSink(Protocol):
+    """Where reminders go. `send` gets every reminder of one scheduler tick and raises if delivery failed."""
+
+    def send(self, reminders: list[Reminder]) -> None: ...
+
+
+class LogSink:
+    def send(self, reminders: list[Reminder]) -> None:
+        for reminder in reminders:
+            logger.info(
+                f"Reminder for user {reminder.user_id}: {reminder.total_ml}ml of {reminder.expected_ml}ml expected by now"
+            )
+
+
+class FileSink:
+    """Appends one JSON object per reminder to `path`."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, reminders: list[Reminder]) -> None:
+        lines = "".join(json.dumps(reminder.as_dict()) + "\n" for reminder in reminders)
+        with self._lock, open(self.path, "a", encoding="utf-8") as handle:
+            handle.write(lines)
+
+
+class WebhookSink:
+    """POSTs {"reminders": [...]} to `url`, one request per tick."""
+
+    def __init__(self, url: str, timeout_s: float):
+        self.url = url
+        self.timeout_s = timeout_s
+        self._session = requests.Session()
+
+    def send(self, reminders: list[Reminder]) -> None:
+        response = self._session.post(
+            self.url, json={"reminders": [reminder.as_dict() for reminder in reminders]}, timeout=self.timeout_s
+        )
+        response.raise_for_status()
+
+
+def make_sink(kind: str) -> ReminderSink:
+    if kind == "log":
+        return LogSink()
+    if kind == "file":
+        return FileSink(settings.reminder_file)
+    if kind == "webhook":
+        if not settings.reminder_webhook_url:
+            raise ValueError("HYDRATION_REMINDER_WEBHOOK_URL is required for the webhook reminder sink")
+        return WebhookSink(settings.reminder_webhook_url, settings.reminder_webhook_timeout_s)
+    raise ValueError(f"Unknown reminder sink: {kind}")
+
+
+def behind_at(expected: np.ndarray, totals: np.ndarray, deficit_ml: float) -> np.ndarray:
+    """
+    Fractional hour of the day at which each user falls `deficit_ml` behind if they
+    drink nothing more, inf if they don't today. `expected[i, h]` is user i's expected
+    cumulative intake by the end of hour h (non-decreasing, linear within the hour).
+    """
+    target = totals + deficit_ml
+    reached = expected >= target[:, None]
+    hour = reached.argmax(axis=1)
+    rows = np.arange(len(totals))
+    end = expected[rows, hour]
+    start = np.where(hour > 0, expected[rows, hour - 1], 0.0)
+    fraction = np.clip((target - start) / np.maximum(end - start, 1e-9), 0.0, 1.0)
+    return np.where(reached.any(axis=1), hour + fraction, np.inf)
+
+
+class ReminderScheduler(PeriodicWorker):
+    """
+    "You're behind" nudges for every user. Each user has one pending check in a heap
+    keyed by due time; a tick pops the users that are due and evaluates them together,
+    a batch at a time: one grouped query for today's totals and array arithmetic against
+    each user's expected-by-now curve (their usual hourly share of a day's intake, from
+    the forecast profiles, scaled to their goal).
+
+    Users who are behind by `deficit_ml` are sent a reminder and checked again after
+    `cooldown_s`. Everyone else is checked again when their curve says they will fall
+    behind if they drink nothing until then; drinking only pushes that point later, so
+    no check is missed. Checks are capped at `max_check_interval_s` ahead so goal and
+    profile changes are picked up. Users are reloaded from user_profiles every
+    `users_refresh_s`.
+
+    Runs in the elected process only. Reminder history is not persisted: a process
+    taking over may nudge a user again before their cooldown is over. The sink is built
+    from `sink_kind` on start, so a misconfigured sink only matters where reminders run.
+    """
+
+    name = "reminders"
+
+    def __init__(
+        self,
+        sink_kind: str,
+        forecasts: ForecastEngine,
+        interval_s: float,
+        deficit_ml: int,
+        cooldown_s: float,
+        max_check_interval_s: float,
+        batch_size: int,
+        users_refresh_s: float,
+    ):
+        super().__init__(interval_s)
+        self.sink_kind = sink_kind
+        self.sink: ReminderSink | None = None
+        self.forecasts = forecasts
+        self.deficit_ml = deficit_ml
+        self.cooldown_s = cooldown_s
+        self.max_check_interval_s = max_check_interval_s
+        self.batch_size = batch_size
+        self.users_refresh_s = users_refresh_s
+        self._lock = threading.Lock()
+        self._goals: dict[int, int] = {}
+        # (due epoch seconds, user_id); entries that no longer match _due are stale and skipped
+        self._heap: list[tuple[float, int]] = []
+        self._due: dict[int, float] = {}
+        self._users_loaded_at: float | None = None
+        self.evaluated = 0
+        self.sent = 0
+        self.failed = 0
+        self.last_tick_ms = 0.0
+
+    def start(self) -> None:
+        if self.sink is None:
+            self.sink = make_sink(self.sink_kind)
+        super().start()
+
+    def run_once(self) -> None:
+        started = time.perf_counter()
+        now = time.time()
+        db = SessionLocal()
+        try:
+            if self._users_loaded_at is None or now - self._users_loaded_at >= self.users_refresh_s:
+                self.load_users(db, now)
+            due = self._pop_due(now)
+            reminders = []
+            for offset in range(0, len(due), self.batch_size):
+                try:
+                    reminders += self.evaluate(db, due[offset:offset + self.batch_size], now)
+                except Exception:
+                    # Popped users must not drop out of the schedule: retry them next tick
+                    with self._lock:
+                        for user_id in due[offset:]:
+                            if user_id in self._goals:
+                                self._schedule(user_id, now + self.interval_s)
+                    raise
+        finally:
+            db.close()
+        if reminders:
+            try:
+                self.sink.send(reminders)
+                self.sent += len(reminders)
+            except Exception as e:
+                self.failed += len(reminders)
+                logger.error(f"Delivering {len(reminders)} reminders failed: {e}")
+        self.last_tick_ms = (time.perf_counter() - started) * 1000
+
+    def load_users(self, db: Session, now: float) -> None:
+        """Sync goals with user_profiles; new users and users whose goal changed are checked right away."""
+        goals = {
+            user_id: int(round(weight_kg * ML_PER_KG))
+            for user_id, weight_kg in db.execute(select(models.UserProfile.id, models.UserProfile.weight_kg)).all()
+        }
+        with self._lock:
+            for user_id in self._goals.keys() - goals.keys():
+                self._due.pop(user_id, None)
+            changed = [user_id for user_id, goal in goals.items() if self._goals.get(user_id) != goal]
+            self._goals = goals
+            for user_id in changed:
+                self._schedule(user_id, now)
+            self._users_loaded_at = now
+
+    def evaluate(self, db: Session, user_ids: list[int], now: float) -> list[Reminder]:
+        """Check one batch of users, reschedule each of them, and return the reminders to send."""
+        totals_by_user = crud.get_today_totals(db, user_ids)
+        with self._lock:
+            goals = np.fromiter((self._goals.get(uid, 0) for uid in user_ids), dtype=np.float64, count=len(user_ids))
+        totals = np.fromiter((totals_by_user.get(uid, 0) for uid in user_ids), dtype=np.float64, count=len(user_ids))
+        expected = self.forecasts.share_curves(user_ids) * goals[:, None]
+
+        day_start = now - now % SECONDS_PER_DAY
+        position = (now - day_start) / 3600
+        hours = behind_at(expected, totals, self.deficit_ml)
+        behind = (hours <= position) & (goals > 0)
+        # Expected-by-now at this moment, for the reminder text
+        hour = min(int(position), expected.shape[1] - 1)
+        previous = expected[:, hour - 1] if hour > 0 else 0.0
+        expected_now = previous + (expected[:, hour] - previous) * (position - hour)
+
+        # Falls behind at day_start + hours; past midnight a new day starts from zero
+        next_check = np.where(np.isfinite(hours), day_start + hours * 3600, day_start + SECONDS_PER_DAY)
+        next_check = np.where(behind, now + self.cooldown_s, np.minimum(next_check, now + self.max_check_interval_s))
+        next_check = np.maximum(next_check, now + self.interval_s)
+
+        created_at = datetime.fromtimestamp(now, tz=timezone.utc)
+        reminders = [
+            Reminder(user_ids[i], int(totals[i]), int(round(expected_now[i])), int(goals[i]), created_at)
+            for i in np.flatnonzero(behind).tolist()
+        ]
+        with self._lock:
+            for user_id, due in zip(user_ids, next_check.tolist()):
+                if user_id in self._goals:
+                    self._schedule(user_id, due)
+        self.evaluated += len(user_ids)
+        return reminders
+
+    def stats(self) -> dict:
+        with self._lock:
+            next_due = min(self._due.values(), default=None)
+            users, queued = len(self._goals), len(self._heap)
+        return {
+            "running": self.running,
+            "sink": self.sink_kind,
+            "users": users,
+            "queued": queued,
+            "next_check_in_s": round(max(next_due - time.time(), 0.0), 1) if next_due is not None else None,
+            "evaluated": self.evaluated,
+            "sent": self.sent,
+            "failed": self.failed,
+            "last_tick_ms": round(self.last_tick_ms, 2),
+        }
+
+    def _schedule(self, user_id: int, due: float) -> None:
+        self._due[user_id] = due
+        heapq.heappush(self._heap, (due, user_id))
+
+    def _pop_due(self, now: float) -> list[int]:
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                at, user_id = heapq.heappop(self._heap)
+                if self._due.get(user_id) == at:
+                    del self._due[user_id]
+                    due.append(user_id)
+            if len(self._heap) > 2 * len(self._due) + 1024:
+                # Rescheduling leaves stale entries behind; drop them once they dominate
+                self._heap = [(at, user_id) for user_id, at in self._due.items()]
+                heapq.heapify(self._heap)
+        return due
+
+
+reminder_scheduler = ReminderScheduler(
+    settings.reminder_sink,
+    forecast_engine,
+    settings.reminder_tick_s,
+    settings.reminder_deficit_ml,
+    settings.reminder_cooldown_s,
+    settings.reminder_max_check_interval_s,
+    settings.reminder_batch_size,
+    settings.reminder_users_refresh_s,
+)
@@ -0,0 +1,101 @@
+"""
+Device reporting policy: decides when a bottle transmits a reading.
+
+Sending the full reading on a fixed schedule costs one upstream write per tick even
+while the bottle sits untouched. `ReportingPolicy` models the firmware rule instead:
+
+- deadband: a reading goes out as soon as the weight or the cumulative total has moved
+  more than `weight_deadband_g` / `total_deadband_ml` from the last reading sent
+- heartbeat: otherwise one reading every `heartbeat_s`, so the backend keeps the device
+  online (keep it below HYDRATION_DEVICE_OFFLINE_TIMEOUT_S)
+- adaptive rate: the bottle samples every `fast_interval_s` while someone is drinking,
+  and after `burst_hold_s` without a change backs off, doubling the interval up to
+  `slow_interval_s`
+
+Pure stdlib so the hardware simulators can use it, like app.loadcell.
+"""
+from dataclasses import dataclass
+
+CHANGE, HEARTBEAT = "change", "heartbeat"
+
+
+@dataclass
+class ReportingConfig:
+    weight_deadband_g: float = 10.0
+    total_deadband_ml: int = 10
+    heartbeat_s: float = 300.0
+    fast_interval_s: float = 2.0
+    slow_interval_s: float = 30.0
+    burst_hold_s: float = 60.0
+
+
+@dataclass
+class ReportingStats:
+    samples: int = 0
+    changes: int = 0
+    heartbeats: int = 0
+
+    @property
+    def sent(self) -> int:
+        return self.changes + self.heartbeats
+
+    @property
+    def suppressed(self) -> int:
+        return self.samples - self.sent
+
+    def as_dict(self) -> dict:
+        return {"samples": self.samples, "sent": self.sent, "changes": self.changes,
+                "heartbeats": self.heartbeats, "suppressed": self.suppressed}
+
+
+class ReportingPolicy:
+    """
+    Feed it every sample with `decide(weight_g, total_ml, now)`; it returns CHANGE or
+    HEARTBEAT when the sample should be transmitted, None when it can be dropped. Call
+    `sent()` once a transmission succeeded so a failed one is retried on the next sample.
+    `next_interval(now)` is how long to wait before taking the next sample. `now` is any
+    monotonic clock in seconds (time.monotonic() or a simulated one).
+    """
+
+    def __init__(self, config: ReportingConfig | None = None):
+        self.config = config or ReportingConfig()
+        self.stats = ReportingStats()
+        self._sent_weight: float | None = None
+        self._sent_total: int | None = None
+        self._sent_at: float | None = None
+        self._changed_at: float | None = None
+        self._interval = self.config.slow_interval_s
+
+    def decide(self, weight_g: float, total_ml: int, now: float) -> str | None:
+        config = self.config
+        self.stats.samples += 1
+        if self._sent_at is None:
+            reason = CHANGE
+        elif (abs(weight_g - self._sent_weight) > config.weight_deadband_g
+              or abs(total_ml - self._sent_total) > config.total_deadband_ml):
+            reason = CHANGE
+        elif now - self._sent_at >= config.heartbeat_s:
+            reason = HEARTBEAT
+        else:
+            return None
+        if reason == CHANGE:
+            self._changed_at = now
+        return reason
+
+    def sent(self, reason: str, weight_g: float, total_ml: int, now: float) -> None:
+        if reason == CHANGE:
+            self.stats.changes += 1
+        else:
+            self.stats.heartbeats += 1
+        self._sent_weight, self._sent_total, self._sent_at = weight_g, total_ml, now
+
+    def next_interval(self, now: float) -> float:
+        config = self.config
+        if self._changed_at is not None and now - self._changed_at < config.burst_hold_s:
+            self._interval = config.fast_interval_s
+        else:
+            self._interval = min(self._interval * 2, config.slow_interval_s)
+        if self._sent_at is None:
+            return self._interval
+        # Wake up in time for the heartbeat rather than sleeping past it
+        return min(self._interval, max(config.fast_interval_s, self._sent_at + config.heartbeat_s - now))
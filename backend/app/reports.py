@@ -0,0 +1,265 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime, timedelta, timezone
+from functools import partial
+from itertools import chain
+
+import numpy as np
+from sqlalchemy import Integer, cast, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+from .database import SessionLocal
+from .leaderboard import ML_PER_KG
+from .workers import PeriodicWorker
+
+logger = logging.getLogger(__name__)
+
+REPORT_KINDS = ("weekly", "monthly")
+SECONDS_PER_DAY = 86400
+EPOCH = date(1970, 1, 1)
+
+
+def period_bounds(kind: str, day: date) -> tuple[date, date]:
+    """[start, end) of the week (Monday first) or calendar month containing `day`."""
+    if kind == "weekly":
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=7)
+    if kind == "monthly":
+        start = day.replace(day=1)
+        return start, (start + timedelta(days=32)).replace(day=1)
+    raise ValueError(f"Unknown report kind: {kind}")
+
+
+def load_daily_columns(db: Session, start: date, end: date) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Bulk-read (user_id, epoch day, ml) for attributed intake in [start, end), from raw
+    rows and from daily summaries of compacted days. Day numbers come out of SQLite.
+    """
+    log, summary = models.IntakeLog, models.IntakeDailySummary
+    since = datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
+    until = datetime(end.year, end.month, end.day, tzinfo=timezone.utc)
+    raw = db.execute(
+        select(log.user_id, cast(func.strftime("%s", log.timestamp), Integer) // SECONDS_PER_DAY, log.intake_ml).where(
+            log.timestamp >= since, log.timestamp < until, log.user_id.is_not(None)
+        )
+    ).all()
+    compacted = db.execute(
+        select(summary.user_id, cast(func.strftime("%s", summary.day), Integer) // SECONDS_PER_DAY, summary.total_ml).where(
+            summary.day >= start, summary.day < end, summary.user_id.is_not(None)
+        )
+    ).all()
+    count = len(raw) + len(compacted)
+    data = np.fromiter(chain.from_iterable(chain(raw, compacted)), dtype=np.int64, count=3 * count).reshape(-1, 3)
+    return data[:, 0], data[:, 1], data[:, 2]
+
+
+def compute_reports(
+    user_ids: np.ndarray, days: np.ndarray, intake_ml: np.ndarray,
+    profile_ids: np.ndarray, goals_ml: np.ndarray, first_day: int, n_days: int,
+) -> dict[str, np.ndarray]:
+    """
+    Vectorised per-user report metrics over `n_days` days starting at epoch day `first_day`.
+    One row per entry of `profile_ids` (sorted); intake of other users is ignored.
+    """
+    n = len(profile_ids)
+    rows = np.searchsorted(profile_ids, user_ids)
+    known = (rows < n) & (profile_ids[np.minimum(rows, n - 1)] == user_ids) if n else np.zeros(len(user_ids), dtype=bool)
+    offsets = days - first_day
+    known &= (offsets >= 0) & (offsets < n_days)
+    daily = np.bincount(
+        rows[known] * n_days + offsets[known], weights=intake_ml[known], minlength=n * n_days
+    ).reshape(n, n_days)
+
+    met = daily >= goals_ml[:, None]
+    # Length of the goal streak ending on each day: running count, reset wherever the goal was missed
+    running = np.cumsum(met, axis=1)
+    streaks = running - np.maximum.accumulate(np.where(met, 0, running), axis=1)
+    total = daily.sum(axis=1)
+    goal_days = met.sum(axis=1)
+    return {
+        "user_id": profile_ids,
+        "total_ml": total.astype(np.int64),
+        "avg_daily_ml": total / n_days if n_days else np.zeros(n),
+        "goal_ml": goals_ml,
+        "goal_days": goal_days,
+        "attainment_pct": goal_days / n_days * 100 if n_days else np.zeros(n),
+        "active_days": (daily > 0).sum(axis=1),
+        "longest_streak": streaks.max(axis=1) if n_days else np.zeros(n, dtype=np.int64),
+        "current_streak": streaks[:, -1] if n_days else np.zeros(n, dtype=np.int64),
+    }
+
+
+def run_report_job(job_id: int, kind: str, period_start: date) -> int:
+    """
+    Entry point executed in a pool process: compute one period for every user and
+    replace its materialized rows. Runs entirely on its own database connection.
+    Returns:
+        Number of user reports written
+    """
+    db = SessionLocal()
+    try:
+        job = models.ReportJob
+        db.execute(update(job).where(job.id == job_id).values(status="running", started_at=datetime.now(timezone.utc)))
+        db.commit()
+
+        start, end = period_bounds(kind, period_start)
+        today = datetime.now(timezone.utc).date()
+        # A period still in progress is reported up to and including today
+        last = min(end, today + timedelta(days=1))
+        n_days = max((last - start).days, 0)
+
+        profiles = db.execute(select(models.UserProfile.id, models.UserProfile.weight_kg).order_by(models.UserProfile.id)).all()
+        profile_ids = np.fromiter((uid for uid, _ in profiles), dtype=np.int64, count=len(profiles))
+        goals = np.fromiter((round(kg * ML_PER_KG) for _, kg in profiles), dtype=np.int64, count=len(profiles))
+        metrics = compute_reports(
+            *load_daily_columns(db, start, end), profile_ids, goals, (start - EPOCH).days, n_days
+        )
+
+        columns = {name: values.tolist() for name, values in metrics.items()}
+        rows = [
+            {
+                "job_id": job_id, "kind": kind, "period_start": start, "period_end": end - timedelta(days=1), "days": n_days,
+                **{name: columns[name][i] for name in columns},
+            }
+            for i in range(len(profiles))
+        ]
+        report = models.HydrationReport
+        db.execute(delete(report).where(report.kind == kind, report.period_start == start))
+        if rows:
+            # Core executemany: the ORM bulk insert path is unavailable on a sharded session
+            db.connection().execute(insert(report), rows)
+        db.execute(update(job).where(job.id == job_id).values(status="done", finished_at=datetime.now(timezone.utc)))
+        db.commit()
+        return len(rows)
+    finally:
+        db.close()
+
+
+class ReportJobRunner:
+    """
+    Submits report jobs to a process pool so report maths never runs on the API
+    process's threads (or holds its GIL). Job rows track status; the pool process
+    updates them itself and the parent only records failures it sees from outside
+    (exceptions, crashed workers).
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def submit(self, db: Session, kind: str, period_start: date) -> models.ReportJob:
+        start, _ = period_bounds(kind, period_start)
+        job = models.ReportJob(kind=kind, period_start=start, status="queued")
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        future = self._pool().submit(run_report_job, job.id, kind, start)
+        future.add_done_callback(partial(self._finished, job.id))
+        return job
+
+    def recover(self, db: Session) -> int:
+        """Fail jobs left queued or running by a previous process. Returns number of jobs."""
+        job = models.ReportJob
+        result = db.execute(
+            update(job)
+            .where(job.status.in_(("queued", "running")))
+            .values(status="failed", error="Interrupted by restart", finished_at=datetime.now(timezone.utc))
+        )
+        db.commit()
+        return result.rowcount
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that runs server and worker threads is unsafe
+                self._executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _finished(self, job_id: int, future: Future) -> None:
+        if future.cancelled():
+            error = "Cancelled"
+        else:
+            exc = future.exception()
+            if exc is None:
+                return
+            error = f"{type(exc).__name__}: {exc}"
+            if isinstance(exc, BrokenProcessPool):
+                # A crashed worker poisons the whole pool; start a fresh one on next submit
+                self.shutdown()
+        logger.error(f"Report job {job_id} failed: {error}")
+        db = SessionLocal()
+        try:
+            job = models.ReportJob
+            db.execute(
+                update(job).where(job.id == job_id).values(status="failed", error=error[:500], finished_at=datetime.now(timezone.utc))
+            )
+            db.commit()
+        finally:
+            db.close()
+
+
+def get_job(db: Session, job_id: int) -> models.ReportJob | None:
+    return db.get(models.ReportJob, job_id)
+
+
+def get_reports(
+    db: Session, kind: str, period_start: date | None = None, user_id: int | None = None
+) -> tuple[models.ReportJob | None, list[models.HydrationReport]]:
+    """Materialized rows of a period (the latest computed one if not given) and the job that produced them."""
+    report = models.HydrationReport
+    if period_start is None:
+        period_start = db.execute(select(func.max(report.period_start)).where(report.kind == kind)).scalar_one()
+        if period_start is None:
+            return None, []
+    else:
+        period_start, _ = period_bounds(kind, period_start)
+    query = select(report).where(report.kind == kind, report.period_start == period_start).order_by(report.user_id)
+    if user_id is not None:
+        query = query.where(report.user_id == user_id)
+    rows = list(db.execute(query).scalars().all())
+    job = db.get(models.ReportJob, rows[0].job_id) if rows else None
+    return job, rows
+
+
+class ReportScheduler(PeriodicWorker):
+    """Makes sure the last completed week and month have been reported."""
+
+    name = "report-scheduler"
+
+    def __init__(self, runner: ReportJobRunner, interval_s: float):
+        super().__init__(interval_s)
+        self.runner = runner
+
+    def run_once(self) -> None:
+        today = datetime.now(timezone.utc).date()
+        db = SessionLocal()
+        try:
+            for kind in REPORT_KINDS:
+                current_start, _ = period_bounds(kind, today)
+                previous_start, _ = period_bounds(kind, current_start - timedelta(days=1))
+                job = models.ReportJob
+                exists = db.execute(
+                    select(job.id).where(
+                        job.kind == kind, job.period_start == previous_start, job.status.in_(("queued", "running", "done"))
+                    )
+                ).first()
+                if exists is None:
+                    self.runner.submit(db, kind, previous_start)
+        finally:
+            db.close()
+
+
+report_runner = ReportJobRunner(settings.report_workers)
+report_scheduler = ReportScheduler(report_runner, settings.report_schedule_interval_s)
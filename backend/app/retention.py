@@ -0,0 +1,136 @@
+import logging
+import threading
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import select, delete
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+from .database import SessionLocal, intake_engines
+from .workers import PeriodicWorker
+
+logger = logging.getLogger(__name__)
+
+
+def retention_cutoff(retention_days: int, today: date | None = None) -> datetime:
+    """
+    Start of the oldest day that is kept as raw rows.
+    Cutting on a day boundary means a day is never split between raw rows and its summary.
+    """
+    if retention_days < 1:
+        raise ValueError("retention_days must be at least 1 so today's rows are never compacted")
+    today = today or datetime.now(timezone.utc).date()
+    oldest_kept = today - timedelta(days=retention_days)
+    return datetime(oldest_kept.year, oldest_kept.month, oldest_kept.day, tzinfo=timezone.utc)
+
+
+def compact_chunk(db: Session, cutoff: datetime, chunk_size: int) -> int:
+    """
+    Roll up to `chunk_size` raw intake rows older than `cutoff` into daily summaries
+    and delete them, all in one short transaction.
+    Returns:
+        Number of raw rows compacted (0 when nothing is left to do)
+    """
+    rows = db.execute(
+        select(models.IntakeLog.id, models.IntakeLog.timestamp, models.IntakeLog.intake_ml, models.IntakeLog.user_id)
+        .where(models.IntakeLog.timestamp < cutoff)
+        .order_by(models.IntakeLog.timestamp, models.IntakeLog.id)
+        .limit(chunk_size)
+    ).all()
+    if not rows:
+        return 0
+
+    per_day: dict[tuple[int | None, date], list[int]] = defaultdict(lambda: [0, 0])
+    for _, timestamp, intake_ml, user_id in rows:
+        bucket = per_day[(user_id, timestamp.date())]
+        bucket[0] += intake_ml
+        bucket[1] += 1
+
+    summary = models.IntakeDailySummary
+    for (user_id, day), (total_ml, entry_count) in per_day.items():
+        # Manual upsert: user_id may be NULL for unattributed intake, which a
+        # UNIQUE/ON CONFLICT target would treat as always distinct.
+        existing = db.execute(
+            select(summary).where(summary.day == day, summary.user_id.is_not_distinct_from(user_id))
+        ).scalars().first()
+        if existing is None:
+            db.add(summary(day=day, user_id=user_id, total_ml=total_ml, entry_count=entry_count))
+        else:
+            existing.total_ml += total_ml
+            existing.entry_count += entry_count
+    db.flush()
+
+    db.execute(delete(models.IntakeLog).where(models.IntakeLog.id.in_([row.id for row in rows])))
+    db.commit()
+    return len(rows)
+
+
+def reclaim_space(bind: Engine, pages: int) -> None:
+    """Release up to `pages` free pages back to the filesystem (needs auto_vacuum=INCREMENTAL)."""
+    raw = bind.raw_connection()
+    try:
+        sqlite_connection = raw.driver_connection
+        mode = sqlite_connection.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if mode != 2:
+            logger.debug("auto_vacuum is not INCREMENTAL; skipping space reclamation")
+            return
+        # incremental_vacuum frees one page per VM step, so it has to be run to
+        # completion with executescript rather than a single cursor.execute.
+        sqlite_connection.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+    finally:
+        raw.close()
+
+
+def run_retention(
+    db: Session,
+    retention_days: int | None = None,
+    chunk_size: int | None = None,
+    pause_s: float | None = None,
+    stop_event: threading.Event | None = None,
+) -> int:
+    """
+    Compact every raw row older than the retention window, one bounded chunk at a time.
+    Between chunks the write lock is released (and we optionally pause) so live
+    ingest and reads are never queued behind the whole job.
+    Returns:
+        Total number of raw rows compacted
+    """
+    retention_days = settings.retention_days if retention_days is None else retention_days
+    chunk_size = chunk_size or settings.retention_chunk_size
+    pause_s = settings.retention_chunk_pause_s if pause_s is None else pause_s
+    stop_event = stop_event or threading.Event()
+
+    cutoff = retention_cutoff(retention_days)
+    compacted = 0
+    while not stop_event.is_set():
+        count = compact_chunk(db, cutoff, chunk_size)
+        if count == 0:
+            break
+        compacted += count
+        for bind in intake_engines:
+            reclaim_space(bind, settings.retention_vacuum_pages)
+        if pause_s:
+            stop_event.wait(pause_s)
+
+    if compacted:
+        logger.info(f"Compacted {compacted} intake rows older than {cutoff.date().isoformat()}")
+    return compacted
+
+
+class RetentionWorker(PeriodicWorker):
+    """Runs `run_retention` periodically in the background."""
+
+    name = "intake-retention"
+
+    def run_once(self) -> None:
+        db = SessionLocal()
+        try:
+            run_retention(db, stop_event=self._stop)
+        finally:
+            db.close()
+
+
+retention_worker = RetentionWorker(settings.retention_interval_s)
@@ -1,6 +1,9 @@
-from pydantic import BaseModel
-from typing import Optional
-from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Any, Dict, Literal, Optional
+from datetime import date, datetime
+
+# Device ids become Firebase keys, which can't contain '.', '$', '#', '[', ']', '/' or control characters
+DEVICE_ID_PATTERN = r"^[^.$#\[\]/\x00-\x1f\x7f]+$"
 
 
 class UserProfile(BaseModel):
@@ -8,6 +11,7 @@ class UserProfile(BaseModel):
     weight_kg: int
     age: Optional[int] = None
     activity_level: Optional[str] = None
+    device_id: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -17,12 +21,14 @@ class UserProfileUpdate(BaseModel):
     weight_kg: int
     age: Optional[int] = None
     activity_level: Optional[str] = None
+    device_id: Optional[str] = Field(default=None, pattern=DEVICE_ID_PATTERN)
 
 
 class IntakeEntry(BaseModel):
     id: int
     timestamp: datetime
     intake_ml: int
+    compacted: bool = False
 
     class Config:
         from_attributes = True
@@ -38,11 +44,19 @@ class Prediction(BaseModel):
     intake_ml: int
     delta_ml: int
     status: str
+    projected_ml: Optional[int] = None
+    projected_delta_ml: Optional[int] = None
+    expected_by_now_ml: Optional[int] = None
+    history_days: Optional[int] = None
 
 
 class DeviceStatus(BaseModel):
+    device_id: str | None = None
     connected: bool
+    state: Literal["online", "idle", "offline"] = "offline"
+    # When the device was last heard from
     last_synced: datetime | None = None
+    age_seconds: float | None = None
 
 
 class FirebaseDeviceData(BaseModel):
@@ -50,7 +64,10 @@ class FirebaseDeviceData(BaseModel):
     currentWeight: Optional[int] = None
     totalWaterDrank: Optional[int] = None
     lastUpdated: Optional[str] = None
+    stale: bool = False
+    ageSeconds: Optional[float] = None
     error: Optional[str] = None
+    rawData: Optional[Dict[str, Any]] = None
 
 
 class HydrationData(BaseModel):
@@ -58,5 +75,125 @@ class HydrationData(BaseModel):
     totalWaterDrank: int
     connected: bool
     lastUpdated: str
+    stale: bool = False
+    ageSeconds: Optional[float] = None
+
+
+class SyncState(BaseModel):
+    device_id: str
+    last_total_ml: int
+    last_reading_at: Optional[datetime] = None
+    last_synced_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class WeightSample(BaseModel):
+    weight_g: float
+    timestamp: Optional[datetime] = None
+
+
+class WeightSamplesUpload(BaseModel):
+    samples: list[WeightSample]
+
+
+class SipEvent(BaseModel):
+    kind: str
+    amount_ml: int
+    weight_before_g: float
+    weight_after_g: float
+    timestamp: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class WeightIngestResult(BaseModel):
+    events: list[SipEvent]
+    intake_ml: int
+    baseline_g: Optional[float] = None
+
+
+class BatchIngestResult(BaseModel):
+    readings: int
+    intake_ml: int
+
+
+class DeviceReadingUpload(BaseModel):
+    """One reading in the same shape devices used to PUT to Firebase."""
+    currentWeight: int
+    totalWaterDrank: int = Field(ge=0)
+    timestamp: Optional[str] = None
+    deviceStatus: Optional[str] = None
+    batteryLevel: Optional[int] = Field(default=None, ge=0, le=100)
+    temperature: Optional[float] = None
+
+
+class ReadingIngestResult(BaseModel):
+    intake_ml: int
+    forwarded: bool
+
+
+class FleetLeader(BaseModel):
+    user_id: int
+    total_ml: int
+    goal_ml: int
+    percent: float
+
+
+class FleetBucket(BaseModel):
+    label: str
+    count: int
+
+
+class FleetSummary(BaseModel):
+    day: date
+    users: int
+    behind: int
+    top: list[FleetLeader]
+    buckets: list[FleetBucket]
+
+
+class ReportJobCreate(BaseModel):
+    kind: Literal["weekly", "monthly"]
+    period_start: Optional[date] = None
+
+
+class ReportJob(BaseModel):
+    id: int
+    kind: str
+    period_start: date
+    status: str
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class UserReport(BaseModel):
+    user_id: int
+    days: int
+    total_ml: int
+    avg_daily_ml: float
+    goal_ml: int
+    goal_days: int
+    attainment_pct: float
+    active_days: int
+    longest_streak: int
+    current_streak: int
+
+    class Config:
+        from_attributes = True
+
 
+class ReportPeriod(BaseModel):
+    kind: str
+    period_start: date
+    period_end: date
+    job: Optional[ReportJob] = None
+    reports: list[UserReport]
 
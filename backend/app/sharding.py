@@ -0,0 +1,110 @@
+import os
+import zlib
+from typing import Any
+
+from sqlalchemy import BindParameter, TableClause
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+from sqlalchemy.orm import Mapper, ORMExecuteState
+from sqlalchemy.sql import operators, visitors
+
+MAIN = "main"
+# Intake and the device state written with it live in the shard of their user, so a
+# reading and its intake rows still commit together in one SQLite transaction.
+SHARDED_TABLES = frozenset({"intake_logs", "intake_daily_summaries", "device_sync_state", "device_readings"})
+SHARD_KEY = "user_id"
+# Each shard hands out integer ids from its own 2**40-wide range, keeping ids unique
+# across shards (the API, the hot cache and retention all identify rows by id).
+ID_RANGE_SPAN = 1 << 40
+
+_KEY_OPERATORS = (operators.eq, operators.is_not_distinct_from, operators.in_op)
+
+
+class ShardRoutingError(ValueError):
+    """A statement on sharded tables that can't be sent to a definite set of shards."""
+
+
+def shard_path(database_path: str, index: int) -> str:
+    """./hydration.db -> ./hydration.shard<index>.db"""
+    root, ext = os.path.splitext(database_path)
+    return f"{root}.shard{index}{ext}"
+
+
+def shard_index(user_id: int | None, shard_count: int) -> int:
+    """Stable across processes and restarts (unlike hash()); unattributed intake goes to shard 0."""
+    if user_id is None or shard_count == 1:
+        return 0
+    return zlib.crc32(str(int(user_id)).encode()) % shard_count
+
+
+class ShardRouter:
+    """
+    Routing rules for a ShardedSession over the main database plus `shard_count`
+    intake shards. Tables outside SHARDED_TABLES always go to the main database.
+    Rows of sharded tables are placed by their user_id; queries on them go to the
+    shards named by user_id equality / IN criteria, or to every shard otherwise
+    (results are then concatenated per shard, so callers merge order and aggregates).
+    A statement never spans both the main database and the shards.
+    """
+
+    def __init__(self, shard_count: int):
+        if shard_count < 1:
+            raise ValueError("shard_count must be at least 1")
+        self.shard_count = shard_count
+        self.shard_ids = [f"shard{index}" for index in range(shard_count)]
+
+    def shard_for(self, user_id: int | None) -> str:
+        return self.shard_ids[shard_index(user_id, self.shard_count)]
+
+    def shard_chooser(self, mapper: Mapper | None, instance: Any, clause=None, **kw) -> str:
+        if mapper is None or mapper.local_table.name not in SHARDED_TABLES:
+            return MAIN
+        if instance is None:
+            raise ShardRoutingError(f"No shard for a {mapper.local_table.name} statement without an instance")
+        return self.shard_for(getattr(instance, SHARD_KEY))
+
+    def identity_chooser(self, mapper: Mapper, primary_key, **kw) -> list[str]:
+        # Lookups by primary key alone have to try each shard; pass identity_token to avoid it
+        return self.shard_ids if mapper.local_table.name in SHARDED_TABLES else [MAIN]
+
+    def execute_chooser(self, orm_context: ORMExecuteState) -> list[str]:
+        tables, user_ids = _inspect_statement(orm_context.statement)
+        if not tables & SHARDED_TABLES:
+            return [MAIN]
+        if tables - SHARDED_TABLES:
+            raise ShardRoutingError(f"Statement mixes sharded and unsharded tables: {sorted(tables)}")
+        if orm_context.is_insert:
+            # The ORM's bulk insert can't route per row; run it on database.shard_connection()
+            raise ShardRoutingError("Insert statements on sharded tables need the connection of one shard")
+        if user_ids is not None:
+            return sorted({self.shard_for(user_id) for user_id in user_ids})
+        return self.shard_ids
+
+
+class MainDefaultShardedSession(ShardedSession):
+    """ShardedSession whose plain connection() / get_bind() is the main database, as on an unsharded Session."""
+
+    def get_bind(self, mapper=None, *, shard_id=None, **kw):
+        if mapper is None and shard_id is None:
+            shard_id = MAIN
+        return super().get_bind(mapper, shard_id=shard_id, **kw)
+
+
+def _inspect_statement(statement) -> tuple[set[str], set | None]:
+    """Tables a statement touches, and the user_ids its criteria pin it to (None when unconstrained)."""
+    tables: set[str] = set()
+    user_ids: set | None = None
+    for element in visitors.iterate(statement):
+        if isinstance(element, TableClause):
+            tables.add(element.name)
+        elif getattr(element, "operator", None) in _KEY_OPERATORS and _is_shard_key(getattr(element, "left", None)):
+            right = element.right
+            if isinstance(right, BindParameter):
+                value = right.effective_value
+                user_ids = (user_ids or set()) | (set(value) if element.operator is operators.in_op else {value})
+    return tables, user_ids
+
+
+def _is_shard_key(column) -> bool:
+    table = getattr(column, "table", None)
+    return getattr(column, "name", None) == SHARD_KEY and getattr(table, "name", None) in SHARDED_TABLES
+
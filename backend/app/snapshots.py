@@ -0,0 +1,223 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from . import crud
+from .config import settings
+from .database import SessionLocal, engine
+from .firebase_service import HYDRATION_FIELDS, DeviceSnapshot, FirebaseService, firebase_service
+from .workers import PeriodicWorker
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"HYSNAP01"
+# magic, capacity, record size; padded so records start on a cache line
+HEADER = struct.Struct("<8sII")
+HEADER_SIZE = 64
+# seq, device_id, fetched_at (epoch s), flags, payload length; the JSON payload follows
+RECORD = struct.Struct("<Q64sdBxH")
+RECORD_SIZE = 512
+PAYLOAD_SIZE = RECORD_SIZE - RECORD.size
+SEQ = struct.Struct("<Q")
+STALE = 1
+_READ_RETRIES = 8
+
+
+class SharedSnapshotTable:
+    """
+    Fixed-size device snapshot records in a memory-mapped file that every worker
+    process maps. A single writer (the elected process) fills it; readers never
+    take a lock. Each record is guarded by a sequence number in the style of a
+    seqlock: the writer makes it odd before changing the record and even again
+    after, and a reader accepts a copy only if the number was even and unchanged
+    across the copy, retrying otherwise.
+
+    Records are placed by hashing the device id with linear probing, and are never
+    removed, so a probe can stop at the first empty slot.
+    """
+
+    def __init__(self, path: str, capacity: int):
+        self.path = path
+        self.capacity = capacity
+        self._mm: mmap.mmap | None = None
+        self._slots: dict[bytes, int] | None = None  # writer's index, built on first put
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.retries = 0
+        self.writes = 0
+        self.dropped = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self._mm is not None
+
+    def open(self) -> None:
+        size = HEADER_SIZE + self.capacity * RECORD_SIZE
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # Several workers may start at once: only ever grow the file, and (re)write the
+            # header only when it doesn't describe this layout, so racing openers agree
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        if HEADER.unpack_from(self._mm, 0) != (MAGIC, self.capacity, RECORD_SIZE):
+            logger.info(f"Initialising device snapshot table {self.path} ({self.capacity} records)")
+            self._mm[HEADER_SIZE:size] = bytes(size - HEADER_SIZE)
+            HEADER.pack_into(self._mm, 0, MAGIC, self.capacity, RECORD_SIZE)
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+            self._slots = None
+
+    def get(self, device_id: str, max_age_s: float) -> DeviceSnapshot | None:
+        """The device's shared snapshot if one at most `max_age_s` old is present, else None."""
+        key = _key(device_id)
+        if self._mm is None or key is None:
+            return None
+        for slot in self._probe(key):
+            record = self._read(slot)
+            if record is None or record[1] == b"":
+                break
+            stored_key, fetched_at, flags, payload = record[1:]
+            if stored_key != key:
+                continue
+            fetched = datetime.fromtimestamp(fetched_at, tz=timezone.utc)
+            if (datetime.now(timezone.utc) - fetched).total_seconds() > max_age_s:
+                self.expired += 1
+                return None
+            self.hits += 1
+            return DeviceSnapshot(data=json.loads(payload), fetched_at=fetched, stale=bool(flags & STALE))
+        self.misses += 1
+        return None
+
+    def put(self, device_id: str, snapshot: DeviceSnapshot) -> bool:
+        """Store a snapshot; single writer only. Returns False if it doesn't fit."""
+        key = _key(device_id)
+        payload = json.dumps(snapshot.data, separators=(",", ":")).encode()
+        if self._mm is None or key is None or len(payload) > PAYLOAD_SIZE:
+            self.dropped += 1
+            return False
+        with self._lock:
+            slot = self._slot_for(key)
+            if slot is None:
+                self.dropped += 1
+                return False
+            offset = HEADER_SIZE + slot * RECORD_SIZE
+            seq = SEQ.unpack_from(self._mm, offset)[0]
+            SEQ.pack_into(self._mm, offset, seq + 1)
+            RECORD.pack_into(
+                self._mm, offset, seq + 1, key, snapshot.fetched_at.timestamp(), STALE if snapshot.stale else 0, len(payload)
+            )
+            self._mm[offset + RECORD.size:offset + RECORD.size + len(payload)] = payload
+            SEQ.pack_into(self._mm, offset, seq + 2)
+            self.writes += 1
+        return True
+
+    def stats(self) -> dict:
+        # A slot is in use once the first byte of its device id is set; no need for a consistent read
+        first = HEADER_SIZE + SEQ.size
+        used = sum(1 for slot in range(self.capacity) if self._mm[first + slot * RECORD_SIZE]) if self._mm else 0
+        return {
+            "open": self.is_open,
+            "capacity": self.capacity,
+            "devices": used,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "retries": self.retries,
+            "writes": self.writes,
+            "dropped": self.dropped,
+        }
+
+    def _probe(self, key: bytes):
+        start = zlib.crc32(key) % self.capacity
+        return ((start + step) % self.capacity for step in range(self.capacity))
+
+    def _slot_for(self, key: bytes) -> int | None:
+        if self._slots is None:
+            # Taking over from a previous writer: index what it left behind
+            self._slots = {}
+            for slot in range(self.capacity):
+                record = self._read(slot)
+                if record is not None and record[1]:
+                    self._slots[record[1]] = slot
+        slot = self._slots.get(key)
+        if slot is not None:
+            return slot
+        for slot in self._probe(key):
+            record = self._read(slot)
+            if record is not None and not record[1]:
+                self._slots[key] = slot
+                return slot
+        return None
+
+    def _read(self, slot: int) -> tuple | None:
+        offset = HEADER_SIZE + slot * RECORD_SIZE
+        for _ in range(_READ_RETRIES):
+            before = SEQ.unpack_from(self._mm, offset)[0]
+            if before % 2 == 0:
+                raw = self._mm[offset:offset + RECORD_SIZE]
+                if SEQ.unpack_from(self._mm, offset)[0] == before:
+                    seq, key, fetched_at, flags, length = RECORD.unpack_from(raw)
+                    return seq, key.rstrip(b"\0"), fetched_at, flags, raw[RECORD.size:RECORD.size + length]
+            self.retries += 1
+        return None
+
+
+def _key(device_id: str) -> bytes | None:
+    key = device_id.encode()
+    return key if 0 < len(key) <= 64 else None
+
+
+class SnapshotRefresher(PeriodicWorker):
+    """
+    Runs in the elected process only: fetches every registered device from Firebase
+    each interval and publishes it to the shared table, so upstream traffic is one
+    fetch per device per interval however many workers serve the device routes.
+    """
+
+    name = "device-snapshots"
+
+    def __init__(self, table: SharedSnapshotTable, service: FirebaseService, interval_s: float, concurrency: int):
+        super().__init__(interval_s)
+        self.table = table
+        self.service = service
+        self.concurrency = concurrency
+        self.failures = 0
+
+    def run_once(self) -> None:
+        db = SessionLocal()
+        try:
+            devices = [profile.device_id for profile in crud.get_registered_devices(db)]
+        finally:
+            db.close()
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix=self.name) as pool:
+            list(pool.map(self.refresh, devices))
+
+    def refresh(self, device_id: str) -> None:
+        try:
+            snapshot = self.service.fetch_device_snapshot(device_id, HYDRATION_FIELDS)
+        except Exception as e:
+            self.failures += 1
+            logger.debug(f"Snapshot refresh failed for {device_id}: {e}")
+            return
+        if snapshot is not None:
+            self.table.put(device_id, snapshot)
+
+
+snapshot_table = SharedSnapshotTable(f"{engine.url.database}.snapshots", settings.device_snapshot_capacity)
+snapshot_refresher = SnapshotRefresher(
+    snapshot_table, firebase_service, settings.device_snapshot_refresh_s, settings.device_snapshot_refresh_concurrency
+)
@@ -0,0 +1,223 @@
+import logging
+from datetime import datetime, timezone
+from typing import Any
+
+import numpy as np
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from . import crud, models
+from .config import settings
+from .database import SessionLocal, router, shard_connection
+from .firebase_service import FirebaseService, firebase_service
+from .heartbeat import heartbeats
+from .timeutil import as_utc
+from .workers import PeriodicWorker
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def parse_reading_timestamp(value: Any) -> datetime | None:
+    """
+    Parse the `timestamp` field written by devices and simulators.
+    Simulators write naive local-time ISO strings, so naive values are taken as local time.
+    """
+    if value is None:
+        return None
+    try:
+        if isinstance(value, (int, float)):
+            # Epoch seconds, or epoch milliseconds as written by Firebase ServerValue.TIMESTAMP
+            seconds = value / 1000 if value > 1e11 else value
+            return datetime.fromtimestamp(seconds, tz=timezone.utc)
+        parsed = datetime.fromisoformat(str(value))
+    except (ValueError, TypeError, OverflowError, OSError):
+        logger.warning(f"Unparseable reading timestamp: {value!r}")
+        return None
+    return parsed.astimezone(timezone.utc)
+
+
+def device_checkpoint(db: Session, device_id: str, user_id: int | None) -> models.DeviceSyncState:
+    """
+    The device's checkpoint, attributed to `user_id` and so kept in that user's intake
+    shard, created at zero for a device never seen before. The caller commits.
+
+    With several shards, a device first seen unattributed or re-registered to a user in
+    another shard has its checkpoint elsewhere. It is moved into the user's shard as part
+    of the caller's transaction, so the device's cumulative total isn't counted again.
+    """
+    state = crud.get_sync_state(db, device_id, user_id)
+    if state is None and router is not None:
+        state = _move_checkpoint(db, device_id, user_id)
+    if state is None:
+        state = models.DeviceSyncState(device_id=device_id, user_id=user_id, last_total_ml=0)
+        db.add(state)
+    else:
+        state.user_id = user_id
+    return state
+
+
+def _move_checkpoint(db: Session, device_id: str, user_id: int | None) -> models.DeviceSyncState | None:
+    # Queried on every shard; more than one row is left over from before checkpoints were moved
+    found = db.execute(select(models.DeviceSyncState).where(models.DeviceSyncState.device_id == device_id)).scalars().all()
+    if not found:
+        return None
+    newest = max(found, key=lambda state: as_utc(state.last_reading_at) if state.last_reading_at is not None else _EPOCH)
+    for state in found:
+        db.delete(state)
+    moved = models.DeviceSyncState(
+        device_id=device_id,
+        user_id=user_id,
+        last_total_ml=newest.last_total_ml,
+        last_reading_at=newest.last_reading_at,
+        last_synced_at=newest.last_synced_at,
+    )
+    db.add(moved)
+    logger.info(f"Moved the sync checkpoint of {device_id} to the intake shard of user {user_id}")
+    return moved
+
+
+def apply_cumulative_reading(
+    db: Session, device_id: str, total_ml: int, reading_at: datetime | None, user_id: int | None
+) -> int:
+    """
+    Turn one cumulative `totalWaterDrank` reading into an intake delta against the
+    device checkpoint and stage the resulting IntakeLog row. The caller commits.
+
+    - Readings at or before the checkpoint timestamp are duplicates/out-of-order and ignored.
+    - A total below the checkpoint means the device counter was reset, so the
+      whole new total is intake since the reset.
+    Returns:
+        The intake delta in ml that was recorded (0 if nothing was recorded)
+    """
+    now = datetime.now(timezone.utc)
+    reading_at = as_utc(reading_at) if reading_at is not None else now
+
+    state = device_checkpoint(db, device_id, user_id)
+    if state.last_reading_at is not None and reading_at <= as_utc(state.last_reading_at):
+        state.last_synced_at = now
+        return 0
+
+    if total_ml >= state.last_total_ml:
+        delta = total_ml - state.last_total_ml
+    else:
+        logger.info(f"Cumulative total for {device_id} dropped {state.last_total_ml} -> {total_ml}; treating as reset")
+        delta = total_ml
+
+    if delta > 0:
+        db.add(models.IntakeLog(intake_ml=delta, user_id=user_id, timestamp=reading_at))
+
+    state.last_total_ml = total_ml
+    state.last_reading_at = reading_at
+    state.last_synced_at = now
+    return delta
+
+
+def cumulative_deltas(
+    timestamps_ms: np.ndarray, totals: np.ndarray, last_total: int, last_ms: int | None
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Vectorised form of `apply_cumulative_reading` for a batch of readings.
+    Readings are ordered by timestamp first, so out-of-order delivery inside a batch is
+    recovered rather than dropped; readings at or before the checkpoint and repeated
+    timestamps are discarded.
+    Returns:
+        (timestamps_ms, totals, deltas) of the accepted readings, in time order
+    """
+    order = np.argsort(timestamps_ms, kind="stable")
+    ts = timestamps_ms[order].astype(np.int64)
+    tot = totals[order].astype(np.int64)
+    keep = np.concatenate([[True], ts[1:] != ts[:-1]]) if len(ts) else np.zeros(0, dtype=bool)
+    if last_ms is not None:
+        keep &= ts > last_ms
+    ts, tot = ts[keep], tot[keep]
+    previous = np.concatenate([[last_total], tot[:-1]])
+    deltas = np.where(tot >= previous, tot - previous, tot)
+    return ts, tot, deltas
+
+
+def apply_cumulative_batch(
+    db: Session, device_id: str, user_id: int | None, timestamps_ms: np.ndarray, totals: np.ndarray
+) -> list[tuple[datetime, int, int]]:
+    """
+    Batch counterpart of `apply_cumulative_reading`: bulk-stage intake rows for every
+    positive delta and advance the checkpoint. The caller commits and, because the rows
+    bypass the ORM, publishes the returned (timestamp, delta, entry_id) triples.
+    """
+    now = datetime.now(timezone.utc)
+    state = device_checkpoint(db, device_id, user_id)
+    last_ms = int(as_utc(state.last_reading_at).timestamp() * 1000) if state.last_reading_at is not None else None
+
+    ts, tot, deltas = cumulative_deltas(timestamps_ms, totals, state.last_total_ml or 0, last_ms)
+    state.last_synced_at = now
+    if len(ts) == 0:
+        return []
+
+    positive = deltas > 0
+    intake = [
+        (datetime.fromtimestamp(ms / 1000, tz=timezone.utc), delta)
+        for ms, delta in zip(ts[positive].tolist(), deltas[positive].tolist())
+    ]
+    if intake:
+        entry_ids = shard_connection(db, user_id).execute(
+            insert(models.IntakeLog).returning(models.IntakeLog.id, sort_by_parameter_order=True),
+            [{"user_id": user_id, "timestamp": timestamp, "intake_ml": delta} for timestamp, delta in intake],
+        ).scalars().all()
+        intake = [(timestamp, delta, entry_id) for (timestamp, delta), entry_id in zip(intake, entry_ids)]
+    state.last_total_ml = int(tot[-1])
+    state.last_reading_at = datetime.fromtimestamp(int(ts[-1]) / 1000, tz=timezone.utc)
+    return intake
+
+
+def sync_device(db: Session, service: FirebaseService, device_id: str, user_id: int | None) -> int:
+    """
+    Mirror the current Firebase snapshot of one device into intake_logs.
+    Stale (last known good) snapshots are skipped; they were already mirrored when fresh.
+    Returns:
+        The intake delta in ml that was recorded
+    """
+    snapshot = service.get_device_snapshot(device_id)
+    if snapshot is None or snapshot.stale:
+        return 0
+    data = snapshot.data
+    if "totalWaterDrank" not in data:
+        return 0
+    try:
+        total_ml = int(data["totalWaterDrank"])
+    except (ValueError, TypeError):
+        logger.error(f"Invalid totalWaterDrank value for {device_id}: {data['totalWaterDrank']}")
+        return 0
+
+    reading_at = parse_reading_timestamp(data.get("timestamp"))
+    if reading_at is not None:
+        # The device stamped this reading itself; a snapshot that hasn't moved isn't a heartbeat
+        heartbeats.observe(device_id, reading_at)
+    delta = apply_cumulative_reading(db, device_id, total_ml, reading_at, user_id)
+    db.commit()
+    return delta
+
+
+class FirebaseSyncWorker(PeriodicWorker):
+    """Polls every registered device (profiles with a device_id) and mirrors it into SQLite."""
+
+    name = "firebase-sync"
+
+    def __init__(self, service: FirebaseService, interval_s: float):
+        super().__init__(interval_s)
+        self.service = service
+
+    def run_once(self) -> None:
+        db = SessionLocal()
+        try:
+            for profile in crud.get_registered_devices(db):
+                try:
+                    sync_device(db, self.service, profile.device_id, profile.id)
+                except Exception as e:
+                    db.rollback()
+                    logger.error(f"Sync failed for device {profile.device_id}: {e}")
+        finally:
+            db.close()
+
+
+sync_worker = FirebaseSyncWorker(firebase_service, settings.sync_interval_s)
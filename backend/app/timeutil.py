@@ -0,0 +1,6 @@
+from datetime import datetime, timezone
+
+
+def as_utc(value: datetime) -> datetime:
+    """Normalise to aware UTC; naive values read back from SQLite are already UTC."""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
@@ -0,0 +1,257 @@
+import asyncio
+import functools
+import json
+import logging
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from typing import Any, Callable, Iterator
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+TRACE_HEADER = "X-Trace-Id"
+# Incoming trace ids are passed through only if they look like ids, never echoed verbatim
+_TRACE_ID = re.compile(r"^[0-9A-Za-z_-]{8,64}$")
+_MAX_STATEMENT = 300
+
+_current: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+
+slow_logger = logging.getLogger("hydration.slow_requests")
+slow_logger.propagate = False
+
+
+class Span:
+    """One timed operation of a request; children are the operations it contained."""
+
+    __slots__ = ("name", "attrs", "start", "end", "children")
+
+    def __init__(self, name: str, attrs: dict[str, Any] | None = None, start: float | None = None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.start = time.perf_counter() if start is None else start
+        self.end: float | None = None
+        self.children: list[Span] = []
+
+    @property
+    def duration_ms(self) -> float:
+        end = time.perf_counter() if self.end is None else self.end
+        return (end - self.start) * 1000
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def finish(self) -> None:
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    def to_dict(self, origin: float | None = None) -> dict:
+        origin = self.start if origin is None else origin
+        node = {"name": self.name, "start_ms": round((self.start - origin) * 1000, 3), "duration_ms": round(self.duration_ms, 3)}
+        if self.attrs:
+            node["attrs"] = self.attrs
+        if self.end is None:
+            node["unfinished"] = True
+        if self.children:
+            node["children"] = [child.to_dict(origin) for child in sorted(self.children, key=lambda c: c.start)]
+        return node
+
+
+class _NoSpan:
+    """Stand-in yielded outside a traced request, so callers can always call .set()."""
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Span | _NoSpan]:
+    """Time the enclosed block as a child of the current span; a no-op outside a traced request."""
+    parent = _current.get()
+    if parent is None:
+        yield _NO_SPAN
+        return
+    child = Span(name, attrs)
+    parent.children.append(child)
+    token = _current.set(child)
+    try:
+        yield child
+    finally:
+        child.finish()
+        _current.reset(token)
+
+
+def traced(func: Callable) -> Callable:
+    """Decorator: run `func` (plain or async) in a span named <module>.<function>."""
+    name = f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return await func(*args, **kwargs)
+            with span(name):
+                return await func(*args, **kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _current.get() is None:
+            return func(*args, **kwargs)
+        with span(name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Record every statement executed on `engine` during a traced request as an `sql` span."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        parent = _current.get()
+        if parent is None or context is None:
+            return
+        attrs = {"statement": statement[:_MAX_STATEMENT]}
+        if executemany:
+            attrs["rows"] = len(parameters)
+        child = Span("sql", attrs)
+        parent.children.append(child)
+        context._trace_span = child
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        child = getattr(context, "_trace_span", None)
+        if child is not None:
+            child.finish()
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        child = getattr(exception_context.execution_context, "_trace_span", None)
+        if child is not None:
+            child.set(error=type(exception_context.original_exception).__name__)
+            child.finish()
+
+
+class TracedRoute(APIRoute):
+    """
+    Route class that splits a request's handler time into `resolve` (body parsing,
+    validation and dependencies), the endpoint itself, and `serialize` (response
+    model validation and encoding).
+    """
+
+    def get_route_handler(self) -> Callable:
+        self.dependant.call = _endpoint_span(self.dependant.call, self.name)
+        handler = super().get_route_handler()
+
+        async def traced_handler(request):
+            parent = _current.get()
+            if parent is None:
+                return await handler(request)
+            route = Span(f"route {self.path}")
+            parent.children.append(route)
+            token = _current.set(route)
+            try:
+                return await handler(request)
+            finally:
+                route.finish()
+                _current.reset(token)
+                _split_route(route)
+
+        return traced_handler
+
+
+def _endpoint_span(call: Callable, name: str) -> Callable:
+    if getattr(call, "_traced_endpoint", False):
+        return call
+    label = f"endpoint {name}"
+    if asyncio.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def wrapper(*args, **kwargs):
+            with span(label):
+                return await call(*args, **kwargs)
+    else:
+        @functools.wraps(call)
+        def wrapper(*args, **kwargs):
+            with span(label):
+                return call(*args, **kwargs)
+    wrapper._traced_endpoint = True
+    return wrapper
+
+
+def _split_route(route: Span) -> None:
+    endpoint = next((child for child in route.children if child.name.startswith("endpoint ")), None)
+    if endpoint is None or endpoint.end is None:
+        return
+    resolve = Span("resolve", start=route.start)
+    resolve.end = endpoint.start
+    serialize = Span("serialize", start=endpoint.end)
+    serialize.end = route.end
+    # Dependency work (e.g. opening the session) happened before the endpoint started
+    resolve.children = [child for child in route.children if child is not endpoint and child.start < endpoint.start]
+    route.children = [resolve, endpoint, serialize] + [
+        child for child in route.children if child is not endpoint and child.start >= endpoint.start
+    ]
+
+
+def _slow_log_handler(path: str, max_bytes: int, backups: int) -> RotatingFileHandler:
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    return handler
+
+
+class TracingMiddleware:
+    """
+    Pure ASGI middleware: opens the root span of every HTTP request, returns its trace
+    id in X-Trace-Id (reusing the caller's when it sends a valid one) together with a
+    Server-Timing header, and appends the full span tree of requests slower than
+    `slow_ms` to a rotating JSON-lines file.
+    """
+
+    def __init__(self, app, slow_ms: float, log_path: str, max_bytes: int, backups: int):
+        self.app = app
+        self.slow_ms = slow_ms
+        if not slow_logger.handlers:
+            slow_logger.addHandler(_slow_log_handler(log_path, max_bytes, backups))
+            slow_logger.setLevel(logging.INFO)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope["headers"]).get(TRACE_HEADER.lower().encode(), b"").decode("latin-1")
+        trace_id = incoming if _TRACE_ID.match(incoming) else uuid.uuid4().hex
+        root = Span(f"{scope['method']} {scope['path']}", {"trace_id": trace_id})
+        if scope.get("query_string"):
+            root.set(query=scope["query_string"].decode("latin-1")[:_MAX_STATEMENT])
+        token = _current.set(root)
+
+        async def send_traced(message):
+            if message["type"] == "http.response.start":
+                root.set(status=message["status"])
+                headers = MutableHeaders(scope=message)
+                headers.append(TRACE_HEADER, trace_id)
+                # Time to first byte; the body of streamed responses is still to come
+                headers.append("Server-Timing", f"app;dur={root.duration_ms:.1f}")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_traced)
+        except Exception as e:
+            root.set(error=type(e).__name__)
+            raise
+        finally:
+            root.finish()
+            _current.reset(token)
+            if root.duration_ms >= self.slow_ms:
+                slow_logger.info(json.dumps(root.to_dict(), default=str))
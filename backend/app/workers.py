@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicWorker(ABC):
+    """
+    Calls `run_once` every `interval_s` seconds on a daemon thread.
+    Subclasses implement `run_once`; exceptions are logged and the loop carries on.
+    """
+
+    name = "periodic-worker"
+
+    def __init__(self, interval_s: float):
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    @abstractmethod
+    def run_once(self) -> None: ...
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"{self.name} run failed: {e}")
+            self._stop.wait(self.interval_s)
+
+
+class LeaderElection(PeriodicWorker):
+    """
+    Makes exactly one process of a multi-worker server run the singleton background
+    jobs (retention, sync, scheduling). Every process polls for an exclusive lock on
+    `path`; the holder calls `on_elected` once. The OS drops the lock when its holder
+    exits (including crashes and worker recycling), so another process takes over
+    within `interval_s`.
+    """
+
+    name = "leader-election"
+
+    def __init__(self, path: str, interval_s: float, on_elected: Callable[[], None]):
+        super().__init__(interval_s)
+        self.path = path
+        self.on_elected = on_elected
+        self._file = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._file is not None
+
+    def run_once(self) -> None:
+        if self.is_leader:
+            return
+        handle = open(self.path, "a+b")
+        try:
+            try_lock(handle)
+        except OSError:
+            handle.close()
+            return
+        self._file = handle
+        logger.info(f"Process {os.getpid()} elected to run background jobs")
+        self.on_elected()
+
+    def stop(self) -> None:
+        super().stop()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def try_lock(handle) -> None:
+    """Non-blocking exclusive lock on an open file; raises OSError if another process holds it."""
+    if os.name == "nt":
+        import msvcrt
+
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+    else:
+        import fcntl
+
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
@@ -0,0 +1,105 @@
+"""
+Bytes saved and CPU cost of response compression, per endpoint.
+
+Seeds a throwaway database, then requests each endpoint with identity, gzip and br
+encoding. Run from backend/:
+
+    python benchmarks/bench_compression.py [--rows 20000] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+ENDPOINTS = [
+    "/api/hydration/daily",
+    "/api/prediction",
+    "/api/hydration/history",
+    "/api/hydration/export?format=csv",
+    "/api/hydration/export?format=ndjson",
+]
+
+
+def seed(rows: int) -> None:
+    from sqlalchemy import insert
+
+    from app import crud, models
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        crud.upsert_profile(db, weight_kg=70, age=30, activity_level="moderate")
+        start = datetime.now(timezone.utc) - timedelta(days=30)
+        step = timedelta(days=30) / rows
+        db.execute(
+            insert(models.IntakeLog),
+            [{"user_id": None, "timestamp": start + i * step, "intake_ml": 50 + i % 200} for i in range(rows)],
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def compression_cpu_ms(middleware, encoding: str, body: bytes, repeat: int, chunk_size: int = 64 * 1024) -> float:
+    """CPU time to encode `body` the way the middleware does, fed in streaming-sized chunks."""
+    started = time.process_time()
+    for _ in range(repeat):
+        encoder = middleware.make_encoder(encoding)
+        for offset in range(0, len(body), chunk_size):
+            encoder.compress(body[offset:offset + chunk_size])
+        encoder.finish()
+    return (time.process_time() - started) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000, help="intake rows to seed")
+    parser.add_argument("--repeat", type=int, default=20, help="requests per endpoint and encoding")
+    args = parser.parse_args()
+
+    # The app opens ./hydration.db, so work from a scratch directory
+    os.chdir(tempfile.mkdtemp(prefix="hydration-bench-"))
+    os.environ.setdefault("HYDRATION_SYNC_ENABLED", "false")
+    os.environ.setdefault("HYDRATION_FORECAST_ENABLED", "false")
+    os.environ.setdefault("HYDRATION_RETENTION_ENABLED", "false")
+
+    from fastapi.testclient import TestClient
+
+    from app.compression import CompressionMiddleware, brotli
+    from app.config import settings
+    from app.main import app
+
+    seed(args.rows)
+    client = TestClient(app)
+    middleware = CompressionMiddleware(
+        None,
+        minimum_size=settings.compression_minimum_size,
+        gzip_level=settings.compression_gzip_level,
+        brotli_quality=settings.compression_brotli_quality,
+    )
+    encodings = ["identity", "gzip"] + (["br"] if brotli is not None else [])
+
+    print(f"rows={args.rows} repeat={args.repeat} minimum_size={settings.compression_minimum_size}")
+    print(f"{'endpoint':38} {'accept':8} {'applied':8} {'wire bytes':>11} {'saved':>7} {'req ms':>8} {'cpu ms':>8}")
+    for path in ENDPOINTS:
+        identity_body = client.get(path, headers={"Accept-Encoding": "identity"}).content
+        for encoding in encodings:
+            wire_bytes = 0
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                response = client.get(path, headers={"Accept-Encoding": encoding})
+                wire_bytes = response.num_bytes_downloaded
+            request_ms = (time.perf_counter() - started) / args.repeat * 1000
+            applied = response.headers.get("content-encoding", "identity")
+            saved = 1 - wire_bytes / len(identity_body) if identity_body else 0.0
+            cpu_ms = compression_cpu_ms(middleware, encoding, identity_body, args.repeat) if applied != "identity" else 0.0
+            print(f"{path:38} {encoding:8} {applied:8} {wire_bytes:>11} {saved:>7.1%} {request_ms:>8.2f} {cpu_ms:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
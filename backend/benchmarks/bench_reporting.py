@@ -0,0 +1,124 @@
+"""
+Upstream write volume of the device reporting policy against fixed-rate reporting.
+
+Simulates bottles over a waking day in virtual time (no network, well under a minute):
+drinking sessions of a few sips seconds apart, refills when the bottle runs low, and
+load-cell noise on every weight sample. Each configuration samples the same day and
+counts the readings it transmits, and how long each sip waits before a reading that
+includes it goes out. Run from backend/:
+
+    python benchmarks/bench_reporting.py [--devices 100] [--hours 16] [--seed 1]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.reporting import ReportingConfig, ReportingPolicy  # noqa: E402
+
+BOTTLE_G = 500
+NOISE_G = 1.5
+
+
+def drinking_day(rng: random.Random, hours: float) -> list[tuple[float, int]]:
+    """(time_s, sip_ml) for one bottle: 8-14 sessions of 1-5 sips, 3-10 s apart."""
+    sips = []
+    for _ in range(rng.randint(8, 14)):
+        t = rng.uniform(0, hours * 3600)
+        for _ in range(rng.randint(1, 5)):
+            sips.append((t, rng.randint(15, 60)))
+            t += rng.uniform(3, 10)
+    return sorted(sips)
+
+
+class Bottle:
+    def __init__(self, sips: list[tuple[float, int]], rng: random.Random):
+        self.sips = sips
+        self.rng = rng
+        self.weight = BOTTLE_G
+        self.total = 0
+        self._next = 0
+
+    def advance(self, t: float) -> list[float]:
+        """Apply the sips taken up to `t`; returns their times."""
+        taken = []
+        while self._next < len(self.sips) and self.sips[self._next][0] <= t:
+            when, ml = self.sips[self._next]
+            if self.weight - ml < 30:
+                self.weight = BOTTLE_G
+            self.weight -= ml
+            self.total += ml
+            taken.append(when)
+            self._next += 1
+        return taken
+
+    def sample(self) -> tuple[float, int]:
+        return round(self.weight + self.rng.gauss(0, NOISE_G), 1), self.total
+
+
+def run_fixed(sips, rng, hours: float, interval_s: float) -> tuple[int, list[float]]:
+    bottle, waits, sent, t = Bottle(sips, rng), [], 0, 0.0
+    while t <= hours * 3600:
+        waits += [t - when for when in bottle.advance(t)]
+        sent += 1
+        t += interval_s
+    return sent, waits
+
+
+def run_policy(sips, rng, hours: float, config: ReportingConfig) -> tuple[int, list[float]]:
+    bottle, policy, waits, pending, t = Bottle(sips, rng), ReportingPolicy(config), [], [], 0.0
+    while t <= hours * 3600:
+        pending += bottle.advance(t)
+        weight, total = bottle.sample()
+        reason = policy.decide(weight, total, t)
+        if reason is not None:
+            policy.sent(reason, weight, total, t)
+            waits += [t - when for when in pending]
+            pending = []
+        t += policy.next_interval(t)
+    return policy.stats.sent, waits
+
+
+def summarise(name: str, sent: int, waits: list[float], devices: int, baseline: int | None) -> None:
+    p50 = statistics.median(waits) if waits else 0.0
+    p99 = sorted(waits)[int(len(waits) * 0.99)] if waits else 0.0
+    saved = f"{1 - sent / baseline:>7.1%}" if baseline else f"{'-':>7}"
+    print(f"{name:<28} {sent / devices:>13.0f} {saved} {p50:>8.1f} {p99:>8.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--hours", type=float, default=16.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    days = [drinking_day(random.Random(args.seed * 100003 + device), args.hours) for device in range(args.devices)]
+    print(f"{args.devices} bottles, {args.hours:g}h day, {sum(map(len, days)) / args.devices:.0f} sips per bottle")
+    print(f"{'reporting':<28} {'writes/bottle':>13} {'saved':>7} {'p50 s':>8} {'p99 s':>8}")
+
+    fast = ReportingConfig().fast_interval_s
+    baseline = None
+    for interval in (fast, 15.0):
+        results = [run_fixed(sips, random.Random(i), args.hours, interval) for i, sips in enumerate(days)]
+        sent = sum(result[0] for result in results)
+        baseline = baseline or sent
+        summarise(f"fixed {interval:g}s", sent, [w for result in results for w in result[1]], args.devices, baseline)
+
+    configs = {
+        "deadband + adaptive": ReportingConfig(),
+        "deadband, fixed 2s samples": ReportingConfig(slow_interval_s=fast),
+        "deadband 3g (inside noise)": ReportingConfig(weight_deadband_g=3),
+    }
+    for name, config in configs.items():
+        results = [run_policy(sips, random.Random(i), args.hours, config) for i, sips in enumerate(days)]
+        sent = sum(result[0] for result in results)
+        summarise(name, sent, [w for result in results for w in result[1]], args.devices, baseline)
+    print(f"Heartbeats every {ReportingConfig().heartbeat_s:g}s are included in the deadband writes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+End-to-end HTTP throughput of the launch configurations, over real sockets.
+
+Starts each server configuration on the benchmark dataset, drives it with a stdlib
+asyncio load generator (HTTP/1.1, keep-alive connections unless --reconnect), and
+reports requests/s and latency percentiles. Run from backend/:
+
+    python benchmarks/bench_server.py [--scale 10k] [--connections 32] [--duration 10]
+        [--configs reload,api,devices,preload] [--reconnect]
+
+The load generator shares the machine with the server, so absolute numbers are
+lower than a remote client would see; compare configurations within one run.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from datasets import SCALES, ensure_dataset
+from traffic import read_response
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PATHS = ["/api/hydration/daily", "/api/prediction", "/api/fleet/summary", "/api/hydration/history?user_id=1"]
+SERVE = os.path.join(BACKEND_DIR, "serve.py")
+
+# Today's .bat launch command first; the rest go through serve.py
+CONFIGS = {
+    "reload": [sys.executable, "-m", "uvicorn", "app.main:app", "--reload", "--app-dir", BACKEND_DIR, "--reload-dir", os.path.join(BACKEND_DIR, "app")],
+    "single": [sys.executable, SERVE, "--workers", "1"],
+    "api": [sys.executable, SERVE, "--profile", "api"],
+    "devices": [sys.executable, SERVE, "--profile", "devices"],
+    "preload": [sys.executable, SERVE, "--profile", "api", "--preload"],
+}
+
+
+async def _client(port: int, deadline: float, reconnect: bool, latencies: list[float], errors: list[int], offset: int) -> None:
+    reader = writer = None
+    i = offset
+    while time.perf_counter() < deadline:
+        path = PATHS[i % len(PATHS)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            connection = "close" if reconnect else "keep-alive"
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: {connection}\r\n\r\n".encode())
+            status, keep_alive = await read_response(reader)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            errors.append(0)
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            continue
+        latencies.append(time.perf_counter() - started)
+        if status != 200:
+            errors.append(status)
+        if reconnect or not keep_alive:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def drive(port: int, connections: int, duration_s: float, reconnect: bool) -> dict:
+    latencies: list[float] = []
+    errors: list[int] = []
+    started = time.perf_counter()
+    deadline = started + duration_s
+    await asyncio.gather(*(_client(port, deadline, reconnect, latencies, errors, i) for i in range(connections)))
+    elapsed = time.perf_counter() - started
+    ms = np.asarray(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2) if len(ms) else None,
+        "p99_ms": round(float(np.percentile(ms, 99)), 2) if len(ms) else None,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(port: int, timeout_s: float = 60) -> None:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1) as sock:
+                sock.sendall(b"GET /api/hydration/daily HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+                if sock.recv(12).startswith(b"HTTP/1.1 200"):
+                    return
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"server on port {port} did not become ready")
+
+
+def run_config(name: str, directory: str, args: argparse.Namespace) -> dict:
+    port = _free_port()
+    command = [*CONFIGS[name], "--port", str(port)]
+    if name not in ("reload", "single") and args.workers:
+        command += ["--workers", str(args.workers)]
+    env = {
+        **os.environ,
+        # Measure the HTTP path, not background jobs competing for the same CPUs
+        "HYDRATION_SYNC_ENABLED": "false",
+        "HYDRATION_RETENTION_ENABLED": "false",
+        "HYDRATION_REPORTS_ENABLED": "false",
+        "HYDRATION_FIREBASE_WRITE_ENABLED": "false",
+    }
+    server = subprocess.Popen(
+        command, cwd=directory, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+    )
+    try:
+        _wait_ready(port)
+        asyncio.run(drive(port, args.connections, min(2.0, args.duration), args.reconnect))  # warm-up
+        return asyncio.run(drive(port, args.connections, args.duration, args.reconnect))
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(server.pid, signal.SIGKILL)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=sorted(SCALES), default="10k")
+    parser.add_argument("--configs", default="reload,single,api,devices,preload")
+    parser.add_argument("--workers", type=int, help="Override the profile's worker count")
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--reconnect", action="store_true", help="Open a new connection per request")
+    args = parser.parse_args()
+
+    directory = ensure_dataset(args.scale)
+    print(f"{os.cpu_count()} CPU(s), {args.connections} connections, {args.duration:.0f}s per config, "
+          f"{'new connection per request' if args.reconnect else 'keep-alive'}")
+    print(f"{'config':<10} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name in args.configs.split(","):
+        result = run_config(name, directory, args)
+        print(f"{name:<10} {result['rps']:>9} {result['p50_ms']:>8} {result['p99_ms']:>8} {result['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Device write throughput against 1, 2, 4... intake shards.
+
+Each configuration starts from an empty database laid out for that many shards and
+runs --writers processes side by side (like server workers), each posting readings
+for its own devices through ingest.ingest_reading: one transaction per reading
+holding the raw reading, the device checkpoint and the derived intake row. Run
+from backend/:
+
+    python benchmarks/bench_shards.py [--shards 1,2,4] [--writers 4] [--duration 10]
+
+With one shard every writer queues on hydration.db's single write lock; with more,
+writers for users in different shards commit in parallel. How much that buys depends
+on whether commits (fsync) or CPU bound the run: on few CPUs the Python side of each
+write takes over and the curve flattens.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+DATA_DIR = os.path.join(BENCH_DIR, ".data", "shards")
+USERS = 64
+
+
+def setup() -> None:
+    from app import crud, models
+    from app.database import SessionLocal, ensure_schema
+
+    ensure_schema()
+    db = SessionLocal()
+    try:
+        db.add_all(models.UserProfile(id=uid, weight_kg=70, device_id=f"shard-bench-{uid}") for uid in range(1, USERS + 1))
+        db.commit()
+        assert len(crud.get_registered_devices(db)) == USERS
+    finally:
+        db.close()
+
+
+def write(worker: int, writers: int, start_at: float, duration_s: float) -> dict:
+    from app import ingest
+    from app.database import SessionLocal
+
+    rng = random.Random(worker)
+    users = [uid for uid in range(1, USERS + 1) if uid % writers == worker]
+    totals = dict.fromkeys(users, 0)
+    db = SessionLocal()
+    written = errors = 0
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = time.perf_counter() + duration_s
+    try:
+        while time.perf_counter() < deadline:
+            uid = rng.choice(users)
+            totals[uid] += rng.randint(5, 60)
+            try:
+                ingest.ingest_reading(db, f"shard-bench-{uid}", uid, weight_g=500, total_ml=totals[uid])
+                written += 1
+            except Exception:
+                db.rollback()
+                errors += 1
+    finally:
+        db.close()
+    return {"written": written, "errors": errors}
+
+
+def run_config(shards: int, args: argparse.Namespace) -> dict:
+    directory = os.path.join(DATA_DIR, str(shards))
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    env = {
+        **os.environ, "PYTHONPATH": BACKEND_DIR, "HYDRATION_INTAKE_SHARDS": str(shards),
+        # Heartbeats and per-process caches are not what is measured here
+        "HYDRATION_WORKER_PROCESSES": str(args.writers),
+    }
+    me = os.path.abspath(__file__)
+    subprocess.run([sys.executable, me, "--setup"], cwd=directory, env=env, check=True)
+
+    start_at = time.time() + 2.0  # let every writer finish importing the app first
+    writers = [
+        subprocess.Popen(
+            [sys.executable, me, "--worker", str(worker), "--writers", str(args.writers),
+             "--start-at", str(start_at), "--duration", str(args.duration)],
+            cwd=directory, env=env, stdout=subprocess.PIPE, text=True,
+        )
+        for worker in range(args.writers)
+    ]
+    results = [json.loads(writer.communicate()[0]) for writer in writers]
+    written = sum(result["written"] for result in results)
+    return {
+        "shards": shards,
+        "written": written,
+        "errors": sum(result["errors"] for result in results),
+        "writes_per_s": round(written / args.duration, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", default="1,2,4", help="Comma-separated shard counts to compare")
+    parser.add_argument("--writers", type=int, default=4, help="Concurrent writer processes")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--setup", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--start-at", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.setup:
+        setup()
+        return
+    if args.worker is not None:
+        print(json.dumps(write(args.worker, args.writers, args.start_at, args.duration)))
+        return
+
+    print(f"{os.cpu_count()} CPU(s), {args.writers} writer processes, {args.duration:.0f}s per config")
+    print(f"{'shards':>6} {'writes/s':>10} {'speedup':>8} {'errors':>7}")
+    baseline = None
+    for shards in (int(value) for value in args.shards.split(",")):
+        result = run_config(shards, args)
+        baseline = baseline or result["writes_per_s"]
+        print(f"{shards:>6} {result['writes_per_s']:>10} {result['writes_per_s'] / baseline:>7.2f}x {result['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
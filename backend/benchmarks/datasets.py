@@ -0,0 +1,105 @@
+"""
+Synthetic hydration.db datasets for the benchmarks.
+
+Each scale lives in benchmarks/.data/<scale>/hydration.db and is generated once; the
+same seed always produces the same rows. Intake is spread over the last HISTORY_DAYS
+days across the users, with device registrations for a tenth of them.
+"""
+import json
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+
+SCALES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+HISTORY_DAYS = 120
+SEED = 1234
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data")
+
+
+def users_for(rows: int) -> int:
+    return min(10_000, max(10, rows // 1_000))
+
+
+def dataset_dir(scale: str) -> str:
+    return os.path.join(DATA_DIR, scale)
+
+
+def ensure_dataset(scale: str, now: datetime | None = None) -> str:
+    """
+    Generate the dataset for `scale` unless it already exists. Must run before the app
+    is imported, since the app opens ./hydration.db relative to the working directory.
+    Returns:
+        The dataset directory (holding hydration.db)
+    """
+    rows = SCALES[scale]
+    directory = dataset_dir(scale)
+    meta_path = os.path.join(directory, "dataset.json")
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f).get("rows") == rows:
+                return directory
+
+    os.makedirs(directory, exist_ok=True)
+    db_path = os.path.join(directory, "hydration.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    started = time.perf_counter()
+    _create_schema(directory)
+    users = users_for(rows)
+    now = now or datetime.now(timezone.utc)
+    _fill(db_path, rows, users, now)
+    with open(meta_path, "w") as f:
+        json.dump({"rows": rows, "users": users, "generated_at": now.isoformat(), "seed": SEED}, f)
+    print(f"Generated {scale} dataset ({rows} rows, {users} users) in {time.perf_counter() - started:.1f}s")
+    return directory
+
+
+def _create_schema(directory: str) -> None:
+    # Let the app's own ensure_schema() create tables and indexes, in a throwaway process
+    # state: the engine binds to ./hydration.db at import time.
+    import subprocess
+    import sys
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run(
+        [sys.executable, "-c", "import app.models; from app.database import ensure_schema; ensure_schema()"],
+        cwd=directory,
+        env={**os.environ, "PYTHONPATH": backend_dir},
+        check=True,
+    )
+
+
+def _fill(db_path: str, rows: int, users: int, now: datetime) -> None:
+    rng = random.Random(SEED)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.executemany(
+            "INSERT INTO user_profiles (id, weight_kg, age, activity_level, device_id) VALUES (?, ?, ?, ?, ?)",
+            (
+                (uid, rng.randint(45, 110), rng.randint(18, 80), "moderate", f"bench-device-{uid}" if uid % 10 == 0 else None)
+                for uid in range(1, users + 1)
+            ),
+        )
+
+        start = now - timedelta(days=HISTORY_DAYS)
+        span_s = HISTORY_DAYS * 86400
+
+        def intake_rows():
+            for i in range(rows):
+                # Evenly spread in time (so every day holds rows) with per-row jitter
+                offset = span_s * (i + rng.random()) / rows
+                timestamp = start + timedelta(seconds=offset)
+                yield (rng.randint(1, users), timestamp.strftime("%Y-%m-%d %H:%M:%S.%f"), rng.randint(20, 400))
+
+        conn.executemany("INSERT INTO intake_logs (user_id, timestamp, intake_ml) VALUES (?, ?, ?)", intake_rows())
+        conn.commit()
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
@@ -0,0 +1,145 @@
+"""
+Local in-memory stand-in for the Firebase Realtime Database REST API.
+
+Serves GET (including shallow=true), PUT, PATCH (including multi-path updates),
+POST (push) and DELETE on /<path>.json, which covers what the backend, the
+simulators and the traffic replayer use. Run from backend/:
+
+    python benchmarks/firebase_standin.py [--port 9000] [--record traffic.jsonl.gz]
+
+Point the backend and the simulators at it with HYDRATION_FIREBASE_URL=http://127.0.0.1:9000.
+With --record, every write it receives is captured for benchmarks/traffic.py replay.
+"""
+import argparse
+import json
+import secrets
+import time
+from typing import Any
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from traffic import Recorder
+
+
+class Tree:
+    """JSON tree with Firebase write semantics: writing null deletes, empty objects vanish."""
+
+    def __init__(self):
+        self.root: dict[str, Any] = {}
+
+    def get(self, parts: list[str]) -> Any:
+        node: Any = self.root
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def set(self, parts: list[str], value: Any) -> None:
+        if not parts:
+            self.root = value if isinstance(value, dict) else {}
+            return
+        trail = [self.root]
+        node = self.root
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = node[part] = {}
+            trail.append(child)
+            node = child
+        if value is None or value == {}:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+        # Prune parents left empty by a delete
+        for depth in range(len(parts) - 1, 0, -1):
+            if trail[depth]:
+                break
+            trail[depth - 1].pop(parts[depth - 1], None)
+
+    def update(self, parts: list[str], values: dict[str, Any]) -> None:
+        for key, value in values.items():
+            self.set(parts + _split(key), value)
+
+
+def _split(path: str) -> list[str]:
+    return [part for part in path.split("/") if part]
+
+
+def _push_id() -> str:
+    return f"-{int(time.time() * 1000):x}{secrets.token_hex(5)}"
+
+
+def create_app(recorder: Recorder | None = None) -> Starlette:
+    tree = Tree()
+
+    async def node(request: Request) -> Response:
+        path = request.path_params["path"]
+        if not path.endswith(".json"):
+            return JSONResponse({"error": "Paths must end in .json"}, status_code=400)
+        path = path[: -len(".json")]
+        parts = _split(path)
+
+        if request.method == "GET":
+            value = tree.get(parts)
+            if request.query_params.get("shallow") == "true" and isinstance(value, dict):
+                value = {key: True if isinstance(child, (dict, list)) else child for key, child in value.items()}
+            return JSONResponse(value)
+
+        if request.method == "DELETE":
+            tree.set(parts, None)
+            if recorder is not None:
+                recorder.write("DELETE", path, None)
+            return JSONResponse(None)
+
+        try:
+            body = json.loads(await request.body() or b"null")
+        except json.JSONDecodeError:
+            return JSONResponse({"error": "Invalid data; couldn't parse JSON object"}, status_code=400)
+        if recorder is not None:
+            recorder.write(request.method, path, body)
+        if request.method == "PUT":
+            tree.set(parts, body)
+            return JSONResponse(body)
+        if request.method == "PATCH":
+            if not isinstance(body, dict):
+                return JSONResponse({"error": "PATCH needs an object"}, status_code=400)
+            tree.update(parts, body)
+            return JSONResponse(body)
+        name = _push_id()
+        tree.set(parts + [name], body)
+        return JSONResponse({"name": name})
+
+    def close_recording() -> None:
+        # On shutdown, not after uvicorn.run(): uvicorn re-raises the stop signal once it has shut down
+        if recorder is not None:
+            recorder.close()
+            print(f"Recorded {recorder.events} writes")
+
+    app = Starlette(
+        routes=[Route("/{path:path}", node, methods=["GET", "PUT", "PATCH", "POST", "DELETE"])], on_shutdown=[close_recording]
+    )
+    app.state.tree = tree
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--record", help="Record every write to this traffic file")
+    args = parser.parse_args()
+
+    recorder = Recorder(args.record, source=f"firebase-standin:{args.port}") if args.record else None
+    uvicorn.run(create_app(recorder), host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Backend benchmark suite.
+
+Runs every crud function and every /api/* route in-process against a synthetic
+dataset, with Firebase replaced by a local stub, and writes throughput and latency
+percentiles to a JSON results file. Given a baseline results file, exits non-zero
+when any case regressed past the threshold. Run from backend/:
+
+    python benchmarks/run.py --scale 10k
+    python benchmarks/run.py --scale 1m --baseline benchmarks/results/1m.json --threshold 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+from datasets import SCALES, ensure_dataset  # noqa: E402
+
+STUB_DEVICE = {
+    "currentWeight": 512,
+    "totalWaterDrank": 1430,
+    "timestamp": "2024-01-01T12:00:00",
+    "batteryLevel": 87,
+    "temperature": 21.5,
+    "deviceStatus": "active",
+}
+
+
+class _StubResponse:
+    status_code = 200
+
+    def __init__(self, payload):
+        self._payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._payload
+
+
+class StubFirebaseSession:
+    """Stands in for FirebaseService.session: every device node is STUB_DEVICE."""
+
+    def get(self, url, params=None, timeout=None):
+        if params and params.get("shallow") == "true":
+            return _StubResponse({k: (True if isinstance(v, dict) else v) for k, v in STUB_DEVICE.items()})
+        return _StubResponse(dict(STUB_DEVICE))
+
+    def patch(self, url, json=None, timeout=None):
+        return _StubResponse(None)
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(fn, iterations: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter_ns()
+        fn()
+        samples.append((time.perf_counter_ns() - t0) / 1e6)
+    elapsed = time.perf_counter() - started
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "ops_per_s": round(iterations / elapsed, 1) if elapsed > 0 else None,
+        "mean_ms": round(sum(samples) / len(samples), 4),
+        "p50_ms": round(percentile(samples, 0.50), 4),
+        "p90_ms": round(percentile(samples, 0.90), 4),
+        "p99_ms": round(percentile(samples, 0.99), 4),
+        "max_ms": round(samples[-1], 4),
+    }
+
+
+def crud_cases(db, crud, hot_cache, device_id: str) -> dict:
+    def cold(fn):
+        # Same call with the hot tier emptied, so SQLite does the work
+        def run():
+            hot_cache.clear()
+            fn()
+        return run
+
+    return {
+        "crud.get_profile": lambda: crud.get_profile(db),
+        "crud.upsert_profile": lambda: crud.upsert_profile(db, weight_kg=72, age=30, activity_level="moderate"),
+        "crud.get_registered_devices": lambda: crud.get_registered_devices(db),
+        "crud.add_intake": lambda: crud.add_intake(db, 150, user_id=1),
+        "crud.get_today_total_ml": lambda: crud.get_today_total_ml(db),
+        "crud.get_today_total_ml[user]": lambda: crud.get_today_total_ml(db, user_id=1),
+        "crud.get_today_total_ml[cold]": cold(lambda: crud.get_today_total_ml(db)),
+        "crud.get_today_total_ml[user,cold]": cold(lambda: crud.get_today_total_ml(db, user_id=1)),
+        "crud.get_today_totals": lambda: crud.get_today_totals(db, list(range(1, 501))),
+        "crud.get_history": lambda: crud.get_history(db),
+        "crud.get_history[user]": lambda: crud.get_history(db, user_id=1),
+        "crud.get_sync_state": lambda: crud.get_sync_state(db, device_id),
+        "crud.get_sync_states": lambda: crud.get_sync_states(db),
+        "crud.get_profile_by_device": lambda: crud.get_profile_by_device(db, device_id),
+    }
+
+
+def async_crud_cases(portal, adb, async_crud, hot_cache) -> dict:
+    # Awaited on the test client's event loop, where the app's async engine runs
+    def call(fn):
+        return lambda: portal.call(fn)
+
+    def cold(fn):
+        def run():
+            hot_cache.clear()
+            portal.call(fn)
+        return run
+
+    return {
+        "async_crud.get_profile": call(lambda: async_crud.get_profile(adb)),
+        "async_crud.upsert_profile": call(
+            lambda: async_crud.upsert_profile(adb, weight_kg=72, age=30, activity_level="moderate")
+        ),
+        "async_crud.get_today_total_ml": call(lambda: async_crud.get_today_total_ml(adb)),
+        "async_crud.get_today_total_ml[cold]": cold(lambda: async_crud.get_today_total_ml(adb)),
+        "async_crud.get_history": call(lambda: async_crud.get_history(adb)),
+        "async_crud.get_history[user]": call(lambda: async_crud.get_history(adb, user_id=1)),
+        "async_crud.get_sync_states": call(lambda: async_crud.get_sync_states(adb)),
+    }
+
+
+def route_cases(client, device_id: str, frame: bytes, report_job_id: int) -> dict:
+    export_start = (datetime.now(timezone.utc) - timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%S")
+    samples = {"samples": [{"t": i * 0.1, "weight_g": 650.0 if i < 20 else 600.0} for i in range(40)]}
+
+    def get(path, **params):
+        def run():
+            response = client.get(path, params=params)
+            assert response.status_code == 200, (path, response.status_code, response.text[:200])
+            response.read()
+        return run
+
+    def send(method, path, **kwargs):
+        def run():
+            response = client.request(method, path, **kwargs)
+            assert response.status_code in (200, 202), (path, response.status_code, response.text[:200])
+        return run
+
+    # Keyed by (method, route template) so coverage of app.routes can be checked
+    return {
+        ("GET", "/api/user/profile"): get("/api/user/profile"),
+        ("PUT", "/api/user/profile"): send("PUT", "/api/user/profile", json={"weight_kg": 72, "age": 30, "activity_level": "moderate"}),
+        ("GET", "/api/hydration/daily"): get("/api/hydration/daily"),
+        ("GET", "/api/hydration/history"): get("/api/hydration/history"),
+        ("GET", "/api/hydration/export"): get("/api/hydration/export", format="csv", start=export_start, user_id=1),
+        ("GET", "/api/prediction"): get("/api/prediction"),
+        ("GET", "/api/fleet/summary"): get("/api/fleet/summary"),
+        ("GET", "/api/device/status"): get("/api/device/status"),
+        ("GET", "/api/sync/status"): get("/api/sync/status"),
+        ("POST", "/api/ingest/{device_id}/weights"): send("POST", f"/api/ingest/{device_id}/weights", json=samples),
+        ("POST", "/api/ingest/{device_id}/readings"): send(
+            "POST", f"/api/ingest/{device_id}/readings", json={"currentWeight": 480, "totalWaterDrank": 1200, "batteryLevel": 90}
+        ),
+        ("POST", "/api/ingest/{device_id}/batch"): send(
+            "POST", f"/api/ingest/{device_id}/batch", content=frame, headers={"Content-Type": "application/octet-stream"}
+        ),
+        ("GET", "/api/admin/admission"): get("/api/admin/admission"),
+        ("GET", "/api/admin/hot-cache"): get("/api/admin/hot-cache"),
+        ("GET", "/api/admin/heartbeats"): get("/api/admin/heartbeats"),
+        ("GET", "/api/admin/device-snapshots"): get("/api/admin/device-snapshots"),
+        ("GET", "/api/admin/reminders"): get("/api/admin/reminders"),
+        ("GET", "/api/admin/sql"): get("/api/admin/sql"),
+        ("POST", "/api/admin/sql/reset"): send("POST", "/api/admin/sql/reset"),
+        ("GET", "/api/admin/circuit"): get("/api/admin/circuit"),
+        ("GET", "/api/firebase/device/{device_id}"): get(f"/api/firebase/device/{device_id}"),
+        ("GET", "/api/firebase/hydration/{device_id}"): get(f"/api/firebase/hydration/{device_id}"),
+        ("GET", "/api/firebase/intake/{device_id}"): get(f"/api/firebase/intake/{device_id}"),
+        ("GET", "/api/firebase/prediction/{device_id}"): get(f"/api/firebase/prediction/{device_id}"),
+        ("GET", "/api/reports/{kind}"): get("/api/reports/weekly"),
+        ("GET", "/api/reports/jobs/{job_id}"): get(f"/api/reports/jobs/{report_job_id}"),
+        # Last: every call queues a real job, which keeps the pool busy afterwards
+        ("POST", "/api/reports/jobs"): send("POST", "/api/reports/jobs", json={"kind": "weekly"}),
+    }
+
+
+def api_routes(app) -> set[tuple[str, str]]:
+    routes = set()
+    for route in app.routes:
+        path = getattr(route, "path", "")
+        for method in getattr(route, "methods", None) or ():
+            if path.startswith("/api/") and method != "HEAD":
+                routes.add((method, path))
+    return routes
+
+
+def compare(results: dict, baseline: dict, metric: str, threshold: float, min_delta_ms: float) -> list[str]:
+    regressions = []
+    for name, current in results["cases"].items():
+        previous = baseline.get("cases", {}).get(name)
+        if previous is None or previous.get(metric) in (None, 0):
+            continue
+        before, after = previous[metric], current[metric]
+        if after > before * (1 + threshold) and after - before > min_delta_ms:
+            regressions.append(f"{name}: {metric} {before:.4f} -> {after:.4f} ms (+{(after / before - 1):.0%})")
+    return regressions
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=sorted(SCALES), default="10k")
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per case")
+    parser.add_argument("--warmup", type=int, default=20, help="untimed calls per case before measuring")
+    parser.add_argument("--only", default="", help="run only cases whose name contains this substring")
+    parser.add_argument("--output", help="results file (default benchmarks/results/<scale>.json)")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--metric", default="p50_ms", choices=["mean_ms", "p50_ms", "p90_ms", "p99_ms"])
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative slowdown, e.g. 0.25 = 25%%")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    output = args.output or os.path.join(BENCH_DIR, "results", f"{args.scale}.json")
+    output = os.path.abspath(output)
+
+    # The app opens ./hydration.db and starts its background workers from settings
+    os.chdir(ensure_dataset(args.scale))
+    for worker in ("SYNC", "RETENTION", "FORECAST", "FIREBASE_WRITE", "REPORTS"):
+        os.environ[f"HYDRATION_{worker}_ENABLED"] = "false"
+
+    import numpy as np
+    from fastapi.testclient import TestClient
+
+    from app import async_crud, crud
+    from app.database import AsyncSessionLocal, SessionLocal
+    from app.firebase_service import firebase_service
+    from app.frames import RECORD_DTYPE, encode_frame
+    from app.hotcache import hot_cache
+    from app.main import app
+    from app.reports import report_runner
+
+    firebase_service.session = StubFirebaseSession()
+    db = SessionLocal()
+    device_id = crud.get_registered_devices(db)[0].device_id
+
+    frame_records = np.zeros(50, dtype=RECORD_DTYPE)
+    now_ms = int(time.time() * 1000)
+    frame_records["timestamp_ms"] = now_ms + np.arange(50) * 1000
+    frame_records["total_ml"] = np.arange(50) * 10
+    frame = encode_frame(frame_records)
+
+    cases = {}
+    with TestClient(app) as client:
+        adb = AsyncSessionLocal()
+        report_job = report_runner.submit(db, "weekly", datetime.now(timezone.utc).date())
+        while report_job.status not in ("done", "failed"):
+            time.sleep(0.1)
+            db.refresh(report_job)
+        routes = route_cases(client, device_id, frame, report_job.id)
+        missing = api_routes(app) - routes.keys()
+        if missing:
+            print("No benchmark case for: " + ", ".join(f"{m} {p}" for m, p in sorted(missing)), file=sys.stderr)
+            return 2
+        cases.update(crud_cases(db, crud, hot_cache, device_id))
+        cases.update(async_crud_cases(client.portal, adb, async_crud, hot_cache))
+        cases.update({f"{method} {path}": fn for (method, path), fn in routes.items()})
+
+        results = {
+            "meta": {
+                "scale": args.scale,
+                "rows": SCALES[args.scale],
+                "iterations": args.iterations,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "revision": git_revision(),
+                "run_at": datetime.now(timezone.utc).isoformat(),
+            },
+            "cases": {},
+        }
+        print(f"{'case':52} {'ops/s':>10} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}")
+        for name, fn in cases.items():
+            if args.only and args.only not in name:
+                continue
+            stats = measure(fn, args.iterations, args.warmup)
+            if "cold]" in name:
+                # Cold cases empty the hot tier; put it back for the next case
+                hot_cache.warm(db)
+            results["cases"][name] = stats
+            print(f"{name:52} {stats['ops_per_s']:>10} {stats['p50_ms']:>9.3f} {stats['p90_ms']:>9.3f} {stats['p99_ms']:>9.3f}")
+        # Before the client's shutdown disposes the async engines
+        client.portal.call(adb.close)
+    db.close()
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.metric, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            return 1
+        print(f"No regressions over {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
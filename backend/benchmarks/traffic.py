@@ -0,0 +1,327 @@
+"""
+Record and replay device write traffic.
+
+A recording is a gzip-compressed JSON-lines file: one header object, then one
+[offset_ms, method, path, payload] array per write, where offset_ms is the arrival
+time relative to the start of the recording and path is the database path written
+(e.g. "<device_id>" or "<device_id>/currentWeight"). Run from backend/:
+
+    # Capture what devices write to a Firebase database (REST streaming, no device changes)
+    python benchmarks/traffic.py record traffic.jsonl.gz --firebase-url https://<db>.firebaseio.com [--duration 600]
+
+    # Or capture simulators pointed at the local stand-in
+    python benchmarks/firebase_standin.py --record traffic.jsonl.gz
+    HYDRATION_FIREBASE_URL=http://127.0.0.1:9000 python ../production_hardware.py
+
+    # Re-drive the same writes at 1x, Nx or maximum speed
+    python benchmarks/traffic.py replay traffic.jsonl.gz --target firebase --url http://127.0.0.1:9000 --speed 10
+    python benchmarks/traffic.py replay traffic.jsonl.gz --target backend --url http://127.0.0.1:8000 --speed max
+
+Timed replays keep every write's offset divided by the speed, so the inter-arrival
+distribution of the recording is preserved; `max` sends as fast as the connections
+allow. A `timestamp` field in a payload is rewritten to the replay time so the
+backend does not discard replayed readings as already seen (--keep-timestamps
+disables this). The report covers throughput, response latency and how late writes
+were sent against their schedule; --out saves it and --baseline compares to a saved one.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import ssl
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Iterator
+from urllib.parse import urlsplit
+
+import numpy as np
+
+FORMAT = "hydration-traffic"
+VERSION = 1
+
+
+class Recorder:
+    """Appends writes to a recording as they happen; safe to call from several threads."""
+
+    def __init__(self, path: str, source: str):
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self.events = 0
+        header = {"format": FORMAT, "version": VERSION, "source": source, "started_at": datetime.now(timezone.utc).isoformat()}
+        self._file.write(json.dumps(header) + "\n")
+
+    def write(self, method: str, path: str, payload: Any) -> None:
+        offset_ms = round((time.monotonic() - self._started) * 1000, 1)
+        line = json.dumps([offset_ms, method, path.strip("/"), payload], separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            self.events += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def read_recording(path: str) -> tuple[dict, list[tuple[float, str, str, Any]]]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("format") != FORMAT or header.get("version") != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} traffic recording")
+        events = [tuple(json.loads(line)) for line in f if line.strip()]
+    events.sort(key=lambda event: event[0])
+    return header, events
+
+
+def _sse_events(lines: Iterator[str]) -> Iterator[tuple[str, str]]:
+    event, data = None, []
+    for line in lines:
+        if line == "":
+            if event is not None:
+                yield event, "\n".join(data)
+            event, data = None, []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+
+
+def record_firebase(out: str, firebase_url: str, path: str, duration_s: float | None) -> int:
+    """
+    Subscribe to the Firebase REST event stream under `path` and record every write.
+    The first event is the current contents, not a write, and is skipped.
+    Returns:
+        Number of writes recorded
+    """
+    import requests
+
+    url = f"{firebase_url.rstrip('/')}/{path.strip('/')}.json" if path.strip("/") else f"{firebase_url.rstrip('/')}/.json"
+    recorder = Recorder(out, source=url)
+    deadline = time.monotonic() + duration_s if duration_s else None
+    prefix = path.strip("/")
+    snapshot_seen = False
+    try:
+        with requests.get(url, headers={"Accept": "text/event-stream"}, stream=True, timeout=(10, 60)) as response:
+            response.raise_for_status()
+            for event, data in _sse_events(response.iter_lines(decode_unicode=True)):
+                if deadline is not None and time.monotonic() > deadline:
+                    break
+                if event in ("cancel", "auth_revoked"):
+                    print(f"Stream ended by Firebase: {event} {data}", file=sys.stderr)
+                    break
+                if event not in ("put", "patch"):
+                    continue
+                body = json.loads(data)
+                if not snapshot_seen and event == "put" and body["path"] == "/":
+                    snapshot_seen = True
+                    continue
+                written = "/".join(part for part in (prefix, body["path"].strip("/")) if part)
+                recorder.write(event.upper(), written, body["data"])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recorder.close()
+    return recorder.events
+
+
+class _Connection:
+    """Minimal keep-alive HTTP/1.1 client connection (one request at a time)."""
+
+    def __init__(self, host: str, port: int, tls: bool):
+        self.host, self.port, self.tls = host, port, tls
+        self.reader: asyncio.StreamReader | None = None
+        self.writer: asyncio.StreamWriter | None = None
+
+    async def request(self, method: str, target: str, body: bytes) -> int:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port, ssl=ssl.create_default_context() if self.tls else None
+            )
+        head = (
+            f"{method} {target} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: keep-alive\r\n\r\n"
+        )
+        self.writer.write(head.encode("latin-1") + body)
+        try:
+            status, keep_alive = await read_response(self.reader)
+        except Exception:
+            self.close()
+            raise
+        if not keep_alive:
+            self.close()
+        return status
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def read_response(reader: asyncio.StreamReader) -> tuple[int, bool]:
+    """Read one HTTP/1.1 response; returns (status, keep_alive)."""
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    headers = {name.lower(): value.strip() for name, _, value in (line.partition(":") for line in lines[1:] if line)}
+    if headers.get("transfer-encoding") == "chunked":
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get("content-length", 0)))
+    return status, headers.get("connection", "").lower() != "close"
+
+
+def to_request(target: str, base_path: str, method: str, path: str, payload: Any) -> tuple[str, str] | None:
+    """Map a recorded write onto an HTTP request (method, path) for the replay target, or None to skip it."""
+    if target == "firebase":
+        return method, f"{base_path}/{path}.json"
+    # backend: whole-node device writes become reading uploads; field-level writes have no equivalent
+    if "/" in path or not isinstance(payload, dict) or "totalWaterDrank" not in payload or "currentWeight" not in payload:
+        return None
+    return "POST", f"{base_path}/api/ingest/{path}/readings"
+
+
+async def replay(
+    events: list[tuple[float, str, str, Any]], target: str, url: str, speed: float | None, connections: int, retime: bool
+) -> dict:
+    parts = urlsplit(url)
+    tls = parts.scheme == "https"
+    host, port = parts.hostname, parts.port or (443 if tls else 80)
+    base_path = parts.path.rstrip("/")
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=connections * 4)
+    latencies: list[float] = []
+    lags: list[float] = []
+    statuses: Counter = Counter()
+    skipped = 0
+
+    async def sender() -> None:
+        connection = _Connection(host, port, tls)
+        while True:
+            item = await queue.get()
+            if item is None:
+                connection.close()
+                return
+            scheduled, method, target_path, payload = item
+            if retime and isinstance(payload, dict) and "timestamp" in payload:
+                payload = {**payload, "timestamp": datetime.now().isoformat()}
+            body = json.dumps(payload, separators=(",", ":")).encode()
+            started = time.perf_counter()
+            lags.append(max(started - scheduled, 0.0))
+            try:
+                status = await connection.request(method, target_path, body)
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                status = 0
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+
+    senders = [asyncio.create_task(sender()) for _ in range(connections)]
+    started = time.perf_counter()
+    origin_ms = events[0][0] if events else 0.0
+    for offset_ms, method, path, payload in events:
+        request = to_request(target, base_path, method, path, payload)
+        if request is None:
+            skipped += 1
+            continue
+        scheduled = started + (offset_ms - origin_ms) / 1000 / speed if speed else time.perf_counter()
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await queue.put((scheduled, request[0], request[1], payload))
+    for _ in senders:
+        await queue.put(None)
+    await asyncio.gather(*senders)
+    elapsed = time.perf_counter() - started
+
+    ms = np.asarray(latencies) * 1000
+    lag_ms = np.asarray(lags) * 1000
+
+    def percentiles(values: np.ndarray) -> dict:
+        if not len(values):
+            return {}
+        p50, p90, p99 = np.percentile(values, [50, 90, 99])
+        return {"p50_ms": round(float(p50), 3), "p90_ms": round(float(p90), 3), "p99_ms": round(float(p99), 3), "max_ms": round(float(values.max()), 3)}
+
+    sent = len(latencies)
+    return {
+        "target": target,
+        "speed": speed or "max",
+        "connections": connections,
+        "events": len(events),
+        "sent": sent,
+        "skipped": skipped,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "errors": sum(count for status, count in statuses.items() if not 200 <= status < 300),
+        "recorded_span_s": round((events[-1][0] - origin_ms) / 1000, 3) if events else 0.0,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(sent / elapsed, 1) if elapsed else 0.0,
+        "latency": percentiles(ms),
+        "lag": percentiles(lag_ms),
+    }
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> list[str]:
+    """Regressions of throughput or median latency beyond `threshold` (a fraction) versus a saved report."""
+    regressions = []
+    old_rps, new_rps = baseline.get("throughput_rps") or 0, result["throughput_rps"]
+    if old_rps and new_rps < old_rps * (1 - threshold):
+        regressions.append(f"throughput {old_rps} -> {new_rps} req/s")
+    old_p50, new_p50 = baseline.get("latency", {}).get("p50_ms"), result["latency"].get("p50_ms")
+    if old_p50 and new_p50 is not None and new_p50 > old_p50 * (1 + threshold):
+        regressions.append(f"p50 latency {old_p50} -> {new_p50} ms")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("record", help="Record writes from a Firebase database's event stream")
+    record.add_argument("out")
+    record.add_argument("--firebase-url", required=True)
+    record.add_argument("--path", default="", help="Only record under this path (e.g. a device id)")
+    record.add_argument("--duration", type=float, help="Stop after this many seconds (default: until Ctrl-C)")
+
+    play = commands.add_parser("replay", help="Re-drive a recording against Firebase (or the stand-in) or the backend")
+    play.add_argument("recording")
+    play.add_argument("--target", choices=["firebase", "backend"], default="firebase")
+    play.add_argument("--url", default="http://127.0.0.1:9000")
+    play.add_argument("--speed", default="1", help="Replay speed multiplier, or 'max'")
+    play.add_argument("--connections", type=int, default=8)
+    play.add_argument("--keep-timestamps", action="store_true", help="Send recorded payload timestamps unchanged")
+    play.add_argument("--out", help="Write the report as JSON")
+    play.add_argument("--baseline", help="Compare with a report saved by --out")
+    play.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        count = record_firebase(args.out, args.firebase_url, args.path, args.duration)
+        print(f"Recorded {count} writes to {args.out}")
+        return
+
+    header, events = read_recording(args.recording)
+    speed = None if args.speed == "max" else float(args.speed)
+    print(f"Replaying {len(events)} writes from {header['source']} ({header['started_at']}) at {args.speed}x to {args.url}")
+    result = asyncio.run(replay(events, args.target, args.url, speed, args.connections, not args.keep_timestamps))
+    result["recording"] = args.recording
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
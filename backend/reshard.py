@@ -0,0 +1,174 @@
+"""
+Move intake data to a different number of shards. Run from backend/ (next to
+hydration.db) with the server stopped, after taking a backup:
+
+    python reshard.py --shards 4       # hydration.db -> hydration.shard0..3.db
+    python reshard.py --shards 1       # back into hydration.db
+
+Then start the server with HYDRATION_INTAKE_SHARDS set to the same number.
+
+Every row of the sharded tables is copied to the shard of its user into new
+*.resharding files; only once all of them are written does the storage layout
+switch over (old shard files are removed and the new ones renamed into place), so
+an interrupted run leaves the current layout untouched. Device checkpoints and
+readings written before sharding have no user_id; they are attributed through
+user_profiles.device_id on the way.
+"""
+import argparse
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+
+from sqlalchemy import func, insert, select  # noqa: E402
+
+from app import models  # noqa: E402
+from app.database import (  # noqa: E402
+    Base, create_shard_schema, create_sqlite_engine, create_tables, engine, reserve_id_ranges,
+)
+from app.sharding import SHARDED_TABLES, shard_index, shard_path  # noqa: E402
+from app.workers import try_lock  # noqa: E402
+
+TEMP_SUFFIX = ".resharding"
+
+
+def _remove_database(path: str) -> None:
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def current_layout() -> int:
+    with engine.connect() as conn:
+        if not engine.dialect.has_table(conn, "storage_layout"):
+            return 1
+        return conn.execute(select(models.StorageLayout.intake_shards).where(models.StorageLayout.id == 1)).scalar() or 1
+
+
+def reshard(target: int, batch_size: int) -> dict[int, int]:
+    """Copy every sharded row into a `target`-shard layout and switch to it. Returns rows written per new shard."""
+    source = current_layout()
+    database_path = engine.url.database
+    tables = [table for table in Base.metadata.sorted_tables if table.name in SHARDED_TABLES]
+    source_engines = [engine] if source == 1 else [
+        create_sqlite_engine(f"sqlite:///{shard_path(database_path, index)}") for index in range(source)
+    ]
+    # Bring old files up to the current schema (storage_layout, user_id columns) before reading them
+    create_tables(engine, [table for table in Base.metadata.sorted_tables if table.name not in SHARDED_TABLES])
+    for source_engine in source_engines:
+        create_tables(source_engine, tables)
+
+    if target == 1:
+        create_tables(engine, tables)
+        target_engines = [engine]
+    else:
+        target_engines = []
+        for index in range(target):
+            path = shard_path(database_path, index) + TEMP_SUFFIX
+            _remove_database(path)
+            target_engine = create_sqlite_engine(f"sqlite:///{path}")
+            create_shard_schema(target_engine, index)
+            target_engines.append(target_engine)
+
+    with engine.connect() as conn:
+        devices = dict(conn.execute(
+            select(models.UserProfile.device_id, models.UserProfile.id).where(models.UserProfile.device_id.is_not(None))
+        ).all())
+
+    written = dict.fromkeys(range(target), 0)
+    targets = [target_engine.connect() for target_engine in target_engines]
+    try:
+        for conn in targets:
+            conn.begin()
+        floor = 0
+        for table in tables:
+            for source_engine in source_engines:
+                with source_engine.connect() as source_conn:
+                    if "id" in table.c:
+                        floor = max(floor, source_conn.execute(select(func.max(table.c.id))).scalar() or 0)
+                    rows = source_conn.execution_options(yield_per=batch_size).execute(select(table).order_by(*table.primary_key))
+                    for partition in rows.partitions():
+                        by_shard: dict[int, list[dict]] = {}
+                        for row in partition:
+                            values = dict(row._mapping)
+                            if values["user_id"] is None and "device_id" in values:
+                                values["user_id"] = devices.get(values["device_id"])
+                            by_shard.setdefault(shard_index(values["user_id"], target), []).append(values)
+                        for index, values in by_shard.items():
+                            # A device re-registered to another user can have checkpoints in two old shards
+                            targets[index].execute(insert(table).prefix_with("OR IGNORE"), values)
+                            written[index] += len(values)
+        if target > 1:
+            # New ids start above every copied id, in a separate range per shard
+            for index, conn in enumerate(targets):
+                reserve_id_ranges(conn, index, floor, replace=True)
+        else:
+            # The copy into hydration.db commits together with the layout switch
+            _switch_layout(targets[0], target, clear=False)
+        for conn in targets:
+            conn.commit()
+    finally:
+        for conn in targets:
+            conn.close()
+
+    for source_engine in source_engines:
+        source_engine.dispose()
+    for target_engine in target_engines:
+        target_engine.dispose()
+    if target > 1:
+        with engine.begin() as conn:
+            _switch_layout(conn, target, clear=source == 1)
+    if source > 1:
+        for index in range(source):
+            _remove_database(shard_path(database_path, index))
+    if target > 1:
+        for index in range(target):
+            path = shard_path(database_path, index)
+            _remove_database(path)
+            os.replace(path + TEMP_SUFFIX, path)
+    return written
+
+
+def _switch_layout(conn, shards: int, clear: bool) -> None:
+    if clear:
+        # Intake moved out of hydration.db; its pages are reused or reclaimed by retention
+        for table in reversed([table for table in Base.metadata.sorted_tables if table.name in SHARDED_TABLES]):
+            conn.execute(table.delete())
+    conn.exec_driver_sql("INSERT OR REPLACE INTO storage_layout (id, intake_shards) VALUES (1, ?)", (shards,))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, required=True, help="Number of intake shards to move to")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows read and written per batch")
+    args = parser.parse_args()
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+
+    database_path = engine.url.database
+    if not os.path.exists(database_path):
+        sys.exit(f"No database at {os.path.abspath(database_path)}; run from the directory that holds it")
+    # A running server always has one process holding the background-jobs lock
+    with open(f"{database_path}.jobs.lock", "a+b") as handle:
+        try:
+            try_lock(handle)
+        except OSError:
+            sys.exit("The server is running against this database; stop it first")
+
+        source = current_layout()
+        if source == args.shards:
+            print(f"Intake is already in {source} shard(s)")
+            return
+        started = time.perf_counter()
+        written = reshard(args.shards, args.batch_size)
+    print(f"Moved intake from {source} to {args.shards} shard(s) in {time.perf_counter() - started:.1f}s")
+    for index, rows in written.items():
+        name = database_path if args.shards == 1 else shard_path(database_path, index)
+        print(f"  {name}: {rows} rows")
+    print(f"Start the server with HYDRATION_INTAKE_SHARDS={args.shards}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Production entry point for the backend. Run from backend/:
+
+    python serve.py [--profile api|devices|dev] [--workers N] [--preload] [...]
+
+Profiles set defaults that any flag overrides:
+- api: one worker per CPU, uvloop + httptools when installed, 5 s keep-alive,
+  workers recycled every ~10k requests
+- devices: like api, tuned for many bottles posting readings every few seconds over
+  long-lived connections (75 s keep-alive, deeper accept backlog)
+- dev: a single auto-reloading worker, i.e. `uvicorn app.main:app --reload`
+
+Workers run under uvicorn's own supervisor, which restarts any worker that exits
+(recycled or crashed). --preload runs under gunicorn instead (not available on
+Windows): the app is imported and its caches warmed once in the master, and workers
+fork with that state already in memory (copy-on-write) instead of each rebuilding it.
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+from functools import partial
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+APP = "app.main:app"
+
+PROFILES = {
+    "dev": {
+        "workers": 1, "reload": True, "loop": "auto", "http": "auto",
+        "keep_alive": 5, "backlog": 2048, "max_requests": 0, "max_requests_jitter": 0,
+    },
+    "api": {
+        "workers": os.cpu_count() or 1, "reload": False, "loop": "auto", "http": "auto",
+        "keep_alive": 5, "backlog": 2048, "max_requests": 10_000, "max_requests_jitter": 1_000,
+    },
+    "devices": {
+        "workers": os.cpu_count() or 1, "reload": False, "loop": "auto", "http": "auto",
+        "keep_alive": 75, "backlog": 4096, "max_requests": 50_000, "max_requests_jitter": 5_000,
+    },
+}
+
+logger = logging.getLogger("hydration.serve")
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="api")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, help="Worker processes (profile default: one per CPU)")
+    parser.add_argument("--loop", choices=["auto", "asyncio", "uvloop"], help="Event loop; auto picks uvloop when installed")
+    parser.add_argument("--http", choices=["auto", "h11", "httptools"], help="HTTP parser; auto picks httptools when installed")
+    parser.add_argument("--keep-alive", type=int, help="Seconds an idle keep-alive connection stays open")
+    parser.add_argument("--backlog", type=int, help="Listen socket accept backlog")
+    parser.add_argument("--limit-concurrency", type=int, help="Per-worker connection limit before answering 503")
+    parser.add_argument("--max-requests", type=int, help="Recycle a worker after this many requests (0: never)")
+    parser.add_argument("--max-requests-jitter", type=int, help="Random extra requests per worker, so workers don't recycle together")
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="Seconds in-flight requests get on shutdown or recycling")
+    parser.add_argument("--preload", action="store_true", help="Import and warm the app once in the master (gunicorn)")
+    parser.add_argument("--server", choices=["auto", "uvicorn", "gunicorn"], default="auto")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--access-log", action="store_true")
+    args = parser.parse_args(argv)
+
+    for name, value in PROFILES[args.profile].items():
+        if getattr(args, name, None) is None:
+            setattr(args, name, value)
+    if args.server == "auto":
+        args.server = "gunicorn" if args.preload else "uvicorn"
+    if args.preload and args.server != "gunicorn":
+        parser.error("--preload needs --server gunicorn")
+    if args.reload and args.workers > 1:
+        parser.error("the dev profile reloads a single worker; use --profile api for --workers > 1")
+    return args
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(levelname)s:     %(message)s")
+    # Like uvicorn, the database is ./hydration.db in the working directory
+    sys.path.insert(0, BACKEND_DIR)
+    # Read by app.config in every worker: caches fed by one process's commits are
+    # bypassed, and background jobs go to a single elected process
+    os.environ["HYDRATION_WORKER_PROCESSES"] = str(args.workers)
+    if args.workers > 1:
+        _recover_report_jobs()
+
+    logger.info(
+        f"Serving {APP} with profile={args.profile} server={args.server} workers={args.workers} "
+        f"loop={args.loop} http={args.http} keep_alive={args.keep_alive}s backlog={args.backlog} "
+        f"max_requests={args.max_requests}+{args.max_requests_jitter} preload={args.preload}"
+    )
+    if args.server == "gunicorn":
+        _run_gunicorn(args)
+    else:
+        _run_uvicorn(args)
+
+
+def _recover_report_jobs() -> None:
+    # Once per server, before any worker can submit: a worker that starts later (or a
+    # newly elected one) must not fail jobs that are running in its siblings' pools
+    from app.main import recover_report_jobs
+
+    recover_report_jobs()
+
+
+def _run_uvicorn(args: argparse.Namespace) -> None:
+    import uvicorn
+    from uvicorn.supervisors import Multiprocess
+
+    if args.reload:
+        uvicorn.run(
+            APP, app_dir=BACKEND_DIR, reload=True, reload_dirs=[os.path.join(BACKEND_DIR, "app")],
+            host=args.host, port=args.port, loop=args.loop, http=args.http,
+            timeout_keep_alive=args.keep_alive, backlog=args.backlog, log_level=args.log_level,
+        )
+        return
+
+    max_requests = args.max_requests or None
+    if max_requests and args.workers == 1:
+        # A lone uvicorn worker that exits is not restarted: recycling needs a supervisor
+        logger.warning("Worker recycling disabled: it needs --workers > 1 under uvicorn")
+        max_requests = None
+    config = uvicorn.Config(
+        APP,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=args.loop,
+        http=args.http,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        limit_concurrency=args.limit_concurrency,
+        limit_max_requests=max_requests,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        access_log=args.access_log,
+        log_level=args.log_level,
+        server_header=False,
+    )
+    worker = partial(_uvicorn_worker, config, args.max_requests_jitter)
+    if args.workers > 1:
+        Multiprocess(config, target=worker, sockets=[config.bind_socket()]).run()
+    else:
+        worker()
+
+
+def _uvicorn_worker(config, jitter: int, sockets=None) -> None:
+    import uvicorn
+
+    if config.limit_max_requests and jitter:
+        config.limit_max_requests += random.randint(0, jitter)
+    uvicorn.Server(config).run(sockets=sockets)
+
+
+def _run_gunicorn(args: argparse.Namespace) -> None:
+    try:
+        from gunicorn.app.base import BaseApplication
+        from uvicorn.workers import UvicornWorker
+    except ImportError:
+        sys.exit("--server gunicorn / --preload need gunicorn: pip install gunicorn (not supported on Windows)")
+
+    class Worker(UvicornWorker):
+        CONFIG_KWARGS = {
+            "loop": args.loop,
+            "http": args.http,
+            "limit_concurrency": args.limit_concurrency,
+            "timeout_graceful_shutdown": args.graceful_timeout,
+            "server_header": False,
+        }
+
+    def post_fork(server, worker):
+        # Pooled SQLite connections opened while warming in the master belong to it
+        from app.database import all_engines
+
+        for engine in all_engines:
+            engine.dispose(close=False)
+
+    class Server(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": f"{args.host}:{args.port}",
+                "workers": args.workers,
+                "worker_class": Worker,
+                "backlog": args.backlog,
+                "keepalive": args.keep_alive,
+                "max_requests": args.max_requests,
+                "max_requests_jitter": args.max_requests_jitter,
+                "graceful_timeout": args.graceful_timeout,
+                "preload_app": args.preload,
+                "post_fork": post_fork,
+                "loglevel": args.log_level,
+                "accesslog": "-" if args.access_log else None,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app.main import app, warm_caches
+
+            if args.preload:
+                warm_caches()
+            return app
+
+    Server().run()
+
+
+if __name__ == "__main__":
+    main()
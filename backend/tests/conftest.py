@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# The app opens ./hydration.db and reads its HYDRATION_* settings at import time, so both
+# are pointed at a scratch directory before any test module imports it
+os.chdir(tempfile.mkdtemp(prefix="hydration-tests-"))
+# Two intake shards, so tests go through the shard routing that production setups use
+os.environ["HYDRATION_INTAKE_SHARDS"] = "2"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
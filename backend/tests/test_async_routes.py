@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import models
+from app.database import SessionLocal
+from app.hotcache import hot_cache
+from app.main import app
+
+# Not entered as a context manager, so the startup handler and its background workers don't run
+client = TestClient(app)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def profile():
+    response = client.put("/api/user/profile", json={"weight_kg": 80, "age": 40, "activity_level": "high", "device_id": "dev-async"})
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.fixture(autouse=True)
+def cold_cache():
+    # The routes must read SQLite through the async engine, not the in-memory tier
+    hot_cache.clear()
+
+
+def add_intake(user_id: int, intake_ml: int, timestamp: datetime) -> None:
+    db = SessionLocal()
+    try:
+        db.add(models.IntakeLog(user_id=user_id, intake_ml=intake_ml, timestamp=timestamp))
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_profile_round_trip(profile):
+    fetched = client.get("/api/user/profile").json()
+    assert fetched == profile
+    assert fetched["weight_kg"] == 80 and fetched["device_id"] == "dev-async"
+
+    # Leaving device_id out keeps the registration
+    updated = client.put("/api/user/profile", json={"weight_kg": 81}).json()
+    assert updated["weight_kg"] == 81 and updated["device_id"] == "dev-async"
+    assert client.put("/api/user/profile", json={"weight_kg": 81, "device_id": "bad.id"}).status_code == 422
+
+
+def test_daily_total_and_history(profile):
+    user_id = profile["id"]
+    now = datetime.now(timezone.utc)
+    add_intake(user_id, 200, now - timedelta(minutes=2))
+    add_intake(user_id, 300, now - timedelta(minutes=1))
+    add_intake(user_id, 999, now - timedelta(days=2))
+
+    assert client.get("/api/hydration/daily", params={"user_id": user_id}).json()["total_ml"] == 500
+    history = client.get("/api/hydration/history", params={"user_id": user_id}).json()
+    assert [entry["intake_ml"] for entry in history] == [999, 200, 300]
+
+
+def test_prediction_uses_the_profile_users_intake(profile):
+    prediction = client.get("/api/prediction").json()
+    assert prediction["intake_ml"] == client.get("/api/hydration/daily", params={"user_id": profile["id"]}).json()["total_ml"]
+    assert prediction["delta_ml"] == prediction["intake_ml"] - prediction["goal_ml"]
+
+
+def test_sync_status_lists_checkpoints_sorted():
+    db = SessionLocal()
+    try:
+        for device_id in ("zz-async", "aa-async"):
+            db.add(models.DeviceSyncState(device_id=device_id, last_total_ml=10))
+        db.commit()
+    finally:
+        db.close()
+    device_ids = [state["device_id"] for state in client.get("/api/sync/status").json()]
+    assert device_ids == sorted(device_ids)
+    assert {"aa-async", "zz-async"} <= set(device_ids)
@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import models
+from app.database import SessionLocal, ensure_schema
+from app.export import iter_intake_rows
+
+USER_ID = 900001
+AT = datetime(2024, 6, 3, 9, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def intake():
+    ensure_schema()
+    db = SessionLocal()
+    db.add(models.IntakeLog(user_id=USER_ID, intake_ml=200, timestamp=AT))
+    db.commit()
+    db.close()
+
+
+def exported(start=None, end=None) -> list[int]:
+    return [row[4] for row in iter_intake_rows(start=start, end=end, user_id=USER_ID)]
+
+
+def test_bounds_with_an_offset_are_compared_in_utc():
+    plus_two = timezone(timedelta(hours=2))
+    # 10:00+02:00 is 08:00Z, before the 09:00Z row
+    assert exported(start=datetime(2024, 6, 3, 10, 0, tzinfo=plus_two)) == [200]
+    assert exported(end=datetime(2024, 6, 3, 10, 0, tzinfo=plus_two)) == []
+    assert exported(start=datetime(2024, 6, 3, 12, 0, tzinfo=plus_two)) == []
+
+
+def test_naive_bounds_are_utc():
+    assert exported(start=datetime(2024, 6, 3, 8, 59), end=datetime(2024, 6, 3, 9, 1)) == [200]
+    assert exported(start=datetime(2024, 6, 3, 9, 1)) == []
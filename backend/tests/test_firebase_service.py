@@ -0,0 +1,118 @@
+from urllib.parse import quote
+
+import pytest
+import requests
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+from app.admission import ConcurrencyLimiter, Overloaded
+from app.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from app.firebase_service import FirebaseService
+from app.firebase_writer import FirebaseWriteBehind
+from app.main import app
+from app.schemas import UserProfileUpdate
+
+
+class StubResponse:
+    status_code = 200
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class StubSession:
+    def get(self, url, params=None, timeout=None):
+        return StubResponse({"currentWeight": 500, "totalWaterDrank": 250})
+
+
+def half_open_service() -> FirebaseService:
+    breaker = CircuitBreaker("firebase", failure_threshold=1, recovery_timeout_s=0.0)
+    breaker.record_failure()
+    service = FirebaseService("http://firebase.test", limiter=ConcurrencyLimiter("firebase", 1, 0.01), breaker=breaker)
+    service.session = StubSession()
+    return service
+
+
+def test_overloaded_half_open_call_gives_back_its_trial():
+    service = half_open_service()
+    with service.limiter.slot():
+        with pytest.raises(Overloaded):
+            service.fetch_device_snapshot("dev1")
+    assert service.breaker.state == HALF_OPEN
+
+    snapshot = service.fetch_device_snapshot("dev1")
+    assert snapshot.data["totalWaterDrank"] == 250
+    assert service.breaker.state == CLOSED
+
+
+def test_overloaded_write_is_requeued_and_gives_back_its_trial():
+    service = half_open_service()
+    writer = FirebaseWriteBehind(service, interval_s=60, max_paths=500)
+    writer.enqueue("dev1", {"totalWaterDrank": 250})
+    with service.limiter.slot():
+        assert writer.flush() == 0
+    assert writer.failed_patches == 1
+    assert service.breaker.state == HALF_OPEN
+
+    service.session.patch = lambda url, json=None, timeout=None: StubResponse(None)
+    assert writer.flush() == 1
+    assert service.breaker.state == CLOSED
+
+
+class RejectingSession:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.patches = 0
+
+    def patch(self, url, json=None, timeout=None):
+        self.patches += 1
+        response = requests.Response()
+        response.status_code = self.status_code
+        response._content = b'{"error": "Invalid data; couldn\'t parse key beginning at 1:2"}'
+        return response
+
+
+def writer_with(session) -> FirebaseWriteBehind:
+    breaker = CircuitBreaker("firebase", failure_threshold=1, recovery_timeout_s=60.0)
+    service = FirebaseService("http://firebase.test", limiter=ConcurrencyLimiter("firebase", 1, 0.01), breaker=breaker)
+    service.session = session
+    return FirebaseWriteBehind(service, interval_s=60, max_paths=500)
+
+
+def test_rejected_write_is_dropped_without_tripping_the_breaker():
+    writer = writer_with(RejectingSession(400))
+    writer.enqueue("bad.id", {"totalWaterDrank": 250})
+    assert writer.flush() == 0
+    assert writer.flush() == 0
+    assert writer.service.session.patches == 1
+    assert writer.stats()["rejected_patches"] == 1
+    assert writer.failed_patches == 0
+    assert writer.service.breaker.state == CLOSED
+
+
+def test_throttled_write_is_requeued_and_counts_as_a_failure():
+    writer = writer_with(RejectingSession(429))
+    writer.enqueue("dev1", {"totalWaterDrank": 250})
+    assert writer.flush() == 0
+    assert writer.failed_patches == 1
+    assert writer.stats()["pending_devices"] == 1
+    assert writer.service.breaker.state == OPEN
+
+
+@pytest.mark.parametrize("device_id", ["bad.id", "a$b", "a#b", "a[0]", "a]"])
+def test_device_ids_firebase_would_refuse_are_rejected(device_id):
+    with pytest.raises(ValidationError):
+        UserProfileUpdate(weight_kg=70, device_id=device_id)
+    response = TestClient(app).post(f"/api/ingest/{quote(device_id, safe='')}/readings", json={"currentWeight": 1, "totalWaterDrank": 2})
+    assert response.status_code == 422
+
+
+def test_firebase_style_device_ids_are_accepted():
+    assert UserProfileUpdate(weight_kg=70, device_id="-OcQBJZE__Q1uTdi4USo").device_id == "-OcQBJZE__Q1uTdi4USo"
+    assert UserProfileUpdate(weight_kg=70, device_id=None).device_id is None
@@ -0,0 +1,45 @@
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from app.database import ensure_schema
+from app.forecast import ForecastEngine, ForecastWorker
+
+
+@pytest.fixture(scope="module", autouse=True)
+def schema():
+    ensure_schema()
+
+
+class CountingEngine(ForecastEngine):
+    def __init__(self):
+        super().__init__(min_history_days=3)
+        self.rebuilds = 0
+
+    def rebuild(self, db, window_days):
+        self.rebuilds += 1
+        self.built_at = time.time()
+        return 0
+
+
+@pytest.mark.parametrize("now, due", [
+    (datetime(2024, 5, 1, 2, 59, tzinfo=timezone.utc), datetime(2024, 4, 30, 3, 0, tzinfo=timezone.utc)),
+    (datetime(2024, 5, 1, 3, 0, tzinfo=timezone.utc), datetime(2024, 5, 1, 3, 0, tzinfo=timezone.utc)),
+    (datetime(2024, 5, 1, 23, 0, tzinfo=timezone.utc), datetime(2024, 5, 1, 3, 0, tzinfo=timezone.utc)),
+])
+def test_last_due_is_the_latest_scheduled_hour(now, due):
+    assert ForecastWorker(CountingEngine(), 3, 28, poll_s=60).last_due(now) == due
+
+
+def test_rebuilds_once_per_scheduled_hour():
+    engine = CountingEngine()
+    worker = ForecastWorker(engine, datetime.now(timezone.utc).hour, 28, poll_s=60)
+    worker.run_once()
+    worker.run_once()
+    assert engine.rebuilds == 1
+
+    # Built before today's scheduled hour, e.g. by a long-running process: due again
+    engine.built_at = worker.last_due().timestamp() - 1
+    worker.run_once()
+    assert engine.rebuilds == 2
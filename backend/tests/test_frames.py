@@ -0,0 +1,48 @@
+import time
+
+import numpy as np
+import pytest
+
+from app.frames import HEADER, RECORD_DTYPE, FrameError, decode_frame, encode_frame
+
+
+def records(timestamps_ms) -> np.ndarray:
+    frame = np.zeros(len(timestamps_ms), dtype=RECORD_DTYPE)
+    frame["timestamp_ms"] = timestamps_ms
+    frame["weight_g"] = 640
+    frame["total_ml"] = np.arange(len(timestamps_ms)) * 10
+    frame["battery_pct"] = 90
+    frame["temperature_cc"] = -150
+    return frame
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def test_round_trip():
+    sent = records([now_ms() - 2000, now_ms() - 1000])
+    decoded = decode_frame(encode_frame(sent))
+    assert decoded.tolist() == sent.tolist()
+    assert decoded["temperature_cc"][0] == -150
+
+
+def test_empty_frame():
+    assert len(decode_frame(encode_frame(records([])))) == 0
+
+
+@pytest.mark.parametrize("payload, message", [
+    (b"HH", "shorter than header"),
+    (b"XX" + encode_frame(records([now_ms()]))[2:], "magic"),
+    (HEADER.pack(b"HH", 2, 0, 0), "version"),
+    (encode_frame(records([now_ms()]))[:-1], "does not match"),
+])
+def test_malformed_frames_are_rejected(payload, message):
+    with pytest.raises(FrameError, match=message):
+        decode_frame(payload)
+
+
+@pytest.mark.parametrize("timestamp_ms", [10**16, 0, now_ms() + 2 * 86_400_000])
+def test_out_of_range_timestamps_are_rejected(timestamp_ms):
+    with pytest.raises(FrameError, match="Record 1 has an out-of-range timestamp_ms"):
+        decode_frame(encode_frame(records([now_ms(), timestamp_ms])))
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta, timezone
+
+from app.config import settings
+from app.crud import get_history
+from app.hotcache import HotIntakeCache, IntakeRing, _epoch_ms
+
+NOW = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class EmptyDb:
+    def execute(self, statement):
+        return self
+
+    def all(self):
+        return []
+
+
+def warm_cache(user_capacity: int = 4, global_capacity: int = 64) -> HotIntakeCache:
+    cache = HotIntakeCache(timedelta(hours=24), user_capacity=user_capacity, global_capacity=global_capacity)
+    cache.warm(EmptyDb(), now=NOW)
+    return cache
+
+
+def at(minutes: int) -> datetime:
+    return NOW + timedelta(minutes=minutes)
+
+
+def test_totals_and_newest_rows_per_user():
+    cache = warm_cache()
+    cache.observe(1, at(1), 100, entry_id=1)
+    cache.observe(2, at(2), 200, entry_id=2)
+    cache.observe(1, at(3), 50, entry_id=3)
+    cache.observe(None, at(4), 25, entry_id=4)
+
+    assert cache.total_since(1, at(0)) == 150
+    assert cache.total_since(1, at(2)) == 50
+    assert cache.total_since(None, at(0)) == 375
+    assert cache.total_since(3, at(0)) == 0
+    assert cache.newest(1, 2) == [(1, at(1), 100), (3, at(3), 50)]
+    assert cache.newest(1, 3) is None
+
+
+def test_reads_before_the_window_fall_back():
+    cache = warm_cache()
+    assert cache.total_since(1, NOW - timedelta(hours=25)) is None
+    assert cache.total_since(1, NOW - timedelta(hours=23)) == 0
+
+
+def test_eviction_moves_the_complete_bound():
+    cache = warm_cache(user_capacity=2)
+    for entry_id in range(1, 4):
+        cache.observe(1, at(entry_id), 10, entry_id=entry_id)
+
+    assert cache.total_since(1, at(1)) is None
+    assert cache.total_since(1, at(2)) == 20
+    assert cache.newest(1, 2) == [(2, at(2), 10), (3, at(3), 10)]
+
+
+def test_late_rows_keep_the_bound_past_every_evicted_row():
+    ring = IntakeRing(2, complete_since_ms=0)
+    ring.append(_epoch_ms(at(10)), 10, 1)
+    ring.append(_epoch_ms(at(5)), 20, 2)  # arrives late, older than the row before it
+    ring.append(_epoch_ms(at(11)), 30, 3)  # evicts row 1
+
+    # Row 2 is still held, but rows between it and the evicted row may not be
+    assert ring.complete_since_ms == _epoch_ms(at(10)) + 1
+    assert ring.total_since(_epoch_ms(at(5))) is None
+    assert ring.total_since(_epoch_ms(at(10)) + 1) == 30
+
+    ring.append(_epoch_ms(at(12)), 40, 4)  # evicts the late row: the bound must not move back
+    assert ring.complete_since_ms == _epoch_ms(at(10)) + 1
+    assert ring.newest(2) == [(3, _epoch_ms(at(11)), 30), (4, _epoch_ms(at(12)), 40)]
+
+
+def test_unidentified_rows_stop_serving_until_warmed():
+    cache = warm_cache()
+    cache.observe(1, at(1), 100)
+    assert cache.total_since(1, at(0)) is None
+    assert not cache.stats()["warm"]
+
+
+def test_stats_count_each_row_once():
+    cache = warm_cache()
+    cache.observe(1, at(1), 100, entry_id=1)
+    cache.observe(None, at(2), 50, entry_id=2)
+    stats = cache.stats()
+    assert stats["rows"] == 2
+    assert stats["users"] == 1
+
+
+def test_user_rings_hold_a_full_default_history(monkeypatch):
+    cache = warm_cache(user_capacity=settings.hot_cache_user_capacity)
+    monkeypatch.setattr("app.crud.hot_cache", cache)
+    for entry_id in range(1, 601):
+        cache.observe(1, NOW + timedelta(seconds=entry_id), 10, entry_id=entry_id)
+
+    history = get_history(None, user_id=1)
+    assert [entry.id for entry in history] == list(range(101, 601))
+    assert cache.hits == 1
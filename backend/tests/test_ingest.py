@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta, timezone
+from itertools import count
+
+import pytest
+from sqlalchemy import select
+
+from app import models
+from app.database import SessionLocal, ensure_schema
+from app.ingest import ingest_weight_samples
+from app.loadcell import LoadCellConfig, SipDetector, detect_sips, total_sip_ml
+from app.timeutil import as_utc
+
+_devices = count()
+# A full bottle, a 150 g sip, then a 300 g refill, each held long enough to settle
+WEIGHTS = [700.0] * 12 + [550.0] * 12 + [850.0] * 12
+
+
+@pytest.fixture(scope="module", autouse=True)
+def schema():
+    ensure_schema()
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+def test_detector_reports_sip_then_refill():
+    events = SipDetector(LoadCellConfig()).process_many(WEIGHTS)
+    assert [(event.kind, event.amount_ml) for event in events] == [("sip", 150), ("refill", 300)]
+    assert total_sip_ml(events) == 150
+
+
+def test_batch_detection_matches_streaming():
+    streamed = SipDetector(LoadCellConfig()).process_many(WEIGHTS)
+    batch = detect_sips(WEIGHTS)
+    assert [(e.kind, e.amount_ml, e.sample_index) for e in batch] == [
+        (e.kind, e.amount_ml, e.sample_index) for e in streamed
+    ]
+
+
+def test_pickup_swing_is_not_a_sip():
+    weights = [700.0] * 12 + [0.0, 0.0, 300.0, 900.0] + [700.0] * 12
+    assert SipDetector(LoadCellConfig()).process_many(weights) == []
+
+
+def test_offset_timestamps_are_stored_as_utc(db):
+    device_id = f"sipdev{next(_devices)}"
+    start = datetime(2024, 5, 1, 10, 0, tzinfo=timezone(timedelta(hours=2)))
+    samples = [(weight, start + timedelta(seconds=i)) for i, weight in enumerate(WEIGHTS)]
+
+    events = ingest_weight_samples(db, device_id, 7, samples)
+
+    sip = next(event for event in events if event.kind == "sip")
+    stored = db.execute(select(models.IntakeLog).where(models.IntakeLog.user_id == 7)).scalars().one()
+    assert stored.intake_ml == sip.amount_ml
+    assert as_utc(stored.timestamp) == sip.timestamp == start + timedelta(seconds=sip.sample_index)
+    assert as_utc(stored.timestamp).hour == 8
@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from app.forecast import forecast_engine
+from app.reminders import LogSink, ReminderScheduler, behind_at
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def scheduler(sink_kind: str) -> ReminderScheduler:
+    return ReminderScheduler(sink_kind, forecast_engine, 30, 250, 7200, 3600, 500, 300)
+
+
+def test_sink_is_built_on_start():
+    reminders = scheduler("log")
+    assert reminders.sink is None
+    reminders.start()
+    try:
+        assert isinstance(reminders.sink, LogSink)
+    finally:
+        reminders.stop()
+
+
+def test_webhook_sink_without_url_fails_on_start_only():
+    reminders = scheduler("webhook")
+    with pytest.raises(ValueError):
+        reminders.start()
+    assert not reminders.running
+
+
+def test_app_imports_with_an_unusable_sink_when_reminders_are_off(tmp_path):
+    env = {**os.environ, "HYDRATION_REMINDER_SINK": "webhook", "HYDRATION_REMINDERS_ENABLED": "false",
+           "HYDRATION_INTAKE_SHARDS": "1", "PYTHONPATH": BACKEND_DIR}
+    result = subprocess.run([sys.executable, "-c", "import app.main"], cwd=tmp_path, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+def test_behind_at_interpolates_within_the_hour():
+    # 100 ml expected per hour: 150 ml drunk falls 250 ml behind once 400 ml is expected, at 04:00
+    expected = np.cumsum(np.full((2, 24), 100.0), axis=1)
+    hours = behind_at(expected, np.array([150.0, 5000.0]), 250)
+    assert hours[0] == pytest.approx(4.0)
+    assert np.isinf(hours[1])
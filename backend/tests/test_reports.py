@@ -0,0 +1,23 @@
+import math
+
+import numpy as np
+
+from app.reports import compute_reports
+
+EMPTY = np.zeros(0, dtype=np.int64)
+
+
+def test_period_without_elapsed_days_reports_zeros():
+    metrics = compute_reports(EMPTY, EMPTY, EMPTY, np.array([1, 2]), np.array([2450, 2100]), first_day=20000, n_days=0)
+    assert metrics["avg_daily_ml"].tolist() == [0.0, 0.0]
+    assert metrics["attainment_pct"].tolist() == [0.0, 0.0]
+    assert not any(math.isnan(value) for name in ("avg_daily_ml", "attainment_pct") for value in metrics[name])
+
+
+def test_metrics_over_a_period():
+    users, days, intake = np.array([1, 1, 1, 2]), np.array([0, 1, 2, 1]), np.array([2500, 2500, 100, 3000])
+    metrics = compute_reports(users, days, intake, np.array([1, 2]), np.array([2450, 2100]), first_day=0, n_days=3)
+    assert metrics["total_ml"].tolist() == [5100, 3000]
+    assert metrics["goal_days"].tolist() == [2, 1]
+    assert metrics["longest_streak"].tolist() == [2, 1]
+    assert metrics["current_streak"].tolist() == [0, 0]
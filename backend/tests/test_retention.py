@@ -0,0 +1,76 @@
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from app import crud, models
+from app.database import SessionLocal, ensure_schema
+from app.retention import compact_chunk, retention_cutoff
+
+# Old enough that no other test module writes intake this early
+CUTOFF = datetime(2021, 1, 1, tzinfo=timezone.utc)
+DAY = date(2020, 12, 30)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def schema():
+    ensure_schema()
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+def at(day: date, hour: int) -> datetime:
+    return datetime(day.year, day.month, day.day, hour, tzinfo=timezone.utc)
+
+
+def summaries(db, user_ids) -> dict:
+    rows = db.execute(
+        select(models.IntakeDailySummary).where(
+            models.IntakeDailySummary.day < CUTOFF.date(),
+            models.IntakeDailySummary.user_id.is_(None) | models.IntakeDailySummary.user_id.in_(user_ids),
+        )
+    ).scalars().all()
+    return {(row.user_id, row.day): (row.total_ml, row.entry_count) for row in rows}
+
+
+def test_cutoff_is_a_utc_day_boundary():
+    assert retention_cutoff(90, today=date(2024, 5, 1)) == datetime(2024, 2, 1, tzinfo=timezone.utc)
+    with pytest.raises(ValueError):
+        retention_cutoff(0)
+
+
+def test_old_rows_roll_up_into_one_summary_per_user_and_day(db):
+    next_day = DAY + timedelta(days=1)
+    rows = [
+        (901, at(DAY, 8), 100), (901, at(DAY, 9), 150), (901, at(DAY, 23), 50),
+        (901, at(next_day, 7), 200), (902, at(DAY, 10), 300),
+        (None, at(DAY, 11), 40), (None, at(DAY, 12), 60),
+        (901, CUTOFF, 500),
+    ]
+    db.add_all(models.IntakeLog(user_id=user_id, timestamp=timestamp, intake_ml=ml) for user_id, timestamp, ml in rows)
+    db.commit()
+
+    # Small chunks split days across transactions; later chunks must add to the same summary
+    while compact_chunk(db, CUTOFF, chunk_size=2):
+        pass
+
+    assert summaries(db, [901, 902]) == {
+        (901, DAY): (300, 3),
+        (901, next_day): (200, 1),
+        (902, DAY): (300, 1),
+        (None, DAY): (100, 2),
+    }
+    remaining = db.execute(
+        select(models.IntakeLog.intake_ml).where(models.IntakeLog.user_id.in_([901, 902]))
+    ).scalars().all()
+    assert remaining == [500]
+
+
+def test_history_reads_summaries_after_the_raw_rows(db):
+    history = crud.get_history(db, user_id=901)
+    assert [(entry.intake_ml, entry.compacted) for entry in history] == [(300, True), (200, True), (500, False)]
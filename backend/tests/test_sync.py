@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta, timezone
+from itertools import count
+
+import numpy as np
+import pytest
+from sqlalchemy import func, select
+
+from app import models
+from app.database import SessionLocal, ensure_schema, intake_engines
+from app.sharding import shard_index
+from app.sync import apply_cumulative_batch, apply_cumulative_reading
+
+_devices = count()
+_users = count(1)
+START = datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def schema():
+    ensure_schema()
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+def user_in_shard(index: int) -> int:
+    return next(user_id for user_id in _users if shard_index(user_id, len(intake_engines)) == index)
+
+
+def new_device() -> str:
+    return f"dev{next(_devices)}"
+
+
+def record(db, device_id: str, total_ml: int, user_id: int | None, minutes: int) -> int:
+    delta = apply_cumulative_reading(db, device_id, total_ml, START + timedelta(minutes=minutes), user_id)
+    db.commit()
+    return delta
+
+
+def checkpoints(device_id: str) -> list[tuple[int, int | None, int]]:
+    """(shard index, user_id, last_total_ml) of every checkpoint row of the device, read from the files."""
+    rows = []
+    for index, bind in enumerate(intake_engines):
+        with bind.connect() as conn:
+            rows += [
+                (index, user_id, total)
+                for user_id, total in conn.exec_driver_sql(
+                    "SELECT user_id, last_total_ml FROM device_sync_state WHERE device_id = ?", (device_id,)
+                )
+            ]
+    return rows
+
+
+def intake_of(db, user_ids: list[int]) -> int:
+    totals = db.execute(
+        select(func.coalesce(func.sum(models.IntakeLog.intake_ml), 0)).where(models.IntakeLog.user_id.in_(user_ids))
+    ).scalars()
+    return int(sum(totals))
+
+
+def test_checkpoint_lives_in_the_shard_of_its_user(db):
+    device_id, user_id = new_device(), user_in_shard(1)
+    assert record(db, device_id, 1000, user_id, 0) == 1000
+    assert record(db, device_id, 1100, user_id, 1) == 100
+    assert checkpoints(device_id) == [(1, user_id, 1100)]
+
+
+def test_unattributed_device_keeps_its_checkpoint_when_attributed(db):
+    device_id, user_id = new_device(), user_in_shard(1)
+    assert record(db, device_id, 1000, None, 0) == 1000
+    assert checkpoints(device_id) == [(0, None, 1000)]
+
+    assert record(db, device_id, 1100, user_id, 1) == 100
+    assert checkpoints(device_id) == [(1, user_id, 1100)]
+    assert intake_of(db, [user_id]) == 100
+
+
+def test_reattributed_device_moves_its_checkpoint_between_shards(db):
+    device_id, first, second = new_device(), user_in_shard(0), user_in_shard(1)
+    record(db, device_id, 1000, first, 0)
+    assert record(db, device_id, 1100, second, 1) == 100
+    assert checkpoints(device_id) == [(1, second, 1100)]
+
+    # Back to the first user: no stale checkpoint is left in its shard
+    assert record(db, device_id, 1250, first, 2) == 150
+    assert checkpoints(device_id) == [(0, first, 1250)]
+    assert intake_of(db, [first, second]) == 1250
+
+
+def test_old_readings_stay_ignored_after_a_move(db):
+    device_id, first, second = new_device(), user_in_shard(0), user_in_shard(1)
+    record(db, device_id, 1000, first, 5)
+    assert record(db, device_id, 1000, second, 4) == 0
+    assert checkpoints(device_id) == [(1, second, 1000)]
+
+
+def test_batch_ingest_moves_the_checkpoint(db):
+    device_id, first, second = new_device(), user_in_shard(0), user_in_shard(1)
+    record(db, device_id, 1000, first, 0)
+
+    start_ms = int((START + timedelta(minutes=1)).timestamp() * 1000)
+    intake = apply_cumulative_batch(
+        db, device_id, second, np.array([start_ms, start_ms + 1000]), np.array([1050, 1200])
+    )
+    db.commit()
+    assert [delta for _, delta, _ in intake] == [50, 150]
+    assert checkpoints(device_id) == [(1, second, 1200)]
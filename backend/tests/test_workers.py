@@ -0,0 +1,30 @@
+import threading
+
+import pytest
+
+from app.workers import PeriodicWorker
+
+
+def test_worker_without_run_once_fails_at_construction():
+    class Forgetful(PeriodicWorker):
+        pass
+
+    with pytest.raises(TypeError):
+        Forgetful(1.0)
+
+
+def test_worker_keeps_running_after_a_failed_run():
+    calls = threading.Semaphore(0)
+
+    class Flaky(PeriodicWorker):
+        def run_once(self):
+            calls.release()
+            raise RuntimeError("boom")
+
+    worker = Flaky(0.01)
+    worker.start()
+    try:
+        assert calls.acquire(timeout=2) and calls.acquire(timeout=2)
+    finally:
+        worker.stop()
+    assert not worker.running
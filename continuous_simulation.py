@@ -2,6 +2,7 @@
 """
 Continuous Hardware Simulation - Keeps sending data until daily goal is reached
 """
+import os
 import requests
 import json
 import time
@@ -9,9 +10,9 @@ import random
 from datetime import datetime
 
 # Configuration
-FIREBASE_URL = "https://hydro-b2c6c-default-rtdb.firebaseio.com"
+FIREBASE_URL = os.environ.get("HYDRATION_FIREBASE_URL", "https://hydro-b2c6c-default-rtdb.firebaseio.com")
 DEVICE_ID = "-0cPc2eDvRwhkvZ4U1Au"
-BACKEND_URL = "http://localhost:8000/api"
+BACKEND_URL = os.environ.get("HYDRATION_BACKEND_URL", "http://localhost:8000") + "/api"
 
 # Starting values
 current_weight = 500  # grams
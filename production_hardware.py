@@ -10,14 +10,20 @@ import random
 import threading
 from datetime import datetime, timedelta
 import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.loadcell import SipDetector, synthetic_pour_samples, total_sip_ml
+from app.reporting import ReportingPolicy
 
 class ProductionHardwareSimulator:
     def __init__(self):
-        self.firebase_url = "https://hydro-b2c6c-default-rtdb.firebaseio.com"
+        self.firebase_url = os.environ.get("HYDRATION_FIREBASE_URL", "https://hydro-b2c6c-default-rtdb.firebaseio.com")
         self.device_id = "-0cPc2eDvRwhkvZ4U1Au"
-        self.backend_url = "http://localhost:8000/api"
+        self.backend_url = os.environ.get("HYDRATION_BACKEND_URL", "http://localhost:8000") + "/api"
         
         # Hardware state
+        self.bottle_capacity = 500  # grams of water in a full bottle
         self.bottle_weight = 500  # grams
         self.total_consumed = 0   # ml
         self.daily_goal = 2450    # ml (default)
@@ -29,6 +35,13 @@ class ProductionHardwareSimulator:
         self.backend_connected = False
         self.firebase_connected = False
         
+        # Load cell: intake is derived from filtered weight plateaus, not subtraction
+        self.sip_detector = SipDetector()
+        self.sip_detector.process_many([self.bottle_weight] * 20)
+        
+        # Firmware reporting: transmit on change beyond a deadband, heartbeat otherwise
+        self.reporting = ReportingPolicy()
+        
     def check_backend_connection(self):
         """Check if backend is running"""
         try:
@@ -55,8 +68,16 @@ class ProductionHardwareSimulator:
         }
         
         try:
-            url = f"{self.firebase_url}/{self.device_id}.json"
-            response = requests.put(url, json=sensor_data, timeout=5)
+            response = None
+            if self.backend_connected:
+                # The backend stores the reading and forwards it to Firebase in batches
+                response = requests.post(
+                    f"{self.backend_url}/ingest/{self.device_id}/readings", json=sensor_data, timeout=5
+                )
+            if response is None or response.status_code == 404:
+                # No backend, or this device isn't registered there: write Firebase directly
+                url = f"{self.firebase_url}/{self.device_id}.json"
+                response = requests.put(url, json=sensor_data, timeout=5)
             
             if response.status_code == 200:
                 self.firebase_connected = True
@@ -77,6 +98,20 @@ class ProductionHardwareSimulator:
             print(f"❌ Connection error: {e}")
             return False
     
+    def report_reading(self, now):
+        """Send the current reading if the reporting policy calls for it"""
+        reason = self.reporting.decide(self.bottle_weight, self.total_consumed, now)
+        if reason is not None and self.send_sensor_data():
+            self.reporting.sent(reason, self.bottle_weight, self.total_consumed, now)
+    
+    def print_reporting_stats(self, elapsed):
+        """Print how many writes the reporting policy saved"""
+        stats = self.reporting.stats
+        fixed = int(elapsed / self.reporting.config.fast_interval_s) + 1
+        print(f"📡 Reports: {stats.sent} sent of {stats.samples} samples "
+              f"({stats.changes} changes, {stats.heartbeats} heartbeats, {stats.suppressed} suppressed)")
+        print(f"📡 A fixed {self.reporting.config.fast_interval_s:g}s schedule would have sent {fixed}")
+    
     def simulate_drinking_event(self):
         """Simulate a drinking event"""
         if self.total_consumed >= self.daily_goal:
@@ -89,14 +124,20 @@ class ProductionHardwareSimulator:
             random.randint(60, 120),  # Large gulp
         ])
         
-        # Don't exceed daily goal
+        # Don't exceed daily goal (but stay above what the load cell can resolve)
         remaining = self.daily_goal - self.total_consumed
         if sip_size > remaining:
-            sip_size = remaining
+            sip_size = max(remaining, 15)
+        
+        # Refill when the bottle can't cover this sip
+        if self.bottle_weight - sip_size < 30:
+            self.sip_detector.process_many(synthetic_pour_samples(self.bottle_weight, self.bottle_capacity))
+            self.bottle_weight = self.bottle_capacity
         
-        # Update hardware state
-        self.total_consumed += sip_size
-        self.bottle_weight = max(0, self.bottle_weight - sip_size)
+        # Update hardware state from what the load cell actually detects
+        samples = synthetic_pour_samples(self.bottle_weight, self.bottle_weight - sip_size)
+        self.total_consumed += total_sip_ml(self.sip_detector.process_many(samples))
+        self.bottle_weight = int(round(self.sip_detector.baseline_g))
         self.last_update = datetime.now()
         
         return True
@@ -127,22 +168,25 @@ class ProductionHardwareSimulator:
         
         self.print_system_status()
         
+        started = time.monotonic()
+        next_drink = started + random.randint(10, 30)
         try:
             while self.is_running and self.total_consumed < self.daily_goal:
-                # Send sensor data to Firebase
-                self.send_sensor_data()
-                
-                # Wait before next drinking event (10-30 seconds)
-                wait_time = random.randint(10, 30)
-                time.sleep(wait_time)
+                now = time.monotonic()
                 
-                # Simulate drinking
-                if not self.simulate_drinking_event():
-                    break
+                # The bottle only sees sips taken since its last sample
+                if now >= next_drink:
+                    if not self.simulate_drinking_event():
+                        break
+                    # Sips come in bursts: often another one within seconds, else 10-30 seconds
+                    next_drink = now + (random.randint(2, 6) if random.random() < 0.5 else random.randint(10, 30))
+                    
+                    # Periodically check backend connection
+                    if random.random() < 0.1:  # 10% chance
+                        self.check_backend_connection()
                 
-                # Periodically check backend connection
-                if random.random() < 0.1:  # 10% chance
-                    self.check_backend_connection()
+                self.report_reading(now)
+                time.sleep(self.reporting.next_interval(now))
             
             # Goal reached
             print(f"\n🎉 DAILY HYDRATION GOAL ACHIEVED!")
@@ -150,11 +194,13 @@ class ProductionHardwareSimulator:
             print(f"✅ Goal: {self.daily_goal}ml")
             
             # Send final data
-            self.send_sensor_data()
+            self.report_reading(time.monotonic())
+            self.print_reporting_stats(time.monotonic() - started)
             
         except KeyboardInterrupt:
             print(f"\n⏹️  Hardware simulation stopped")
             print(f"📊 Final stats: {self.total_consumed}ml/{self.daily_goal}ml")
+            self.print_reporting_stats(time.monotonic() - started)
             
         except Exception as e:
             print(f"\n❌ Hardware error: {e}")
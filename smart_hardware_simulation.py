@@ -6,13 +6,19 @@ import requests
 import json
 import time
 import random
+import sys
+import os
 from datetime import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.loadcell import SipDetector, synthetic_pour_samples, total_sip_ml
+from app.reporting import ReportingPolicy
+
 class SmartHydrationSimulator:
     def __init__(self):
-        self.firebase_url = "https://hydro-b2c6c-default-rtdb.firebaseio.com"
+        self.firebase_url = os.environ.get("HYDRATION_FIREBASE_URL", "https://hydro-b2c6c-default-rtdb.firebaseio.com")
         self.device_id = "-0cPc2eDvRwhkvZ4U1Au"
-        self.backend_url = "http://localhost:8000/api"
+        self.backend_url = os.environ.get("HYDRATION_BACKEND_URL", "http://localhost:8000") + "/api"
         
         # Starting values
         self.current_weight = 500  # Starting bottle weight in grams
@@ -20,6 +26,14 @@ class SmartHydrationSimulator:
         self.daily_goal = 0
         self.user_weight = 70  # Default weight
         
+        # Load cell: intake is derived from filtered weight plateaus, not subtraction
+        self.bottle_capacity = 500
+        self.sip_detector = SipDetector()
+        self.sip_detector.process_many([self.current_weight] * 20)
+        
+        # Firmware reporting: transmit on change beyond a deadband, heartbeat otherwise
+        self.reporting = ReportingPolicy()
+        
     def get_user_profile(self):
         """Get user profile from backend to calculate daily goal"""
         try:
@@ -70,21 +84,31 @@ class SmartHydrationSimulator:
         # Simulate drinking: 15-50ml per sip
         sip_amount = random.randint(15, 50)
         
-        # Don't exceed the daily goal
+        # Don't exceed the daily goal (but stay above what the load cell can resolve)
         remaining = self.daily_goal - self.total_water_drank
         if sip_amount > remaining:
-            sip_amount = remaining
+            sip_amount = max(remaining, 15)
         
-        # Update values
-        self.total_water_drank += sip_amount
-        self.current_weight -= sip_amount  # Bottle gets lighter
+        # Refill when the bottle can't cover this sip
+        if self.current_weight - sip_amount < 30:
+            self.sip_detector.process_many(synthetic_pour_samples(self.current_weight, self.bottle_capacity))
+            self.current_weight = self.bottle_capacity
         
-        # Ensure weight doesn't go negative
-        if self.current_weight < 0:
-            self.current_weight = 0
+        # Update values from what the load cell actually detects
+        samples = synthetic_pour_samples(self.current_weight, self.current_weight - sip_amount)
+        self.total_water_drank += total_sip_ml(self.sip_detector.process_many(samples))
+        self.current_weight = int(round(self.sip_detector.baseline_g))  # Bottle gets lighter
             
         return True
     
+    def print_reporting_stats(self, elapsed):
+        """Print how many writes the reporting policy saved"""
+        stats = self.reporting.stats
+        fast = self.reporting.config.fast_interval_s
+        print(f"📡 Reports: {stats.sent} sent of {stats.samples} samples "
+              f"({stats.changes} changes, {stats.heartbeats} heartbeats, {stats.suppressed} suppressed)")
+        print(f"📡 A fixed {fast:g}s schedule would have sent {int(elapsed / fast) + 1}")
+    
     def run_simulation(self, interval_seconds=15):
         """Run the continuous simulation"""
         print("🚀 Starting Smart Hydration Hardware Simulation")
@@ -93,41 +117,51 @@ class SmartHydrationSimulator:
         # Get user profile and daily goal
         self.get_user_profile()
         
-        print(f"⏱️  Sending data every {interval_seconds} seconds")
+        config = self.reporting.config
+        print(f"⏱️  Sipping every {interval_seconds} seconds")
+        print(f"📡 Sending on changes over {config.weight_deadband_g:g}g / {config.total_deadband_ml}ml, "
+              f"heartbeat every {config.heartbeat_s:g}s")
         print(f"🥤 Simulating sips of 15-50ml each")
         print(f"🎯 Target: {self.daily_goal}ml")
         print("=" * 60)
         
+        started = time.monotonic()
+        next_sip = started + interval_seconds
         try:
             while True:
-                # Send current data to Firebase
-                if not self.send_data_to_firebase():
-                    print("⚠️  Failed to send data, retrying in 5 seconds...")
-                    time.sleep(5)
-                    continue
+                now = time.monotonic()
+                
+                # Simulate drinking (the bottle notices at its next sample)
+                if now >= next_sip:
+                    if not self.simulate_drinking():
+                        break
+                    next_sip = now + interval_seconds
                 
-                # Check if goal is reached
+                # Send current data to Firebase when the reporting policy calls for it
+                reason = self.reporting.decide(self.current_weight, self.total_water_drank, now)
+                if reason is not None:
+                    if not self.send_data_to_firebase():
+                        print("⚠️  Failed to send data, retrying in 5 seconds...")
+                        time.sleep(5)
+                        continue
+                    self.reporting.sent(reason, self.current_weight, self.total_water_drank, now)
+                
+                # Check if goal is reached (the final reading has just gone out as a change)
                 if self.total_water_drank >= self.daily_goal:
                     print("\n🎉 DAILY HYDRATION GOAL REACHED! 🎉")
                     print(f"✅ Total consumed: {self.total_water_drank}ml")
                     print(f"✅ Goal: {self.daily_goal}ml")
                     print("🏁 Simulation complete!")
-                    
-                    # Send final data
-                    self.send_data_to_firebase()
+                    self.print_reporting_stats(time.monotonic() - started)
                     break
                 
-                # Wait before next update
-                print(f"⏳ Waiting {interval_seconds}s before next sip...")
-                time.sleep(interval_seconds)
-                
-                # Simulate drinking
-                if not self.simulate_drinking():
-                    break
+                # Sample again sooner while drinking, less often when the bottle sits still
+                time.sleep(self.reporting.next_interval(now))
                     
         except KeyboardInterrupt:
             print("\n⏹️  Simulation stopped by user")
             print(f"📊 Final stats: {self.total_water_drank}ml/{self.daily_goal}ml")
+            self.print_reporting_stats(time.monotonic() - started)
         except Exception as e:
             print(f"❌ Simulation error: {e}")
 